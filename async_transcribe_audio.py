@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+异步版音频文件下载和转录脚本
+使用asyncio驱动大量并发通话，下载使用异步HTTP客户端，boto3调用在线程池中执行
+输出文件、映射记录和跳过规则与ImprovedAudioTranscriber一致
+"""
+
+import asyncio
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import aiohttp
+import boto3
+from dotenv import load_dotenv
+
+from improved_transcribe_audio import ImprovedAudioTranscriber
+from http_client import (DOWNLOAD_CHUNK_SIZE, DOWNLOAD_RESUME_ATTEMPTS, get_part_paths, load_resume_state,
+                         resume_headers, parse_download_response, save_resume_state, commit_download)
+
+# 加载环境变量
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class AsyncAudioTranscriber:
+    def __init__(self, aws_region='us-east-1', executor_workers=32):
+        """
+        初始化异步转录器
+
+        Args:
+            aws_region: AWS区域，默认为us-east-1
+            executor_workers: 执行boto3调用和文件保存的线程池大小
+        """
+        # 复用同步转录器的文件命名、映射记录、保存和AWS客户端
+        self.transcriber = ImprovedAudioTranscriber(aws_region=aws_region)
+        self.audio_dir = self.transcriber.audio_dir
+        self.audio_cache = self.transcriber.audio_cache
+        self.transcripts_dir = self.transcriber.transcripts_dir
+        self.mapping_file = self.transcriber.mapping_file
+
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers)
+        self.session = None
+        self.no_local_cache = False
+        
+        # 按缓存文件名区分的下载锁（CSV中可能有重复的URL）
+        self.download_locks = {}
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """在线程池中执行阻塞调用，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    def download_lock(self, filename):
+        """
+        获取指定缓存文件的下载锁（只在事件循环中使用，不需要额外加锁）
+        
+        Args:
+            filename: 缓存文件名
+            
+        Returns:
+            asyncio.Lock: 该文件对应的锁
+        """
+        if filename not in self.download_locks:
+            self.download_locks[filename] = asyncio.Lock()
+        return self.download_locks[filename]
+    
+    async def download_audio_file(self, url, filename=None, pin=False):
+        """
+        异步下载音频文件，如果已缓存则直接使用缓存
+
+        Args:
+            url: 音频文件URL
+            filename: 下载时使用的临时文件名，如果为None则根据URL生成
+            pin: 是否固定缓存文件，固定期间不会被缓存淘汰，用完后调用 audio_cache.unpin 释放
+
+        Returns:
+            str: 本地缓存文件路径，如果下载失败返回None
+        """
+        try:
+            # 查询缓存清单，不需要探测文件系统（SQLite查询在线程池中执行）
+            cached_path = await self.run_blocking(self.audio_cache.lookup, url, pin=pin)
+            if cached_path:
+                logger.info(f"使用缓存文件: {cached_path}")
+                return str(cached_path)
+
+            # 如果没有指定文件名，则根据URL生成临时文件名
+            if filename is None:
+                filename = self.transcriber.get_cached_filename(url)
+
+            file_path = self.audio_dir / filename
+
+            # 同一文件同时只允许一个协程下载，避免同时写入同一个临时文件
+            async with self.download_lock(filename):
+                # 等待锁期间可能已被其他协程下载完成
+                cached_path = await self.run_blocking(self.audio_cache.lookup, url, pin=pin)
+                if cached_path:
+                    logger.info(f"使用缓存文件: {cached_path}")
+                    return str(cached_path)
+
+                # 总是重新下载，路径上残留的旧版按URL命名的文件会被覆盖（需要保留时先运行 manage_cache.py migrate）
+                logger.info(f"正在下载: {url}")
+                await self.download_to_file(url, file_path)
+
+                # 按内容哈希存入缓存（计算哈希在线程池中执行），相同内容的音频只保存一份
+                cached_path = await self.run_blocking(self.audio_cache.add, url, file_path, pin=pin)
+
+            file_size = await self.run_blocking(os.path.getsize, cached_path)
+            logger.info(f"下载完成: {cached_path} (大小: {file_size} 字节)")
+            return str(cached_path)
+
+        except Exception as e:
+            logger.error(f"下载失败 {url}: {str(e)}")
+            return None
+
+    async def download_to_file(self, url, file_path):
+        """
+        先下载到临时文件，中断后可续传，校验通过后原子重命名为缓存文件
+        文件读写和校验都在线程池中执行，不阻塞事件循环
+
+        Args:
+            url: 音频文件URL
+            file_path: 目标文件路径
+
+        Returns:
+            int: 文件大小（字节）
+        """
+        part_path, meta_path = get_part_paths(file_path)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+        for attempt in range(DOWNLOAD_RESUME_ATTEMPTS):
+            last_attempt = attempt + 1 >= DOWNLOAD_RESUME_ATTEMPTS
+            offset, validator = await self.run_blocking(load_resume_state, part_path, meta_path)
+            try:
+                async with self.session.get(url, timeout=timeout,
+                                            headers=resume_headers(offset, validator)) as response:
+                    response.raise_for_status()
+                    mode, total = parse_download_response(response.status, response.headers, offset)
+                    await self.run_blocking(save_resume_state, meta_path, url, response.headers, total)
+
+                    f = await self.run_blocking(open, part_path, mode)
+                    try:
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            await self.run_blocking(f.write, chunk)
+                    finally:
+                        await self.run_blocking(f.close)
+            except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+                continue
+
+            if total is not None and not last_attempt and await self.run_blocking(os.path.getsize, part_path) < total:
+                continue
+            break
+
+        # 校验时计算整个文件的MD5
+        return await self.run_blocking(commit_download, part_path, meta_path, file_path, total)
+
+    async def upload_to_s3(self, local_file_path, bucket_name, s3_key):
+        """上传文件到S3（在线程池中执行）"""
+        return await self.run_blocking(self.transcriber.upload_to_s3, local_file_path, bucket_name, s3_key)
+
+    async def start_transcription_job(self, job_name, s3_uri):
+        """启动AWS Transcribe转录任务（在线程池中执行）"""
+        return await self.run_blocking(self.transcriber.start_transcription_job, job_name, s3_uri)
+
+    async def wait_for_transcription_completion(self, job_name, max_wait_time=1800, expected_duration=None,
+                                                check_now=False):
+        """
+        等待转录任务完成
+
+        任务由共享的任务跟踪器统一轮询，这里只等待跟踪器的回调，不占用线程
+
+        Args:
+            job_name: 转录任务名称
+            max_wait_time: 最大等待时间（秒），默认30分钟
+            expected_duration: 音频时长（秒），用于规划轮询时间
+            check_now: 为True时立即检查一次（重新关联上次运行提交的任务）
+
+        Returns:
+            dict: 转录结果，如果失败返回None
+        """
+        logger.info(f"等待转录任务完成: {job_name}")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def on_finished(name, job):
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(job))
+
+        self.transcriber.job_tracker.track(
+            job_name,
+            callback=on_finished,
+            max_wait_time=max_wait_time,
+            expected_duration=expected_duration,
+            check_now=check_now
+        )
+        job = await future
+        if job is None:
+            return None
+
+        if job['TranscriptionJobStatus'] == 'COMPLETED':
+            logger.info(f"转录任务完成: {job_name}")
+            return job
+
+        logger.error(f"转录任务失败: {job_name}")
+        return None
+
+    async def journal(self, csv_row_index, audio_url, state, **fields):
+        """把记录的状态变化写入作业日志（在线程池中执行）"""
+        await self.run_blocking(self.transcriber.job_journal.record, csv_row_index, audio_url, state, **fields)
+
+    async def download_transcript(self, transcript_uri):
+        """
+        异步下载转录结果
+
+        Args:
+            transcript_uri: 转录结果URI
+
+        Returns:
+            dict: 转录结果JSON（流式解析时为SpooledTranscript），如果失败返回None
+        """
+        try:
+            # 自有存储桶中的结果通过S3客户端读取，流式解析时写入临时文件（在线程池中执行）
+            store = self.transcriber.transcript_store
+            if (store and store.owns(transcript_uri)) or self.transcriber.stream_parse:
+                return await self.run_blocking(self.transcriber.download_transcript, transcript_uri)
+
+            logger.info(f"下载转录结果: {transcript_uri}")
+
+            async with self.session.get(transcript_uri) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+        except Exception as e:
+            logger.error(f"下载转录结果失败: {str(e)}")
+            return None
+
+    @staticmethod
+    def outputs_exist(json_output_file, txt_output_file):
+        """JSON和TXT输出文件是否都已存在"""
+        return json_output_file.exists() and txt_output_file.exists()
+
+    async def process_row(self, position, original_index, row, s3_bucket, s3_folder_prefix, audio_column, stats):
+        """
+        处理单条记录，流程与ImprovedAudioTranscriber.process_csv_file一致
+
+        Returns:
+            None，结果计入stats
+        """
+        local_file_path = None
+        try:
+            audio_url = row[audio_column]
+            logger.info(f"处理第 {position} 个文件 (CSV行号: {original_index}): {audio_url}")
+
+            # 生成输出文件名和映射信息
+            json_filename, txt_filename, mapping_info = self.transcriber.generate_output_filename(row, original_index)
+
+            # 检查是否已经处理过
+            json_output_file = self.transcripts_dir / json_filename
+            txt_output_file = self.transcripts_dir / txt_filename
+
+            if await self.run_blocking(self.outputs_exist, json_output_file, txt_output_file):
+                logger.info(f"文件已存在，跳过处理: {json_filename}")
+                stats['skip'] += 1
+                return
+
+            # 按作业日志恢复上次运行的进度：已上传的音频直接使用，已提交的任务重新关联
+            journal = self.transcriber.job_journal
+            journal_entry = await self.run_blocking(journal.get, original_index, audio_url)
+            s3_uri = journal.uploaded_uri(journal_entry, s3_bucket)
+            resumed_job = journal.resumable_job(journal_entry)
+            if s3_uri:
+                logger.info(f"作业日志中已记录上传，跳过下载和上传: {s3_uri}")
+            else:
+                if self.no_local_cache:
+                    # 不经过本地磁盘，从源地址直接流式上传到S3（在线程池中执行）
+                    s3_uri = await self.run_blocking(self.transcriber.stream_audio_to_s3,
+                                                     audio_url, s3_bucket, s3_folder_prefix)
+                else:
+                    # 下载音频文件（使用缓存，处理完成前固定，不会被缓存淘汰）
+                    local_file_path = await self.download_audio_file(audio_url, pin=True)
+                    if not local_file_path:
+                        logger.warning(f"跳过CSV行号 {original_index}：下载失败")
+                        stats['error'] += 1
+                        return
+                    await self.journal(original_index, audio_url, 'downloaded', local_file_path=local_file_path)
+
+                    # 上传到S3（使用指定的文件夹前缀）
+                    s3_key = self.transcriber.get_s3_key(local_file_path, s3_folder_prefix)
+                    s3_uri = await self.upload_to_s3(local_file_path, s3_bucket, s3_key)
+                if not s3_uri:
+                    logger.warning(f"跳过CSV行号 {original_index}：S3上传失败")
+                    stats['error'] += 1
+                    return
+                await self.journal(original_index, audio_url, 'uploaded', s3_uri=s3_uri)
+
+            # 相同音频和任务设置已转录过时直接使用缓存的结果，不启动转录任务
+            transcript_data = None
+            if not resumed_job:
+                transcript_data = await self.run_blocking(self.transcriber.get_cached_result, s3_uri)
+            if transcript_data is None:
+                job_name = resumed_job
+                if job_name:
+                    logger.info(f"重新关联上次运行提交的转录任务: {job_name}")
+                else:
+                    # 启动转录任务（使用原始行号）
+                    job_name = f"transcribe-job-{original_index}-{int(time.time())}"
+                    if not await self.start_transcription_job(job_name, s3_uri):
+                        logger.warning(f"跳过CSV行号 {original_index}：转录任务启动失败")
+                        stats['error'] += 1
+                        return
+                    await self.journal(original_index, audio_url, 'submitted', job_name=job_name)
+
+                # 等待转录完成（按音频时长规划轮询，重新关联的任务立即检查）
+                expected_duration = await self.run_blocking(self.transcriber.estimate_audio_duration,
+                                                            row.get('call_seconds'), local_file_path)
+                job_result = await self.wait_for_transcription_completion(job_name, expected_duration=expected_duration,
+                                                                          check_now=job_name == resumed_job)
+                if not job_result:
+                    await self.journal(original_index, audio_url, 'failed', job_name=job_name)
+                    logger.warning(f"跳过CSV行号 {original_index}：转录任务失败")
+                    stats['error'] += 1
+                    return
+                await self.journal(original_index, audio_url, 'completed', job_name=job_name)
+
+                # 下载转录结果
+                transcript_uri = job_result['Transcript']['TranscriptFileUri']
+                transcript_data = await self.download_transcript(transcript_uri)
+                if not transcript_data:
+                    logger.warning(f"跳过CSV行号 {original_index}：转录结果下载失败")
+                    stats['error'] += 1
+                    return
+                await self.run_blocking(self.transcriber.cache_result, s3_uri, transcript_data, job_name)
+
+            # 保存转录结果（文件写入和映射更新在线程池中执行）
+            saved = await self.run_blocking(self.transcriber.save_transcript, transcript_data,
+                                            json_output_file, txt_output_file, mapping_info)
+            if not saved:
+                # 保存失败时不记录persisted，下次运行重新保存
+                logger.warning(f"跳过CSV行号 {original_index}：转录结果保存失败")
+                stats['error'] += 1
+                return
+            await self.journal(original_index, audio_url, 'persisted')
+
+            stats['success'] += 1
+            logger.info(f"CSV行号 {original_index} 处理完成，输出文件: {json_filename}, {txt_filename}")
+
+            # 每处理10个文件输出一次进度
+            if stats['success'] % 10 == 0:
+                logger.info(f"进度报告: 成功 {stats['success']}, 跳过 {stats['skip']}, 失败 {stats['error']}")
+
+        except Exception as e:
+            logger.error(f"处理CSV行号 {original_index} 时出错: {str(e)}")
+            stats['error'] += 1
+        finally:
+            if local_file_path:
+                await self.run_blocking(self.audio_cache.unpin, local_file_path)
+
+    async def process_csv_file(self, csv_file, s3_bucket, s3_folder_prefix='', audio_column='通话录音',
+                               limit=None, start_from=0, concurrency=100, max_cache_bytes=None,
+                               no_local_cache=False, s3_output=False, stream_csv=False):
+        """
+        异步处理CSV文件中的音频URL
+
+        Args:
+            csv_file: CSV文件路径
+            s3_bucket: S3存储桶名称
+            s3_folder_prefix: S3文件夹前缀，例如 'my-project/audio-transcripts/'
+            audio_column: 音频URL列名，默认为'通话录音'
+            limit: 处理的最大行数，None表示处理所有行
+            start_from: 从第几条记录开始处理，用于断点续传
+            concurrency: 同时处理的记录数上限
+            max_cache_bytes: 音频缓存容量上限（字节），超过时淘汰最久未访问的文件，None表示不限制
+            no_local_cache: 为True时不下载到本地，音频从源地址直接流式上传到S3
+            s3_output: 为True时转录结果写入S3_BUCKET中S3文件夹前缀下，并先取回已完成的结果
+            stream_csv: 为True时流式读取CSV（不批量取回已完成的结果）
+        """
+        try:
+            valid_urls, rows = self.transcriber.open_rows(csv_file, audio_column, limit, start_from, stream_csv)
+            if rows is None:
+                return
+
+            self.transcriber.apply_cache_limit(max_cache_bytes)
+            self.no_local_cache = no_local_cache
+            if s3_output:
+                await self.run_blocking(self.transcriber.enable_s3_output, s3_bucket, s3_folder_prefix)
+                if valid_urls is not None:
+                    await self.run_blocking(self.transcriber.harvest_completed_rows, valid_urls, audio_column)
+
+            stats = {'success': 0, 'skip': 0, 'error': 0}
+            # 所有协程共享同一个记录迭代器，按需取下一条记录（流式读取时不会提前读完整个文件）
+            positioned_rows = enumerate(rows, start_from + 1)
+
+            async def worker():
+                for position, (original_index, row) in positioned_rows:
+                    await self.process_row(position, original_index, row, s3_bucket,
+                                           s3_folder_prefix, audio_column, stats)
+
+            connector = aiohttp.TCPConnector(limit=concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                self.session = session
+                await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+            self.session = None
+
+            logger.info(f"所有文件处理完成")
+            logger.info(f"最终统计: 成功 {stats['success']}, 跳过 {stats['skip']}, 失败 {stats['error']}")
+            await self.run_blocking(self.transcriber.save_mapping)
+            logger.info(f"文件映射信息已保存到: {self.mapping_file}")
+
+        except Exception as e:
+            logger.error(f"处理CSV文件失败: {str(e)}")
+        finally:
+            # 等待后台上传完成并关闭S3传输管理器的线程
+            await self.run_blocking(self.transcriber.s3_uploader.shutdown)
+
+    def generate_mapping_report(self):
+        """生成映射关系报告"""
+        self.transcriber.generate_mapping_report()
+
+
+def main():
+    """
+    主函数
+    """
+    # 从环境变量读取配置参数
+    CSV_FILE = os.getenv('CSV_FILE', 'call.csv')
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_FOLDER_PREFIX = os.getenv('S3_FOLDER_PREFIX', '')
+    AWS_REGION = os.getenv('AWS_REGION', 'us-east-1')
+    LIMIT = int(os.getenv('LIMIT', '0')) if os.getenv('LIMIT') else None
+    START_FROM = int(os.getenv('START_FROM', '0')) if os.getenv('START_FROM') else 0
+    CONCURRENCY = int(os.getenv('ASYNC_CONCURRENCY', '100'))
+    MAX_CACHE_BYTES = int(float(os.getenv('CACHE_MAX_GB')) * 1024 ** 3) if os.getenv('CACHE_MAX_GB') else None
+    NO_LOCAL_CACHE = os.getenv('NO_LOCAL_CACHE', 'false').lower() == 'true'
+    TRANSCRIPT_OUTPUT_TO_S3 = os.getenv('TRANSCRIPT_OUTPUT_TO_S3', 'false').lower() == 'true'
+    STREAM_CSV = os.getenv('STREAM_CSV', 'false').lower() == 'true'
+
+    # 验证必需的配置
+    if not S3_BUCKET:
+        logger.error("S3_BUCKET 环境变量未设置，请检查.env文件")
+        return
+
+    logger.info(f"配置信息:")
+    logger.info(f"  CSV文件: {CSV_FILE}")
+    logger.info(f"  S3桶: {S3_BUCKET}")
+    logger.info(f"  S3文件夹前缀: {S3_FOLDER_PREFIX}")
+    logger.info(f"  AWS区域: {AWS_REGION}")
+    logger.info(f"  处理限制: {LIMIT if LIMIT else '无限制'}")
+    logger.info(f"  并发数: {CONCURRENCY}")
+    logger.info(f"  流式读取CSV: {'开启' if STREAM_CSV else '关闭'}")
+
+    # 检查AWS凭证
+    try:
+        boto3.Session().get_credentials()
+        logger.info("AWS凭证验证成功")
+    except Exception as e:
+        logger.error(f"AWS凭证验证失败: {str(e)}")
+        logger.error("请确保已配置AWS凭证（通过AWS CLI、环境变量或IAM角色）")
+        return
+
+    # 检查CSV文件是否存在
+    if not os.path.exists(CSV_FILE):
+        logger.error(f"CSV文件不存在: {CSV_FILE}")
+        return
+
+    # 创建异步转录器实例
+    transcriber = AsyncAudioTranscriber(aws_region=AWS_REGION)
+
+    # 处理CSV文件
+    asyncio.run(transcriber.process_csv_file(
+        csv_file=CSV_FILE,
+        s3_bucket=S3_BUCKET,
+        s3_folder_prefix=S3_FOLDER_PREFIX,
+        limit=LIMIT,
+        start_from=START_FROM,
+        concurrency=CONCURRENCY,
+        max_cache_bytes=MAX_CACHE_BYTES,
+        no_local_cache=NO_LOCAL_CACHE,
+        s3_output=TRANSCRIPT_OUTPUT_TO_S3,
+        stream_csv=STREAM_CSV
+    ))
+
+    # 生成映射关系报告
+    transcriber.generate_mapping_report()
+
+
+if __name__ == "__main__":
+    main()
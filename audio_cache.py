@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+内容寻址的音频缓存
+音频按SHA-256保存在 downloaded_audio/blobs/<前两位>/<哈希>.<扩展名>，
+SQLite清单记录 URL -> 哈希 以及每个文件的大小、写入时间、最近访问时间和S3对象键，
+查找缓存只需查询清单，相同内容的音频只保存一份；
+设置了容量上限时按最近访问时间淘汰（LRU），正在使用的文件被固定，不会被淘汰；
+固定记录同时写入清单（进程号和过期时间），其他进程（例如 manage_cache.py evict）淘汰或删除时同样跳过
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 计算哈希时每次读取的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 清单中固定记录的有效期（秒），进程异常退出或进程号被复用时由此兜底
+PIN_TTL = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    last_access REAL NOT NULL,
+    s3_key TEXT
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_urls_digest ON urls (digest);
+CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs (last_access);
+CREATE TABLE IF NOT EXISTS uploads (
+    bucket TEXT NOT NULL,
+    s3_key TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (bucket, s3_key)
+);
+CREATE TABLE IF NOT EXISTS pins (
+    digest TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (digest, pid)
+);
+"""
+
+
+def file_sha256(file_path, chunk_size=HASH_CHUNK_SIZE):
+    """计算文件的SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def pid_alive(pid):
+    """判断进程是否仍在运行"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class AudioCache:
+    def __init__(self, root, max_bytes=None):
+        """
+        初始化缓存
+
+        Args:
+            root: 缓存根目录（downloaded_audio）
+            max_bytes: 缓存容量上限（字节），None表示不限制；超过时每次写入新文件后淘汰最久未访问的文件
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        # 本进程固定的文件: 哈希 -> 引用计数（清单中每个哈希只记录一行）
+        self.pins = {}
+        self.pid = os.getpid()
+        self.blob_dir = self.root / 'blobs'
+        self.manifest_path = self.root / 'manifest.db'
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+
+        # 所有线程共享一个连接，由锁串行化
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.manifest_path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def blob_path(self, digest, ext):
+        """返回哈希对应的文件路径"""
+        return self.blob_dir / digest[:2] / f"{digest}{ext}"
+
+    def digest_of(self, file_path):
+        """
+        从缓存文件路径取得哈希
+
+        Returns:
+            str: 哈希，不是缓存中的文件时返回None
+        """
+        file_path = Path(file_path)
+        if file_path.parent.parent != self.blob_dir:
+            return None
+        return file_path.stem
+
+    def lookup(self, url, touch=True, pin=False):
+        """
+        按URL查找缓存文件
+
+        Args:
+            url: 音频文件URL
+            touch: 是否更新最近访问时间
+            pin: 是否固定找到的文件，固定后需调用unpin释放
+
+        Returns:
+            Path: 缓存文件路径，未缓存时返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT b.digest, b.ext FROM urls u JOIN blobs b ON b.digest = u.digest WHERE u.url = ?',
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            file_path = self.blob_path(row['digest'], row['ext'])
+            if not file_path.exists():
+                # 文件已被外部删除，清单同步移除
+                logger.warning(f"缓存文件缺失，从清单中移除: {file_path}")
+                self.delete_rows(row['digest'])
+                self.conn.commit()
+                return None
+            if touch:
+                self.conn.execute('UPDATE blobs SET last_access = ? WHERE digest = ?',
+                                  (time.time(), row['digest']))
+                self.conn.commit()
+            if pin:
+                self.add_pin(row['digest'])
+                self.conn.commit()
+            return file_path
+
+    def contains(self, url):
+        """判断URL是否已缓存（不更新访问时间）"""
+        return self.lookup(url, touch=False) is not None
+
+    def add(self, url, src_path, pin=False):
+        """
+        把下载好的文件按内容哈希存入缓存，超过容量上限时淘汰最久未访问的文件
+
+        Args:
+            url: 音频文件URL，None表示来源未知（迁移的旧缓存文件）
+            src_path: 已下载的完整文件，存入后该文件被移走或删除
+            pin: 是否固定存入的文件，固定后需调用unpin释放
+
+        Returns:
+            Path: 缓存文件路径
+        """
+        src_path = Path(src_path)
+        digest = file_sha256(src_path)
+        ext = src_path.suffix or '.mp3'
+        now = time.time()
+
+        with self.lock:
+            row = self.conn.execute('SELECT ext FROM blobs WHERE digest = ?', (digest,)).fetchone()
+            if row is not None and self.blob_path(digest, row['ext']).exists():
+                # 相同内容已缓存，丢弃重复文件
+                file_path = self.blob_path(digest, row['ext'])
+                src_path.unlink()
+                logger.info(f"内容已缓存，删除重复文件: {src_path.name} -> {file_path.name}")
+                self.conn.execute('UPDATE blobs SET last_access = ? WHERE digest = ?', (now, digest))
+            else:
+                file_path = self.blob_path(digest, ext)
+                file_path.parent.mkdir(exist_ok=True)
+                os.replace(src_path, file_path)
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO blobs (digest, ext, size, mtime, last_access, s3_key) '
+                    'VALUES (?, ?, ?, ?, ?, NULL)',
+                    (digest, ext, file_path.stat().st_size, now, now)
+                )
+            if url:
+                self.conn.execute('INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)', (url, digest))
+            if pin:
+                self.add_pin(digest)
+            self.conn.commit()
+
+        if self.max_bytes is not None:
+            self.evict(keep={digest})
+        return file_path
+
+    def add_pin(self, digest):
+        """增加一次固定，第一次固定时写入清单（调用方需持有锁并提交）"""
+        count = self.pins.get(digest, 0)
+        self.pins[digest] = count + 1
+        if count == 0:
+            self.conn.execute('INSERT OR REPLACE INTO pins (digest, pid, expires_at) VALUES (?, ?, ?)',
+                              (digest, self.pid, time.time() + PIN_TTL))
+
+    def pin(self, file_path):
+        """固定缓存文件，固定期间不会被淘汰"""
+        digest = self.digest_of(file_path)
+        if digest is None:
+            return
+        with self.lock:
+            self.add_pin(digest)
+            self.conn.commit()
+
+    def unpin(self, file_path):
+        """释放一次固定"""
+        digest = self.digest_of(file_path)
+        if digest is None:
+            return
+        with self.lock:
+            count = self.pins.get(digest, 0) - 1
+            if count > 0:
+                self.pins[digest] = count
+            else:
+                self.pins.pop(digest, None)
+                self.conn.execute('DELETE FROM pins WHERE digest = ? AND pid = ?', (digest, self.pid))
+                self.conn.commit()
+
+    def pinned_digests(self):
+        """
+        返回所有进程固定的哈希，同时清理已退出进程和已过期的固定记录（调用方需持有锁）
+
+        Returns:
+            set: 被固定的哈希
+        """
+        pinned = set(self.pins)
+        now = time.time()
+        stale = []
+        for row in self.conn.execute('SELECT digest, pid, expires_at FROM pins').fetchall():
+            if row['pid'] == self.pid:
+                continue
+            if row['expires_at'] > now and pid_alive(row['pid']):
+                pinned.add(row['digest'])
+            else:
+                stale.append((row['digest'], row['pid']))
+        if stale:
+            self.conn.executemany('DELETE FROM pins WHERE digest = ? AND pid = ?', stale)
+        return pinned
+
+    def evict(self, max_bytes=None, keep=()):
+        """
+        按最近访问时间淘汰缓存文件，直到总大小不超过上限
+
+        Args:
+            max_bytes: 容量上限（字节），默认使用self.max_bytes
+            keep: 本次不淘汰的哈希集合
+
+        Returns:
+            dict: evicted（淘汰的文件数）, freed_bytes（释放的字节数）, total_bytes（淘汰后的总大小）
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        evicted = 0
+        freed_bytes = 0
+        with self.lock:
+            total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            if max_bytes is not None and total_bytes > max_bytes:
+                rows = self.conn.execute(
+                    'SELECT digest, ext, size FROM blobs ORDER BY last_access ASC').fetchall()
+                pinned = self.pinned_digests()
+                for row in rows:
+                    if total_bytes <= max_bytes:
+                        break
+                    if row['digest'] in pinned or row['digest'] in keep:
+                        continue
+                    self.blob_path(row['digest'], row['ext']).unlink(missing_ok=True)
+                    self.delete_rows(row['digest'])
+                    total_bytes -= row['size']
+                    freed_bytes += row['size']
+                    evicted += 1
+                self.conn.commit()
+        if evicted:
+            logger.info(f"缓存淘汰: 删除 {evicted} 个最久未访问的文件，释放 {freed_bytes / 1024 / 1024:.2f} MB，"
+                        f"当前 {total_bytes / 1024 / 1024:.2f} MB")
+        return {'evicted': evicted, 'freed_bytes': freed_bytes, 'total_bytes': total_bytes}
+
+    def get_s3_key(self, file_path):
+        """返回缓存文件已上传的S3对象键，未记录时返回None"""
+        digest = self.digest_of(file_path)
+        if digest is None:
+            return None
+        with self.lock:
+            row = self.conn.execute('SELECT s3_key FROM blobs WHERE digest = ?', (digest,)).fetchone()
+        return row['s3_key'] if row else None
+
+    def set_s3_key(self, file_path, s3_key):
+        """记录缓存文件已上传的S3对象键"""
+        digest = self.digest_of(file_path)
+        if digest is None:
+            return
+        with self.lock:
+            self.conn.execute('UPDATE blobs SET s3_key = ? WHERE digest = ?', (s3_key, digest))
+            self.conn.commit()
+
+    def is_uploaded(self, digest, bucket, s3_key, size=None):
+        """
+        查询清单中是否记录过相同内容上传到该对象
+
+        Args:
+            size: 文件大小，None表示不比较大小
+
+        Returns:
+            bool: 已记录且哈希和大小一致
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT digest, size FROM uploads WHERE bucket = ? AND s3_key = ?',
+                                    (bucket, s3_key)).fetchone()
+        return row is not None and row['digest'] == digest and (size is None or row['size'] == size)
+
+    def url_digest(self, url):
+        """返回清单中URL对应的内容哈希（不要求本地有文件），未知时返回None"""
+        with self.lock:
+            row = self.conn.execute('SELECT digest FROM urls WHERE url = ?', (url,)).fetchone()
+        return row['digest'] if row else None
+
+    def record_remote(self, url, digest, bucket, s3_key, size):
+        """记录直接流式上传到S3、本地没有缓存文件的音频"""
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)', (url, digest))
+            self.conn.commit()
+        self.record_upload(digest, bucket, s3_key, size)
+
+    def record_upload(self, digest, bucket, s3_key, size):
+        """记录文件已上传（或确认已存在）到S3"""
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO uploads (bucket, s3_key, digest, size, uploaded_at) VALUES (?, ?, ?, ?, ?)',
+                (bucket, s3_key, digest, size, time.time())
+            )
+            self.conn.execute('UPDATE blobs SET s3_key = ? WHERE digest = ?', (s3_key, digest))
+            self.conn.commit()
+
+    def delete_rows(self, digest):
+        """删除哈希对应的清单记录（调用方需持有锁）"""
+        self.conn.execute('DELETE FROM urls WHERE digest = ?', (digest,))
+        self.conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+
+    def remove(self, digest):
+        """
+        删除一个缓存文件及其清单记录，被任一进程固定的文件不删除
+
+        Returns:
+            int: 释放的字节数
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT ext, size FROM blobs WHERE digest = ?', (digest,)).fetchone()
+            if row is None:
+                return 0
+            if digest in self.pinned_digests():
+                self.conn.commit()
+                logger.info(f"缓存文件正在使用，跳过删除: {digest}{row['ext']}")
+                return 0
+            self.blob_path(digest, row['ext']).unlink(missing_ok=True)
+            self.delete_rows(digest)
+            self.conn.commit()
+            return row['size']
+
+    def entries(self):
+        """
+        列出所有缓存文件
+
+        Returns:
+            list: 每个文件的 digest, ext, size, mtime, last_access, s3_key
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT * FROM blobs').fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        """
+        从清单统计缓存使用情况（不访问文件系统）
+
+        Returns:
+            dict: file_count, total_bytes, url_count
+        """
+        with self.lock:
+            file_count, total_bytes = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs').fetchone()
+            url_count = self.conn.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+        return {'file_count': file_count, 'total_bytes': total_bytes, 'url_count': url_count}
+
+    def migrate_legacy(self, name_to_url=None):
+        """
+        把旧版按URL哈希命名、直接放在缓存根目录下的文件迁入内容寻址存储
+
+        Args:
+            name_to_url: {旧缓存文件名: URL}，用于恢复URL索引；找不到URL的文件只按内容保存
+
+        Returns:
+            int: 迁移的文件数
+        """
+        name_to_url = name_to_url or {}
+        migrated = 0
+        for file_path in self.root.iterdir():
+            if not file_path.is_file() or file_path.name.startswith(self.manifest_path.name):
+                continue
+            if file_path.name.endswith(('.part', '.part.json')):
+                continue
+            if file_path.stat().st_size == 0:
+                file_path.unlink()
+                continue
+            try:
+                self.add(name_to_url.get(file_path.name), file_path)
+                migrated += 1
+            except Exception as e:
+                logger.warning(f"迁移缓存文件失败 {file_path}: {str(e)}")
+        if migrated:
+            logger.info(f"已将 {migrated} 个旧缓存文件迁移到内容寻址存储")
+        return migrated
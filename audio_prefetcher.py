@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+音频预取脚本
+在转录流程之前并发下载call.csv中的音频到downloaded_audio缓存，
+可以单独运行，也可以作为process_csv_file的一个阶段在处理游标之前运行
+"""
+
+import os
+import sys
+import threading
+import logging
+import pandas as pd
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+
+def load_audio_urls(csv_file, audio_column='通话录音', limit=None, start_from=0):
+    """
+    读取CSV中待处理的音频URL（与process_csv_file的筛选规则一致）
+
+    Args:
+        csv_file: CSV文件路径
+        audio_column: 音频URL列名
+        limit: 最大数量，None表示全部
+        start_from: 从第几条有效记录开始
+
+    Returns:
+        list: 音频URL列表
+    """
+    df = pd.read_csv(csv_file, usecols=[audio_column])
+    urls = df[df[audio_column].notna() & (df[audio_column] != '')][audio_column]
+    if start_from > 0:
+        urls = urls.iloc[start_from:]
+    if limit:
+        urls = urls.head(limit)
+    return urls.tolist()
+
+
+class AudioPrefetcher:
+    def __init__(self, transcriber, workers=8, max_bytes=2 * 1024 ** 3, lookahead=200):
+        """
+        初始化预取器
+
+        Args:
+            transcriber: AudioTranscriber或ImprovedAudioTranscriber实例
+            workers: 并发下载线程数
+            max_bytes: 磁盘预算，已预取但尚未被处理的文件总大小上限
+            lookahead: 最多领先处理游标的记录数，None表示不限制
+        """
+        self.transcriber = transcriber
+        self.workers = max(1, workers)
+        self.max_bytes = max_bytes
+        self.lookahead = lookahead
+
+        self.urls = []
+        self.next_index = 0
+        self.cursor = 0
+        # 已预取但尚未被处理的文件: 位置 -> 大小
+        self.pending = {}
+        self.pending_bytes = 0
+        # 为处理流程固定的缓存文件: 位置 -> 路径，处理游标越过后释放，避免在使用前被缓存淘汰
+        self.pinned = {}
+        self.pin_files = True
+        # 为False时处理流程乱序取用（流水线），只在 taken 时释放固定
+        self.release_on_advance = True
+        self.taken_positions = set()
+        self.stopped = False
+        self.standalone = False
+        self.cond = threading.Condition()
+        self.threads = []
+
+        self.downloaded_count = 0
+        self.cached_count = 0
+        self.failed_count = 0
+
+    def can_fetch(self):
+        """判断是否可以领取下一个文件（调用方需持有锁）"""
+        if self.lookahead is not None and self.next_index >= self.cursor + self.lookahead:
+            return False
+        if self.max_bytes is not None and self.pending_bytes >= self.max_bytes:
+            return False
+        return True
+
+    def worker(self):
+        """下载线程：按顺序领取URL，缓存清单中不存在时下载"""
+        while True:
+            with self.cond:
+                while not self.stopped and self.next_index < len(self.urls) and not self.can_fetch():
+                    if self.standalone:
+                        # 单独运行时没有处理游标推进，达到预算即结束
+                        return
+                    self.cond.wait()
+                if self.stopped or self.next_index >= len(self.urls):
+                    return
+                index = self.next_index
+                self.next_index += 1
+
+            url = self.urls[index]
+            if url is None:
+                # 处理流程会跳过的记录（已有输出文件或音频已上传）
+                continue
+            cached_path = self.transcriber.audio_cache.lookup(url, touch=False, pin=self.pin_files)
+            if cached_path:
+                with self.cond:
+                    self.cached_count += 1
+                    self.keep_pinned(index, cached_path)
+                continue
+
+            local_file_path = self.transcriber.download_audio_file(url, pin=self.pin_files)
+            with self.cond:
+                if not local_file_path:
+                    self.failed_count += 1
+                    continue
+                self.downloaded_count += 1
+                if index >= self.cursor:
+                    size = os.path.getsize(local_file_path)
+                    self.pending[index] = size
+                    self.pending_bytes += size
+                self.keep_pinned(index, local_file_path)
+
+    def keep_pinned(self, index, file_path):
+        """记录为处理流程固定的文件，处理游标已越过时立即释放（调用方需持有锁）"""
+        if not self.pin_files:
+            return
+        if index in self.taken_positions or (self.release_on_advance and index < self.cursor):
+            self.taken_positions.discard(index)
+            self.transcriber.audio_cache.unpin(file_path)
+        else:
+            self.pinned[index] = file_path
+
+    def release_pins(self, position=None):
+        """释放位置小于position的固定文件，None表示全部释放（调用方需持有锁）"""
+        for index in [i for i in self.pinned if position is None or i < position]:
+            self.transcriber.audio_cache.unpin(self.pinned.pop(index))
+
+    def start(self, urls):
+        """
+        在后台开始预取
+
+        Args:
+            urls: 按处理顺序排列的音频URL列表，处理流程会跳过的位置为None
+        """
+        self.urls = list(urls)
+        # 单独运行时没有处理流程取用，不固定文件
+        self.pin_files = not self.standalone
+        for n in range(self.workers):
+            thread = threading.Thread(target=self.worker, name=f"prefetch-{n}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"音频预取已启动: {len(self.urls)} 个URL, {self.workers} 个线程")
+
+    def advance(self, position):
+        """
+        处理游标前进，释放已被处理文件占用的预算
+
+        Args:
+            position: 下一个待处理记录的位置（从0开始）
+        """
+        with self.cond:
+            if position <= self.cursor:
+                return
+            self.cursor = position
+            for index in [i for i in self.pending if i < position]:
+                self.pending_bytes -= self.pending.pop(index)
+            # 处理流程取用时已自行固定，预取的固定可以释放
+            if self.release_on_advance:
+                self.release_pins(position)
+            self.cond.notify_all()
+
+    def taken(self, position):
+        """
+        处理流程已取用（并自行固定）某个位置的文件，释放预取的固定
+
+        Args:
+            position: 记录的位置（从0开始）
+        """
+        with self.cond:
+            file_path = self.pinned.pop(position, None)
+            if file_path:
+                self.transcriber.audio_cache.unpin(file_path)
+            elif self.pin_files and position < len(self.urls) and self.urls[position] is not None:
+                # 预取尚未完成，完成时直接释放
+                self.taken_positions.add(position)
+
+    def stop(self):
+        """停止预取并等待线程退出"""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        with self.cond:
+            self.release_pins()
+            self.taken_positions.clear()
+
+    def prefetch(self, urls):
+        """
+        单独运行：预取所有URL直到完成或达到磁盘预算
+
+        Args:
+            urls: 音频URL列表
+
+        Returns:
+            dict: 统计信息
+        """
+        self.standalone = True
+        self.start(urls)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        stats = {
+            'downloaded': self.downloaded_count,
+            'cached': self.cached_count,
+            'failed': self.failed_count,
+            'remaining': len(self.urls) - self.next_index
+        }
+        logger.info(f"预取完成: 下载 {stats['downloaded']}, 已缓存 {stats['cached']}, "
+                    f"失败 {stats['failed']}, 因预算未下载 {stats['remaining']}")
+        return stats
+
+
+def main():
+    """
+    主函数：单独运行预取
+    """
+    from transcribe_audio import AudioTranscriber
+
+    # 加载环境变量
+    load_dotenv()
+
+    # 配置日志
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    CSV_FILE = os.getenv('CSV_FILE', 'call.csv')
+    AWS_REGION = os.getenv('AWS_REGION', 'us-east-1')
+    LIMIT = int(os.getenv('LIMIT', '0')) if os.getenv('LIMIT') else None
+    START_FROM = int(os.getenv('START_FROM', '0')) if os.getenv('START_FROM') else 0
+    WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.getenv('PREFETCH_WORKERS', '8'))
+    MAX_GB = float(os.getenv('PREFETCH_MAX_GB', '2'))
+
+    if not os.path.exists(CSV_FILE):
+        logger.error(f"CSV文件不存在: {CSV_FILE}")
+        return
+
+    urls = load_audio_urls(CSV_FILE, limit=LIMIT, start_from=START_FROM)
+    logger.info(f"找到 {len(urls)} 个有效的音频URL，预算 {MAX_GB} GB，{WORKERS} 个线程")
+
+    transcriber = AudioTranscriber(aws_region=AWS_REGION)
+    prefetcher = AudioPrefetcher(transcriber, workers=WORKERS,
+                                 max_bytes=int(MAX_GB * 1024 ** 3), lookahead=None)
+    prefetcher.prefetch(urls)
+
+
+if __name__ == "__main__":
+    main()
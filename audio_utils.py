@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+音频文件工具
+从MP3文件头读取时长，不依赖第三方解码库
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Layer III 比特率表 (kbps)
+MPEG1_L3_BITRATES = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+MPEG2_L3_BITRATES = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+
+# 采样率表，按MPEG版本位索引: 0=MPEG2.5, 2=MPEG2, 3=MPEG1
+SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+# 查找帧同步时最多扫描的字节数
+MAX_SYNC_SCAN = 64 * 1024
+
+
+def skip_id3v2(data):
+    """返回ID3v2标签之后的偏移量"""
+    if len(data) >= 10 and data[:3] == b'ID3':
+        size = ((data[6] & 0x7f) << 21) | ((data[7] & 0x7f) << 14) | ((data[8] & 0x7f) << 7) | (data[9] & 0x7f)
+        offset = 10 + size
+        if data[5] & 0x10:  # 带footer
+            offset += 10
+        return offset
+    return 0
+
+
+def parse_frame_header(header):
+    """
+    解析MP3帧头（仅支持Layer III）
+
+    Args:
+        header: 4字节帧头
+
+    Returns:
+        dict: 帧信息，如果不是有效的Layer III帧头返回None
+    """
+    if header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    channel_mode = header[3] >> 6
+
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    is_mpeg1 = version == 3
+    bitrate = (MPEG1_L3_BITRATES if is_mpeg1 else MPEG2_L3_BITRATES)[bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    mono = channel_mode == 3
+
+    return {
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'samples_per_frame': 1152 if is_mpeg1 else 576,
+        # Xing/Info头位于帧头和side info之后
+        'xing_offset': 4 + ((17 if mono else 32) if is_mpeg1 else (9 if mono else 17)),
+    }
+
+
+def get_mp3_duration(file_path):
+    """
+    从MP3文件头估算音频时长
+
+    优先使用Xing/Info或VBRI头中的总帧数（VBR），否则按首帧比特率估算（CBR）
+
+    Args:
+        file_path: MP3文件路径
+
+    Returns:
+        float: 时长（秒），无法解析时返回None
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(10)
+            offset = skip_id3v2(head)
+            f.seek(0, 2)
+            file_size = f.tell()
+            f.seek(offset)
+            data = f.read(MAX_SYNC_SCAN)
+
+        # 查找第一个有效帧
+        for pos in range(len(data) - 4):
+            if data[pos] != 0xFF:
+                continue
+            frame = parse_frame_header(data[pos:pos + 4])
+            if frame is None:
+                continue
+
+            # VBR: Xing/Info头
+            xing = pos + frame['xing_offset']
+            if data[xing:xing + 4] in (b'Xing', b'Info'):
+                flags = int.from_bytes(data[xing + 4:xing + 8], 'big')
+                if flags & 0x01:
+                    frames = int.from_bytes(data[xing + 8:xing + 12], 'big')
+                    return frames * frame['samples_per_frame'] / frame['sample_rate']
+
+            # VBR: VBRI头（固定在帧头后32字节）
+            vbri = pos + 36
+            if data[vbri:vbri + 4] == b'VBRI':
+                frames = int.from_bytes(data[vbri + 14:vbri + 18], 'big')
+                return frames * frame['samples_per_frame'] / frame['sample_rate']
+
+            # CBR: 按文件大小和比特率估算
+            audio_bytes = file_size - offset - pos
+            return audio_bytes * 8 / frame['bitrate']
+
+        return None
+
+    except Exception as e:
+        logger.warning(f"读取MP3时长失败 {file_path}: {str(e)}")
+        return None
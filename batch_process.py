@@ -5,8 +5,10 @@
 
 import os
 import time
+import queue
+from concurrent.futures import as_completed
 from transcribe_audio import AudioTranscriber
-import pandas as pd
+from csv_loader import load_csv, processing_columns
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -33,9 +35,9 @@ def process_batch(start_index, batch_size=50):
         logger.error("S3_BUCKET 环境变量未设置")
         return
     
-    # 读取CSV文件
-    df = pd.read_csv(CSV_FILE)
+    # 读取CSV文件（只读取处理需要的列）
     audio_column = '通话录音'
+    df = load_csv(CSV_FILE, processing_columns(audio_column))
     
     if audio_column not in df.columns:
         logger.error(f"CSV文件中未找到列: {audio_column}")
@@ -56,8 +58,8 @@ def process_batch(start_index, batch_size=50):
     # 创建转录器
     transcriber = AudioTranscriber(aws_region=AWS_REGION)
     
-    # 处理批次数据
-    success_count = 0
+    # 第一阶段：下载音频并在后台提交上传，上传与后续下载重叠进行
+    uploads = {}
     for idx, (original_index, row) in enumerate(batch_data.iterrows()):
         try:
             audio_url = row[audio_column]
@@ -69,24 +71,71 @@ def process_batch(start_index, batch_size=50):
                 logger.warning(f"跳过第 {original_index} 条记录：下载失败")
                 continue
             
-            # 上传到S3
+            # 上传到S3（后台进行）
             from pathlib import Path
             filename = Path(local_file_path).name
             s3_key = f"{S3_FOLDER_PREFIX}audio/{filename}" if S3_FOLDER_PREFIX else f"transcribe-audio/{filename}"
-            s3_uri = transcriber.upload_to_s3(local_file_path, S3_BUCKET, s3_key)
+            future = transcriber.submit_upload(local_file_path, S3_BUCKET, s3_key)
+            uploads[future] = (original_index, row, local_file_path)
+            
+        except Exception as e:
+            logger.error(f"处理第 {original_index} 条记录时出错: {str(e)}")
+            continue
+    
+    # 第二阶段：按上传完成顺序提交转录任务
+    submitted = {}
+    cached = []
+    results_queue = queue.Queue()
+    for future in as_completed(uploads):
+        original_index, row, local_file_path = uploads[future]
+        try:
+            s3_uri = future.result()
             if not s3_uri:
                 logger.warning(f"跳过第 {original_index} 条记录：S3上传失败")
                 continue
             
+            # 相同音频和任务设置已转录过时直接使用缓存的结果，不启动转录任务
+            transcript_data = transcriber.get_cached_result(s3_uri)
+            if transcript_data is not None:
+                cached.append((original_index, transcript_data))
+                continue
+            
             # 启动转录任务
             job_name = f"transcribe-job-{original_index}-{int(time.time())}"
             if not transcriber.start_transcription_job(job_name, s3_uri):
                 logger.warning(f"跳过第 {original_index} 条记录：转录任务启动失败")
                 continue
             
-            # 等待转录完成
-            job_result = transcriber.wait_for_transcription_completion(job_name)
-            if not job_result:
+            # 登记到任务跟踪器，统一批量轮询（按音频时长规划检查时间）
+            submitted[job_name] = (original_index, s3_uri)
+            expected_duration = transcriber.estimate_audio_duration(row.get('call_seconds'), local_file_path)
+            transcriber.job_tracker.track(job_name, result_queue=results_queue, expected_duration=expected_duration)
+            
+        except Exception as e:
+            logger.error(f"处理第 {original_index} 条记录时出错: {str(e)}")
+            continue
+    
+    # 所有上传都已完成，关闭S3传输管理器的线程
+    transcriber.s3_uploader.shutdown()
+    
+    logger.info(f"已提交 {len(submitted)} 个转录任务，等待完成...")
+    
+    # 第三阶段：按完成顺序收集结果，命中结果缓存的记录直接保存
+    success_count = 0
+    for original_index, transcript_data in cached:
+        try:
+            output_file = transcriber.transcripts_dir / f"transcript_{original_index}.json"
+            transcriber.save_transcript(transcript_data, output_file)
+            success_count += 1
+            logger.info(f"第 {original_index} 条记录处理完成（使用缓存的转录结果）")
+        except Exception as e:
+            logger.error(f"处理第 {original_index} 条记录时出错: {str(e)}")
+    
+    for _ in range(len(submitted)):
+        job_name, job_result = results_queue.get()
+        original_index, s3_uri = submitted[job_name]
+        try:
+            if not job_result or job_result['TranscriptionJobStatus'] != 'COMPLETED':
                 logger.warning(f"跳过第 {original_index} 条记录：转录任务失败")
                 continue
             
@@ -96,6 +145,7 @@ def process_batch(start_index, batch_size=50):
             if not transcript_data:
                 logger.warning(f"跳过第 {original_index} 条记录：转录结果下载失败")
                 continue
+            transcriber.cache_result(s3_uri, transcript_data, job_name)
             
             # 保存转录结果
             output_file = transcriber.transcripts_dir / f"transcript_{original_index}.json"
@@ -104,9 +154,6 @@ def process_batch(start_index, batch_size=50):
             success_count += 1
             logger.info(f"第 {original_index} 条记录处理完成")
             
-            # 添加延迟避免API限制
-            time.sleep(2)
-            
         except Exception as e:
             logger.error(f"处理第 {original_index} 条记录时出错: {str(e)}")
             continue
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+CSV读取工具
+处理流程只读取生成输出文件名和映射信息需要的列，不读取ASR文本等大列；
+可选地把整个CSV缓存为Feather格式的旁路文件（需要pyarrow），
+旁路文件记录源文件的修改时间和大小，CSV变化后自动重建；
+也支持逐条流式读取，并用保存的字节偏移直接定位到第N条有效记录
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 处理流程需要的列（音频URL、业务ID、客户号和映射信息中的其他字段），不存在的列忽略
+PROCESSING_COLUMNS = (
+    '通话录音',
+    '催收外呼id', 'call_id', 'id', 'ID',
+    '客户号', 'customer_id', 'customer_no',
+    '渠道', '外呼时间', '联系结果', 'collection_result', 'call_seconds',
+)
+
+
+def processing_columns(audio_column='通话录音'):
+    """返回处理流程需要读取的列，包含自定义的音频URL列"""
+    if audio_column in PROCESSING_COLUMNS:
+        return PROCESSING_COLUMNS
+    return PROCESSING_COLUMNS + (audio_column,)
+
+
+def sidecar_path(csv_file):
+    """返回CSV对应的旁路文件路径（call.csv -> call.csv.feather）"""
+    csv_file = Path(csv_file)
+    return csv_file.with_name(csv_file.name + '.feather')
+
+
+def source_signature(csv_file):
+    """返回源文件的修改时间和大小，用于判断旁路文件是否过期"""
+    stat = os.stat(csv_file)
+    return {b'source_mtime_ns': str(stat.st_mtime_ns).encode(), b'source_size': str(stat.st_size).encode()}
+
+
+def load_sidecar(csv_file, columns=None):
+    """
+    从旁路文件读取CSV，旁路文件不存在或已过期时先从CSV重建
+
+    Args:
+        csv_file: CSV文件路径
+        columns: 需要的列，None表示全部
+
+    Returns:
+        DataFrame: 读取的数据，没有安装pyarrow或读写失败时返回None
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import feather
+    except ImportError:
+        logger.warning("未安装pyarrow，不使用CSV旁路文件")
+        return None
+
+    path = sidecar_path(csv_file)
+    signature = source_signature(csv_file)
+    try:
+        if path.exists():
+            with pa.memory_map(str(path)) as source:
+                schema = pa.ipc.open_file(source).schema
+            metadata = schema.metadata or {}
+            if all(metadata.get(key) == value for key, value in signature.items()):
+                names = [name for name in schema.names if columns is None or name in columns]
+                return feather.read_table(str(path), columns=names).to_pandas()
+            logger.info(f"CSV已变化，重建旁路文件: {path}")
+
+        df = pd.read_csv(csv_file)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **signature})
+        temp_path = path.with_name(path.name + '.tmp')
+        feather.write_feather(table, str(temp_path))
+        os.replace(temp_path, path)
+        logger.info(f"已生成CSV旁路文件: {path}")
+        return df if columns is None else df[[name for name in df.columns if name in columns]]
+    except Exception as e:
+        logger.warning(f"CSV旁路文件读写失败，直接读取CSV: {str(e)}")
+        return None
+
+
+def load_csv(csv_file, columns=None, use_sidecar=None):
+    """
+    读取CSV，只保留需要的列
+
+    Args:
+        csv_file: CSV文件路径
+        columns: 需要的列，不存在的列忽略；None表示全部
+        use_sidecar: 是否使用Feather旁路文件，默认读取 CSV_SIDECAR
+
+    Returns:
+        DataFrame: 读取的数据（行索引与完整读取时一致）
+    """
+    if use_sidecar is None:
+        use_sidecar = os.getenv('CSV_SIDECAR', 'false').lower() == 'true'
+    if columns is not None:
+        columns = set(columns)
+
+    if use_sidecar:
+        df = load_sidecar(csv_file, columns)
+        if df is not None:
+            return df
+
+    # 列投影：其余列在解析时直接丢弃，不占用内存
+    usecols = None if columns is None else (lambda name: name in columns)
+    return pd.read_csv(csv_file, usecols=usecols)
+
+
+# pandas默认识别为缺失值的文本
+NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+INT_PATTERN = re.compile(r'^[+-]?\d+$')
+FLOAT_PATTERN = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+
+# 检查点中每个偏移量之前用于校验文件未被改写的字节数
+ANCHOR_SIZE = 4096
+
+
+def coerce_value(text):
+    """
+    按pandas的规则转换单元格文本
+
+    流式读取时无法预先知道整列的类型，按单元格转换：
+    业务ID等数字文本转换后生成的输出文件名与一次性读取时一致
+
+    Returns:
+        缺失值为NaN，整数文本为int，小数或科学计数法文本为float，其他为原文本
+    """
+    if text in NA_VALUES:
+        return float('nan')
+    if INT_PATTERN.match(text):
+        return int(text)
+    if FLOAT_PATTERN.match(text):
+        return float(text)
+    return text
+
+
+def iter_records(f, offset, encoding='utf-8'):
+    """
+    从字节偏移开始逐条读取CSV记录，引号内的换行属于同一条记录
+
+    Args:
+        f: 以二进制模式打开的文件
+        offset: 起始字节偏移（必须是一条记录的开头）
+        encoding: 文件编码
+
+    Yields:
+        tuple: (字段列表, 下一条记录的字节偏移)
+    """
+    position = {'offset': offset}
+
+    def lines():
+        # csv.reader按需逐行读取，不会提前读入下一条记录，因此已读取的字节数就是下一条记录的偏移
+        for line in iter(f.readline, b''):
+            position['offset'] += len(line)
+            yield line.decode(encoding)
+
+    f.seek(offset)
+    for fields in csv.reader(lines()):
+        if fields:
+            yield fields, position['offset']
+
+
+class CSVCheckpoint:
+    def __init__(self, csv_file, interval=None):
+        """
+        CSV偏移量检查点，记录第N条有效记录在文件中的字节偏移，
+        之后从第N条开始处理时直接定位，不需要从头读取
+
+        Args:
+            csv_file: CSV文件路径
+            interval: 每隔多少条有效记录保存一个偏移量，默认读取 CSV_CHECKPOINT_INTERVAL
+        """
+        self.csv_file = Path(csv_file)
+        self.path = self.csv_file.with_name(self.csv_file.name + '.offsets.json')
+        if interval is None:
+            interval = int(os.getenv('CSV_CHECKPOINT_INTERVAL', '100'))
+        self.interval = max(1, interval)
+        # 有效记录序号 -> (CSV行号, 字节偏移, 偏移之前字节的哈希)
+        self.samples = {}
+        self.load()
+
+    def load(self):
+        """读取检查点文件"""
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.samples = {int(position): tuple(sample) for position, sample in data.get('samples', {}).items()}
+        except Exception as e:
+            logger.warning(f"读取CSV检查点失败: {str(e)}")
+            self.samples = {}
+
+    def save(self):
+        """写入检查点文件（先写临时文件再原子重命名）"""
+        try:
+            temp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'csv_file': self.csv_file.name,
+                           'samples': {str(position): list(sample) for position, sample in sorted(self.samples.items())}},
+                          f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.warning(f"保存CSV检查点失败: {str(e)}")
+
+    @staticmethod
+    def anchor(f, offset):
+        """计算偏移量之前一段字节的哈希，用于确认文件在该位置之前没有被改写"""
+        start = max(0, offset - ANCHOR_SIZE)
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+    def record(self, f, position, row_index, offset):
+        """
+        到达保存间隔时记录第position条有效记录的偏移量
+
+        Args:
+            f: 以二进制模式打开的CSV文件（读取后恢复原位置）
+            position: 有效记录序号（从0开始）
+            row_index: 该记录的CSV行号
+            offset: 该记录开头的字节偏移
+        """
+        if position % self.interval or position in self.samples:
+            return
+        current = f.tell()
+        self.samples[position] = (row_index, offset, self.anchor(f, offset))
+        f.seek(current)
+        self.save()
+
+    def nearest(self, f, position):
+        """
+        查找不超过position且仍然有效的最近偏移量
+
+        Returns:
+            tuple: (有效记录序号, CSV行号, 字节偏移)，没有可用的检查点时返回None
+        """
+        for sample_position in sorted((p for p in self.samples if p <= position), reverse=True):
+            row_index, offset, anchor = self.samples[sample_position]
+            if self.anchor(f, offset) == anchor:
+                return sample_position, row_index, offset
+            # 文件已被改写，之后的偏移量都不再可信
+            logger.info(f"CSV文件已变化，丢弃检查点: {self.path}")
+            self.samples = {}
+            return None
+        return None
+
+
+def stream_valid_rows(csv_file, audio_column='通话录音', limit=None, start_from=0, columns=None, checkpoint=None):
+    """
+    流式读取CSV中待处理的记录（筛选规则与一次性读取一致），内存占用与文件大小无关
+
+    从第start_from条有效记录开始时，先用检查点中保存的字节偏移直接定位
+
+    Args:
+        csv_file: CSV文件路径
+        audio_column: 音频URL列名
+        limit: 最大记录数，None表示全部
+        start_from: 从第几条有效记录开始
+        columns: 需要的列，默认为处理流程需要的列
+        checkpoint: CSVCheckpoint实例，默认按CSV文件创建
+
+    Yields:
+        tuple: (CSV行号, {列名: 值})
+    """
+    if columns is None:
+        columns = processing_columns(audio_column)
+    if checkpoint is None:
+        checkpoint = CSVCheckpoint(csv_file)
+
+    with open(csv_file, 'rb') as f:
+        header_line = f.readline()
+        header = next(csv.reader(io.StringIO(header_line.decode('utf-8-sig'))), [])
+        # 重复的列名只取第一列（与pandas一致）
+        wanted = {}
+        for i, name in enumerate(header):
+            if name in columns and name not in wanted:
+                wanted[name] = i
+        if audio_column not in wanted:
+            raise ValueError(f"CSV文件中未找到列: {audio_column}")
+        audio_index = wanted[audio_column]
+
+        position, row_index, offset = 0, 0, len(header_line)
+        if start_from > 0:
+            found = checkpoint.nearest(f, start_from)
+            if found:
+                position, row_index, offset = found
+                logger.info(f"从检查点定位到第 {position + 1} 条有效记录 (字节偏移 {offset})")
+
+        yielded = 0
+        record_offset = offset
+        for fields, next_offset in iter_records(f, offset):
+            audio_url = fields[audio_index] if audio_index < len(fields) else ''
+            if audio_url and audio_url not in NA_VALUES:
+                checkpoint.record(f, position, row_index, record_offset)
+                if position >= start_from:
+                    if limit and yielded >= limit:
+                        return
+                    row = {name: coerce_value(fields[i] if i < len(fields) else '') for name, i in wanted.items()}
+                    yield row_index, row
+                    yielded += 1
+                position += 1
+            row_index += 1
+            record_offset = next_offset
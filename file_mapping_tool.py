@@ -9,6 +9,8 @@ import pandas as pd
 from pathlib import Path
 import argparse
 import sys
+from mapping_store import MappingStore
+from csv_loader import load_csv
 
 class FileMappingTool:
     def __init__(self, transcripts_dir='transcripts', csv_file='call.csv'):
@@ -22,14 +24,25 @@ class FileMappingTool:
         self.transcripts_dir = Path(transcripts_dir)
         self.csv_file = csv_file
         self.mapping_file = self.transcripts_dir / 'file_mapping.json'
+        self.mapping_db = self.transcripts_dir / 'file_mapping.db'
         
-        # 加载映射数据
+        # 加载映射数据，并建立查询索引；CSV在第一次需要时才读取
         self.load_mapping()
-        self.load_csv()
+        self.build_indexes()
+        self.csv_data = None
+        self.csv_loaded = False
     
     def load_mapping(self):
-        """加载文件映射数据"""
-        if self.mapping_file.exists():
+        """加载文件映射数据（优先读取映射数据库，没有时读取 file_mapping.json）"""
+        if self.mapping_db.exists():
+            try:
+                self.mapping_data = MappingStore(self.mapping_db).all()
+                print(f"✓ 已加载映射数据库: {self.mapping_db}")
+                print(f"  包含 {len(self.mapping_data)} 个文件映射记录")
+            except Exception as e:
+                print(f"✗ 加载映射数据库失败: {e}")
+                self.mapping_data = {}
+        elif self.mapping_file.exists():
             try:
                 with open(self.mapping_file, 'r', encoding='utf-8') as f:
                     self.mapping_data = json.load(f)
@@ -42,10 +55,33 @@ class FileMappingTool:
             print(f"✗ 映射文件不存在: {self.mapping_file}")
             self.mapping_data = {}
     
+    def build_indexes(self):
+        """
+        建立查询索引，之后每次查询都是常数时间
+
+        同一个键对应多条记录时保留第一条（与逐条查找的结果一致），客户号保留全部记录
+        """
+        self.by_csv_row = {}
+        self.by_call_id = {}
+        self.by_customer_id = {}
+        self.by_filename = {}
+        
+        for json_file, mapping in self.mapping_data.items():
+            self.by_csv_row.setdefault(mapping['csv_row_index'], mapping)
+            if mapping.get('call_id') is not None:
+                self.by_call_id.setdefault(mapping['call_id'], mapping)
+            if mapping.get('customer_id') is not None:
+                self.by_customer_id.setdefault(mapping['customer_id'], []).append(mapping)
+            # 文件名可以带或不带扩展名
+            for name in (mapping['json_file'], mapping['txt_file'],
+                         mapping['json_file'].replace('.json', ''), mapping['txt_file'].replace('.txt', '')):
+                self.by_filename.setdefault(name, mapping)
+    
     def load_csv(self):
-        """加载CSV数据"""
+        """加载CSV数据（设置 CSV_SIDECAR=true 时使用Feather旁路文件）"""
+        self.csv_loaded = True
         try:
-            self.csv_data = pd.read_csv(self.csv_file)
+            self.csv_data = load_csv(self.csv_file)
             print(f"✓ 已加载CSV文件: {self.csv_file}")
             print(f"  包含 {len(self.csv_data)} 行记录")
         except Exception as e:
@@ -62,10 +98,7 @@ class FileMappingTool:
         Returns:
             dict: 映射信息，如果未找到返回None
         """
-        for json_file, mapping in self.mapping_data.items():
-            if mapping['csv_row_index'] == row_index:
-                return mapping
-        return None
+        return self.by_csv_row.get(row_index)
     
     def find_by_call_id(self, call_id):
         """
@@ -77,11 +110,7 @@ class FileMappingTool:
         Returns:
             dict: 映射信息，如果未找到返回None
         """
-        call_id_str = str(call_id)
-        for json_file, mapping in self.mapping_data.items():
-            if mapping.get('call_id') == call_id_str:
-                return mapping
-        return None
+        return self.by_call_id.get(str(call_id))
     
     def find_by_customer_id(self, customer_id):
         """
@@ -93,12 +122,7 @@ class FileMappingTool:
         Returns:
             list: 映射信息列表（一个客户可能有多个通话记录）
         """
-        customer_id_str = str(customer_id)
-        results = []
-        for json_file, mapping in self.mapping_data.items():
-            if mapping.get('customer_id') == customer_id_str:
-                results.append(mapping)
-        return results
+        return list(self.by_customer_id.get(str(customer_id), []))
     
     def find_by_filename(self, filename):
         """
@@ -112,14 +136,27 @@ class FileMappingTool:
         """
         # 移除扩展名，支持查找JSON或TXT文件
         base_name = filename.replace('.json', '').replace('.txt', '')
+        return self.by_filename.get(base_name) or self.by_filename.get(filename)
+    
+    def find_many(self, keys, key_type='call-id'):
+        """
+        批量查询
         
-        for json_file, mapping in self.mapping_data.items():
-            json_base = mapping['json_file'].replace('.json', '')
-            txt_base = mapping['txt_file'].replace('.txt', '')
+        Args:
+            keys: 查询值列表
+            key_type: 查询类型 'csv-row'、'call-id'、'customer-id' 或 'filename'
             
-            if base_name == json_base or base_name == txt_base or filename == mapping['json_file'] or filename == mapping['txt_file']:
-                return mapping
-        return None
+        Returns:
+            dict: {查询值: 结果}，结果与对应的单条查询一致（未找到为None，客户号为列表）
+        """
+        finders = {
+            'csv-row': lambda key: self.find_by_csv_row(int(key)) if str(key).isdigit() else None,
+            'call-id': self.find_by_call_id,
+            'customer-id': self.find_by_customer_id,
+            'filename': self.find_by_filename,
+        }
+        find = finders[key_type]
+        return {key: find(key) for key in keys}
     
     def list_all_mappings(self):
         """列出所有映射关系"""
@@ -190,6 +227,8 @@ class FileMappingTool:
         Returns:
             dict: CSV记录，如果未找到返回None
         """
+        if not self.csv_loaded:
+            self.load_csv()
         if self.csv_data is None:
             return None
         
@@ -278,6 +317,19 @@ class FileMappingTool:
             except Exception as e:
                 print(f"查询出错: {e}")
     
+    def print_batch_results(self, results, key_type):
+        """打印批量查询结果，每个查询值一行"""
+        found = 0
+        for key, result in results.items():
+            mappings = result if isinstance(result, list) else [result] if result else []
+            if mappings:
+                found += 1
+                files = ', '.join(mapping['json_file'] for mapping in mappings)
+                print(f"{key}\t{files}")
+            else:
+                print(f"{key}\t未找到")
+        print(f"\n共查询 {len(results)} 个{key_type}，找到 {found} 个")
+    
     def print_mapping_result(self, mapping):
         """打印映射结果"""
         print(f"\n=== 找到匹配记录 ===")
@@ -324,9 +376,31 @@ def main():
                        help='根据客户号查询')
     parser.add_argument('--filename',
                        help='根据文件名查询')
+    parser.add_argument('--batch', choices=['csv-row', 'call-id', 'customer-id', 'filename'],
+                       help='批量查询的类型，查询值由 --ids 或 --ids-file 提供')
+    parser.add_argument('--ids',
+                       help='批量查询值，逗号分隔')
+    parser.add_argument('--ids-file',
+                       help='批量查询值文件，每行一个 (- 表示标准输入)')
+    parser.add_argument('--output', '-o',
+                       help='批量查询结果保存为JSON文件')
+    parser.add_argument('--export-json', nargs='?', const='', metavar='PATH',
+                       help='把映射数据库导出为JSON (默认: <转录文件目录>/file_mapping.json)')
     
     args = parser.parse_args()
     
+    if args.export_json is not None:
+        # 导出映射数据库，供读取 file_mapping.json 的工具使用
+        transcripts_dir = Path(args.transcripts_dir)
+        mapping_db = transcripts_dir / 'file_mapping.db'
+        if not mapping_db.exists():
+            print(f"✗ 映射数据库不存在: {mapping_db}")
+            sys.exit(1)
+        export_path = args.export_json or transcripts_dir / 'file_mapping.json'
+        count = MappingStore(mapping_db).export_json(export_path)
+        print(f"✓ 已导出 {count} 个文件映射记录到: {export_path}")
+        return
+    
     # 创建映射工具实例
     tool = FileMappingTool(args.transcripts_dir, args.csv_file)
     
@@ -335,7 +409,26 @@ def main():
         sys.exit(1)
     
     # 根据参数执行相应操作
-    if args.interactive:
+    if args.batch:
+        keys = []
+        if args.ids:
+            keys.extend(key.strip() for key in args.ids.split(','))
+        if args.ids_file:
+            f = sys.stdin if args.ids_file == '-' else open(args.ids_file, 'r', encoding='utf-8')
+            with f:
+                keys.extend(line.strip() for line in f)
+        keys = [key for key in keys if key]
+        if not keys:
+            print("请使用 --ids 或 --ids-file 提供查询值")
+            sys.exit(1)
+        
+        results = tool.find_many(keys, args.batch)
+        tool.print_batch_results(results, args.batch)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"✓ 批量查询结果已保存到: {args.output}")
+    elif args.interactive:
         tool.search_interactive()
     elif args.list:
         tool.list_all_mappings()
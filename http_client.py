@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+共享HTTP会话
+为音频和转录结果下载提供连接池、长连接、超时和传输层重试，
+以及写入临时文件、支持断点续传和原子提交的文件下载
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as URLLib3Error
+from urllib3.util.retry import Retry
+
+
+class PooledSession(requests.Session):
+    def __init__(self, timeout=None):
+        """
+        带默认超时的会话
+
+        Args:
+            timeout: 默认超时 (连接超时, 读取超时)，请求未指定timeout时使用
+        """
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+
+def create_http_session(pool_size=None, connect_timeout=None, read_timeout=None, max_retries=None):
+    """
+    创建可在所有工作线程间共享的HTTP会话
+
+    同一主机的重复下载会复用连接，避免每个文件都重新进行TCP和TLS握手
+
+    Args:
+        pool_size: 每个主机的连接池大小，默认读取 HTTP_POOL_SIZE
+        connect_timeout: 连接超时（秒），默认读取 HTTP_CONNECT_TIMEOUT
+        read_timeout: 读取超时（秒），默认读取 HTTP_READ_TIMEOUT
+        max_retries: 连接错误和5xx/429响应的重试次数，默认读取 HTTP_MAX_RETRIES
+
+    Returns:
+        PooledSession: 配置好的会话
+    """
+    if pool_size is None:
+        pool_size = int(os.getenv('HTTP_POOL_SIZE', '32'))
+    if connect_timeout is None:
+        connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+    if read_timeout is None:
+        read_timeout = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+    if max_retries is None:
+        max_retries = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False
+    )
+    # pool_block=True: 连接数达到上限时等待空闲连接，而不是创建用完即弃的额外连接
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size,
+                          max_retries=retry, pool_block=True)
+
+    session = PooledSession(timeout=(connect_timeout, read_timeout))
+    session.headers['Connection'] = 'keep-alive'
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# 下载时每次读写的块大小
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 下载中断时的续传次数
+DOWNLOAD_RESUME_ATTEMPTS = 3
+
+# 不带分片后缀的ETag即为对象内容的MD5（S3/COS普通上传）
+MD5_ETAG_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def file_md5(file_path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """计算文件的MD5"""
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def get_part_paths(file_path):
+    """
+    返回下载临时文件和续传信息文件的路径
+
+    Args:
+        file_path: 目标文件路径
+
+    Returns:
+        tuple: (临时文件路径, 续传信息文件路径)
+    """
+    file_path = Path(file_path)
+    return (file_path.with_name(file_path.name + '.part'),
+            file_path.with_name(file_path.name + '.part.json'))
+
+
+def load_resume_state(part_path, meta_path):
+    """
+    读取上次中断时的下载进度
+
+    Returns:
+        tuple: (已下载字节数, 校验值ETag或Last-Modified)，没有校验值时无法安全续传，返回(0, None)
+    """
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    if offset == 0 or not meta_path.exists():
+        return 0, None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            validator = json.load(f).get('validator')
+    except Exception:
+        validator = None
+    if not validator:
+        return 0, None
+    return offset, validator
+
+
+def resume_headers(offset, validator):
+    """生成续传请求头，offset为0时返回空字典"""
+    if offset > 0 and validator:
+        return {'Range': f"bytes={offset}-", 'If-Range': validator}
+    return {}
+
+
+def parse_download_response(status, headers, offset):
+    """
+    根据响应判断写入方式和文件总大小
+
+    Args:
+        status: HTTP状态码
+        headers: 响应头
+        offset: 请求续传的起始位置
+
+    Returns:
+        tuple: (写入模式 'ab'或'wb', 文件总大小或None)
+    """
+    content_range = headers.get('Content-Range', '')
+    if offset > 0 and status == 206 and content_range.startswith(f"bytes {offset}-"):
+        total = content_range.rsplit('/', 1)[-1]
+        return 'ab', int(total) if total.isdigit() else None
+    # 服务器返回完整内容（文件已变化或不支持Range），从头下载
+    length = headers.get('Content-Length')
+    encoded = headers.get('Content-Encoding', 'identity') != 'identity'
+    return 'wb', int(length) if length and length.isdigit() and not encoded else None
+
+
+def save_resume_state(meta_path, url, headers, total):
+    """保存续传所需的校验值"""
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'url': url,
+            'validator': headers.get('ETag') or headers.get('Last-Modified'),
+            'etag': headers.get('ETag'),
+            'total': total
+        }, f)
+
+
+def commit_download(part_path, meta_path, file_path, total):
+    """
+    校验临时文件并原子重命名为目标文件，校验失败时删除临时文件并抛出异常
+
+    Args:
+        part_path: 临时文件路径
+        meta_path: 续传信息文件路径
+        file_path: 目标文件路径
+        total: 期望的文件大小，None表示未知
+
+    Returns:
+        int: 文件大小（字节）
+    """
+    etag = None
+    if meta_path.exists():
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            etag = json.load(f).get('etag')
+
+    def discard():
+        part_path.unlink(missing_ok=True)
+        meta_path.unlink(missing_ok=True)
+
+    size = part_path.stat().st_size
+    if total is not None and size != total:
+        discard()
+        raise IOError(f"文件大小与Content-Length不一致: {size}/{total} 字节")
+    if size == 0:
+        discard()
+        raise IOError("下载的文件为空")
+
+    # ETag为内容MD5时校验内容
+    etag = (etag or '').strip('"').lower()
+    if MD5_ETAG_PATTERN.match(etag) and file_md5(part_path) != etag:
+        discard()
+        raise IOError("文件内容与ETag不一致")
+
+    os.replace(part_path, file_path)
+    meta_path.unlink(missing_ok=True)
+    return size
+
+
+def download_to_file(session, url, file_path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    下载文件到指定路径
+
+    数据先写入同目录下的 .part 临时文件，中断后用HTTP Range从已下载的位置续传
+    （通过If-Range确保服务器上的文件没有变化），完成后按Content-Length和ETag校验，
+    校验通过才原子重命名为目标文件，因此目标路径上不会出现不完整的文件
+
+    Args:
+        session: requests会话
+        url: 下载地址
+        file_path: 目标文件路径
+        chunk_size: 读写块大小
+
+    Returns:
+        int: 文件大小（字节）
+    """
+    file_path = Path(file_path)
+    part_path, meta_path = get_part_paths(file_path)
+
+    for attempt in range(DOWNLOAD_RESUME_ATTEMPTS):
+        last_attempt = attempt + 1 >= DOWNLOAD_RESUME_ATTEMPTS
+        offset, validator = load_resume_state(part_path, meta_path)
+        try:
+            with session.get(url, stream=True, headers=resume_headers(offset, validator)) as response:
+                response.raise_for_status()
+                mode, total = parse_download_response(response.status_code, response.headers, offset)
+                save_resume_state(meta_path, url, response.headers, total)
+
+                response.raw.decode_content = True
+                with open(part_path, mode) as f:
+                    shutil.copyfileobj(response.raw, f, chunk_size)
+        except (requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                URLLib3Error):
+            # 连接中断（直接读取response.raw时抛出的是urllib3异常），保留临时文件续传
+            if last_attempt:
+                raise
+            continue
+
+        if total is not None and part_path.stat().st_size < total and not last_attempt:
+            # 连接被提前关闭，继续续传
+            continue
+        return commit_download(part_path, meta_path, file_path, total)
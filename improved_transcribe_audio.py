@@ -5,15 +5,34 @@
 """
 
 import pandas as pd
-import requests
 import boto3
 import os
 import time
 import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from pathlib import Path
 import logging
 from dotenv import load_dotenv
+from job_tracker import TranscriptionJobTracker
+from audio_utils import get_mp3_duration
+from rate_limiter import get_shared_rate_limiter
+from http_client import create_http_session, download_to_file
+from audio_cache import AudioCache
+from s3_uploader import S3Uploader, create_s3_client
+from result_cache import TranscriptResultCache, audio_digest, settings_hash
+from job_journal import JobJournal
+from mapping_store import MappingStore
+from labeling_engine import LabelResolver, build_labeled_transcript
+from csv_loader import load_csv, processing_columns, stream_valid_rows
+from transcript_output import TranscriptOutputStore
+from transcript_format import build_sections, load_transcript, result_bytes, write_compact_transcript
+from transcript_stream import (SpooledTranscript, SPOOL_CHUNK_SIZE, stream_parse_available, summarize,
+                               write_transcript_json)
+from transcribe_pipeline import TranscriptionPipeline
+from audio_prefetcher import AudioPrefetcher
 
 # 加载环境变量
 load_dotenv()
@@ -31,36 +50,88 @@ class ImprovedAudioTranscriber:
             aws_region: AWS区域，默认为us-east-1
         """
         self.transcribe_client = boto3.client('transcribe', region_name=aws_region)
-        self.s3_client = boto3.client('s3', region_name=aws_region)
+        self.s3_client = create_s3_client(aws_region)  # 连接池大小按并发上传数配置
         self.aws_region = aws_region
         
+        # 共享的HTTP连接池，所有下载线程复用同一会话
+        self.http_session = create_http_session()
+        
+        # 共享的AWS API限流器，所有AWS调用都经过它
+        self.rate_limiter = get_shared_rate_limiter()
+        
+        # 共享的转录任务跟踪器，批量轮询所有未完成任务
+        self.job_tracker = TranscriptionJobTracker(
+            self.transcribe_client,
+            poll_interval=int(os.getenv('POLL_INTERVAL', '5')),
+            rate_limiter=self.rate_limiter
+        )
+        
         # 创建本地目录
         self.audio_dir = Path('downloaded_audio')
         self.transcripts_dir = Path('transcripts')
         self.audio_dir.mkdir(exist_ok=True)
         self.transcripts_dir.mkdir(exist_ok=True)
         
-        # 创建映射文件记录处理结果
+        # 内容寻址的音频缓存，清单记录URL、哈希、大小、访问时间和S3对象键
+        self.audio_cache = AudioCache(self.audio_dir)
+        
+        # S3上传器，共享传输管理器，按缓存清单和HeadObject跳过已上传的内容
+        self.s3_uploader = S3Uploader(self.s3_client, self.audio_cache, self.rate_limiter)
+        
+        # 转录任务设置，同时作为结果缓存键的一部分
+        self.language_code = 'es-US'  # 美国西班牙语
+        self.media_format = 'mp3'
+        self.transcribe_settings = {
+            'ShowSpeakerLabels': True,  # 显示说话人标签
+            'MaxSpeakerLabels': 10,     # 最多10个说话人
+            'ChannelIdentification': True  # 启用声道识别
+        }
+        
+        # 说话人/声道显示名称查找表（环境变量和 LABEL_CONFIG 只在这里读取一次）
+        self.label_resolver = LabelResolver.from_env(self.language_code, self.transcribe_settings['MaxSpeakerLabels'])
+        
+        # 转录结果缓存，相同音频和设置不重复转录
+        self.result_cache = TranscriptResultCache(self.transcripts_dir / 'result_cache.db')
+        
+        # 作业日志，记录每条记录的状态变化，重新运行时从中断处继续
+        self.job_journal = JobJournal(self.transcripts_dir / 'job_journal.jsonl')
+        
+        # 转录结果输出到自有存储桶时的结果存储，None表示使用服务托管的存储桶
+        self.transcript_store = None
+        
+        # 流式解析转录结果：下载时原样写入临时文件，保存时按事件读取（需要ijson）
+        self.stream_parse = os.getenv('TRANSCRIPT_STREAM_PARSE', 'false').lower() == 'true'
+        if self.stream_parse and not stream_parse_available():
+            logger.warning("未安装ijson，转录结果按原有方式一次性解析")
+            self.stream_parse = False
+        self.spool_dir = self.transcripts_dir / '.spool'
+        
+        # JSON输出格式：legacy为原有格式，compact只保存一份原始结果且不缩进（读取用 load_transcript）
+        self.transcript_format = os.getenv('TRANSCRIPT_FORMAT', 'legacy').lower()
+        self.transcript_compression = os.getenv('TRANSCRIPT_COMPRESSION', 'json').lower()
+        
+        # 按缓存文件名区分的下载锁
+        self.download_locks = {}
+        self.download_locks_guard = threading.Lock()
+        
+        # 映射记录保存在SQLite中逐条更新，file_mapping.json 在每次运行结束时导出
         self.mapping_file = self.transcripts_dir / 'file_mapping.json'
+        self.mapping_store = MappingStore(self.transcripts_dir / 'file_mapping.db')
         self.load_mapping()
     
     def load_mapping(self):
-        """加载现有的文件映射"""
-        if self.mapping_file.exists():
+        """打开映射存储，首次使用时导入旧版映射文件"""
+        if self.mapping_file.exists() and self.mapping_store.count() == 0:
             try:
-                with open(self.mapping_file, 'r', encoding='utf-8') as f:
-                    self.file_mapping = json.load(f)
+                count = self.mapping_store.import_json(self.mapping_file)
+                logger.info(f"已导入旧版映射文件: {self.mapping_file} ({count} 条记录)")
             except Exception as e:
                 logger.warning(f"加载映射文件失败: {e}")
-                self.file_mapping = {}
-        else:
-            self.file_mapping = {}
     
     def save_mapping(self):
-        """保存文件映射"""
+        """导出文件映射到 file_mapping.json（兼容原有工具）"""
         try:
-            with open(self.mapping_file, 'w', encoding='utf-8') as f:
-                json.dump(self.file_mapping, f, ensure_ascii=False, indent=2)
+            self.mapping_store.export_json(self.mapping_file)
         except Exception as e:
             logger.error(f"保存映射文件失败: {e}")
     
@@ -150,54 +221,81 @@ class ImprovedAudioTranscriber:
         else:
             return f"audio_{url_hash}.mp3"
     
-    def download_audio_file(self, url, filename=None):
+    def get_s3_key(self, local_file_path, s3_folder_prefix=''):
         """
-        下载音频文件，如果本地已存在则使用缓存
+        根据本地文件路径生成S3对象键
+        
+        缓存文件以内容哈希命名，因此相同内容的音频对应同一个S3对象
+        
+        Args:
+            local_file_path: 本地文件路径
+            s3_folder_prefix: S3文件夹前缀
+            
+        Returns:
+            str: S3对象键
+        """
+        filename = Path(local_file_path).name
+        return f"{s3_folder_prefix}audio/{filename}" if s3_folder_prefix else f"transcribe-audio/{filename}"
+    
+    def download_lock(self, filename):
+        """
+        获取指定缓存文件的下载锁
+        
+        Args:
+            filename: 缓存文件名
+            
+        Returns:
+            threading.Lock: 该文件对应的锁
+        """
+        with self.download_locks_guard:
+            if filename not in self.download_locks:
+                self.download_locks[filename] = threading.Lock()
+            return self.download_locks[filename]
+    
+    def download_audio_file(self, url, filename=None, pin=False):
+        """
+        下载音频文件，如果已缓存则直接使用缓存
         
         Args:
             url: 音频文件URL
-            filename: 本地保存的文件名，如果为None则自动生成
+            filename: 下载时使用的临时文件名，如果为None则根据URL生成
+            pin: 是否固定缓存文件，固定期间不会被缓存淘汰，用完后调用 audio_cache.unpin 释放
             
         Returns:
-            str: 本地文件路径，如果下载失败返回None
+            str: 本地缓存文件路径，如果下载失败返回None
         """
         try:
-            # 如果没有指定文件名，则根据URL生成缓存文件名
+            # 查询缓存清单，不需要探测文件系统
+            cached_path = self.audio_cache.lookup(url, pin=pin)
+            if cached_path:
+                logger.info(f"使用缓存文件: {cached_path}")
+                return str(cached_path)
+            
+            # 如果没有指定文件名，则根据URL生成临时文件名
             if filename is None:
                 filename = self.get_cached_filename(url)
             
             file_path = self.audio_dir / filename
             
-            # 检查文件是否已存在
-            if file_path.exists():
-                file_size = file_path.stat().st_size
-                if file_size > 0:  # 确保文件不为空
-                    logger.info(f"使用缓存文件: {file_path} (大小: {file_size} 字节)")
-                    return str(file_path)
-                else:
-                    logger.warning(f"缓存文件为空，重新下载: {file_path}")
-                    file_path.unlink()  # 删除空文件
-            
-            logger.info(f"正在下载: {url}")
-            
-            # 发送HTTP请求下载文件
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            # 保存文件
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            # 验证下载的文件大小
-            file_size = file_path.stat().st_size
-            if file_size == 0:
-                logger.error(f"下载的文件为空: {file_path}")
-                file_path.unlink()  # 删除空文件
-                return None
-            
-            logger.info(f"下载完成: {file_path} (大小: {file_size} 字节)")
-            return str(file_path)
+            # 同一文件同时只允许一个线程下载（预取线程和处理线程可能同时请求）
+            with self.download_lock(filename):
+                # 等待锁期间可能已被其他线程下载完成
+                cached_path = self.audio_cache.lookup(url, pin=pin)
+                if cached_path:
+                    logger.info(f"使用缓存文件: {cached_path}")
+                    return str(cached_path)
+                
+                # 总是重新下载，路径上残留的旧版按URL命名的文件会被覆盖（需要保留时先运行 manage_cache.py migrate）
+                logger.info(f"正在下载: {url}")
+                # 先下载到临时文件，中断后可续传，校验通过后原子重命名
+                download_to_file(self.http_session, url, file_path)
+                
+                # 按内容哈希存入缓存，相同内容的音频只保存一份
+                cached_path = self.audio_cache.add(url, file_path, pin=pin)
+                file_size = cached_path.stat().st_size
+                
+                logger.info(f"下载完成: {cached_path} (大小: {file_size} 字节)")
+                return str(cached_path)
             
         except Exception as e:
             logger.error(f"下载失败 {url}: {str(e)}")
@@ -205,7 +303,7 @@ class ImprovedAudioTranscriber:
     
     def upload_to_s3(self, local_file_path, bucket_name, s3_key):
         """
-        上传文件到S3
+        上传文件到S3，S3上已有相同内容的对象时跳过
         
         Args:
             local_file_path: 本地文件路径
@@ -218,16 +316,79 @@ class ImprovedAudioTranscriber:
         try:
             logger.info(f"正在上传到S3: {s3_key}")
             
-            self.s3_client.upload_file(local_file_path, bucket_name, s3_key)
+            # 相同内容的对象已存在时跳过上传
+            uploaded = self.s3_uploader.upload(local_file_path, bucket_name, s3_key)
             s3_uri = f"s3://{bucket_name}/{s3_key}"
             
-            logger.info(f"上传完成: {s3_uri}")
+            if uploaded:
+                logger.info(f"上传完成: {s3_uri}")
             return s3_uri
             
         except Exception as e:
             logger.error(f"S3上传失败: {str(e)}")
             return None
     
+    def stream_audio_to_s3(self, url, bucket_name, s3_folder_prefix=''):
+        """
+        不经过本地缓存，把音频从源地址直接流式上传到S3
+        
+        先分片上传到临时对象并同时计算SHA-256，再服务端复制到以内容哈希命名的对象键，
+        URL、哈希和上传记录写入缓存清单，之后的运行可以直接跳过
+        
+        Args:
+            url: 音频文件URL
+            bucket_name: S3存储桶名称
+            s3_folder_prefix: S3文件夹前缀
+            
+        Returns:
+            str: S3 URI，如果失败返回None
+        """
+        try:
+            cached_filename = self.get_cached_filename(url)
+            ext = Path(cached_filename).suffix or '.mp3'
+            
+            # 清单中已记录该URL的内容上传到了该桶时直接使用
+            digest = self.audio_cache.url_digest(url)
+            if digest:
+                s3_key = self.get_s3_key(f"{digest}{ext}", s3_folder_prefix)
+                if self.audio_cache.is_uploaded(digest, bucket_name, s3_key):
+                    logger.info(f"清单中已记录上传，跳过: {s3_key}")
+                    return f"s3://{bucket_name}/{s3_key}"
+            
+            logger.info(f"正在流式上传到S3: {url}")
+            # 临时对象键每次上传唯一，重复的URL同时上传时不会互相覆盖或删除对方的临时对象
+            temp_key = self.get_s3_key(f"incoming_{uuid.uuid4().hex}_{cached_filename}", s3_folder_prefix)
+            with self.http_session.get(url, stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                digest, size = self.s3_uploader.upload_stream(response.raw, bucket_name, temp_key)
+            
+            s3_key = self.get_s3_key(f"{digest}{ext}", s3_folder_prefix)
+            self.s3_uploader.promote(bucket_name, temp_key, s3_key, digest, size)
+            self.audio_cache.record_remote(url, digest, bucket_name, s3_key, size)
+            
+            s3_uri = f"s3://{bucket_name}/{s3_key}"
+            logger.info(f"流式上传完成: {s3_uri} (大小: {size} 字节)")
+            return s3_uri
+            
+        except Exception as e:
+            logger.error(f"流式上传失败 {url}: {str(e)}")
+            return None
+    
+    def submit_upload(self, local_file_path, bucket_name, s3_key):
+        """
+        在后台上传文件到S3，不阻塞调用方
+        
+        Args:
+            local_file_path: 本地文件路径
+            bucket_name: S3存储桶名称
+            s3_key: S3对象键
+            
+        Returns:
+            Future: 结果为S3 URI，上传失败时为None
+        """
+        return self.s3_uploader.executor.submit(self.upload_to_s3, local_file_path, bucket_name, s3_key)
+    
     def start_transcription_job(self, job_name, s3_uri):
         """
         启动AWS Transcribe转录任务
@@ -242,17 +403,24 @@ class ImprovedAudioTranscriber:
         try:
             logger.info(f"启动转录任务: {job_name}")
             
+            # 结果写入自有存储桶，以音频内容哈希命名
+            output_args = {}
+            if self.transcript_store:
+                output_args = {
+                    'OutputBucketName': self.transcript_store.bucket,
+                    'OutputKey': self.transcript_store.output_key(s3_uri)
+                }
+            
             # 启动转录任务，设置为墨西哥西班牙语（使用美国西班牙语识别）
-            self.transcribe_client.start_transcription_job(
+            self.rate_limiter.call(
+                'start_transcription_job',
+                self.transcribe_client.start_transcription_job,
                 TranscriptionJobName=job_name,
                 Media={'MediaFileUri': s3_uri},
-                MediaFormat='mp3',
-                LanguageCode='es-US',  # 美国西班牙语
-                Settings={
-                    'ShowSpeakerLabels': True,  # 显示说话人标签
-                    'MaxSpeakerLabels': 10,     # 最多10个说话人
-                    'ChannelIdentification': True  # 启用声道识别
-                }
+                MediaFormat=self.media_format,
+                LanguageCode=self.language_code,
+                Settings=self.transcribe_settings,
+                **output_args
             )
             
             logger.info(f"转录任务已启动: {job_name}")
@@ -262,44 +430,98 @@ class ImprovedAudioTranscriber:
             logger.error(f"启动转录任务失败: {str(e)}")
             return False
     
-    def wait_for_transcription_completion(self, job_name, max_wait_time=1800):
+    def result_cache_settings(self):
+        """返回影响转录结果的任务设置，作为结果缓存键的一部分"""
+        return {'MediaFormat': self.media_format, 'Settings': self.transcribe_settings}
+    
+    def get_cached_result(self, s3_uri):
+        """
+        查找相同音频、相同任务设置的已缓存转录结果
+        
+        Args:
+            s3_uri: S3音频文件URI（以内容哈希命名）
+            
+        Returns:
+            dict: 转录结果JSON，未缓存时返回None
+        """
+        try:
+            transcript_data = self.result_cache.get(audio_digest(s3_uri), self.language_code,
+                                                    self.result_cache_settings())
+            if transcript_data is not None:
+                logger.info(f"使用缓存的转录结果，不启动转录任务: {s3_uri}")
+            return transcript_data
+        except Exception as e:
+            logger.error(f"读取转录结果缓存失败: {str(e)}")
+            return None
+    
+    def cache_result(self, s3_uri, transcript_data, job_name=None):
+        """
+        保存转录结果到结果缓存
+        
+        Args:
+            s3_uri: S3音频文件URI（以内容哈希命名），也可以直接传入内容哈希
+            transcript_data: 转录结果JSON（或流式解析时的临时文件）
+            job_name: 转录任务名称
+        """
+        try:
+            if isinstance(transcript_data, SpooledTranscript):
+                # 从临时文件按块写入，不解析，也不把整个结果读入内存
+                self.result_cache.put_file(audio_digest(s3_uri), self.language_code, self.result_cache_settings(),
+                                           transcript_data.path, job_name)
+                return
+            self.result_cache.put(audio_digest(s3_uri), self.language_code, self.result_cache_settings(),
+                                  transcript_data, job_name)
+        except Exception as e:
+            logger.error(f"保存转录结果缓存失败: {str(e)}")
+    
+    def estimate_audio_duration(self, call_seconds=None, local_file_path=None):
+        """
+        估算音频时长，用于规划转录任务的轮询时间
+        
+        Args:
+            call_seconds: CSV中的call_seconds字段，优先使用
+            local_file_path: 本地音频文件路径，没有call_seconds时读取MP3文件头
+            
+        Returns:
+            float: 时长（秒），无法获取时返回None
+        """
+        try:
+            if call_seconds is not None and call_seconds == call_seconds and float(call_seconds) > 0:
+                return float(call_seconds)
+        except (TypeError, ValueError):
+            pass
+        
+        if local_file_path:
+            return get_mp3_duration(local_file_path)
+        return None
+    
+    def wait_for_transcription_completion(self, job_name, max_wait_time=1800, expected_duration=None,
+                                          check_now=False):
         """
         等待转录任务完成
         
         Args:
             job_name: 转录任务名称
             max_wait_time: 最大等待时间（秒），默认30分钟
+            expected_duration: 音频时长（秒），用于规划首次检查时间和退避间隔
+            check_now: 为True时立即检查一次（重新关联上次运行提交的任务）
             
         Returns:
             dict: 转录结果，如果失败返回None
         """
         logger.info(f"等待转录任务完成: {job_name}")
         
-        start_time = time.time()
+        # 由共享的任务跟踪器批量刷新状态，这里只等待结果
+        job = self.job_tracker.wait(job_name, timeout=max_wait_time, expected_duration=expected_duration,
+                                    check_now=check_now)
+        if job is None:
+            return None
         
-        while time.time() - start_time < max_wait_time:
-            try:
-                response = self.transcribe_client.get_transcription_job(
-                    TranscriptionJobName=job_name
-                )
-                
-                status = response['TranscriptionJob']['TranscriptionJobStatus']
-                
-                if status == 'COMPLETED':
-                    logger.info(f"转录任务完成: {job_name}")
-                    return response['TranscriptionJob']
-                elif status == 'FAILED':
-                    logger.error(f"转录任务失败: {job_name}")
-                    return None
-                else:
-                    logger.info(f"转录任务状态: {status}, 继续等待...")
-                    time.sleep(30)  # 等待30秒后再次检查
-                    
-            except Exception as e:
-                logger.error(f"检查转录任务状态失败: {str(e)}")
-                return None
+        if job['TranscriptionJobStatus'] == 'COMPLETED':
+            logger.info(f"转录任务完成: {job_name}")
+            return job
         
-        logger.error(f"转录任务超时: {job_name}")
+        logger.error(f"转录任务失败: {job_name}")
         return None
     
     def download_transcript(self, transcript_uri):
@@ -310,12 +532,24 @@ class ImprovedAudioTranscriber:
             transcript_uri: 转录结果URI
             
         Returns:
-            dict: 转录结果JSON，如果失败返回None
+            dict: 转录结果JSON，流式解析时为未解析的临时文件（SpooledTranscript），如果失败返回None
         """
         try:
             logger.info(f"下载转录结果: {transcript_uri}")
             
-            response = requests.get(transcript_uri)
+            # 自有存储桶中的结果通过S3客户端读取
+            output_key = self.transcript_store.owns(transcript_uri) if self.transcript_store else None
+            if output_key:
+                if self.stream_parse:
+                    return self.transcript_store.fetch_to_file(output_key, self.spool_dir)
+                return self.transcript_store.fetch(output_key)
+            
+            if self.stream_parse:
+                with self.http_session.get(transcript_uri, stream=True) as response:
+                    response.raise_for_status()
+                    return SpooledTranscript.from_chunks(response.iter_content(SPOOL_CHUNK_SIZE), self.spool_dir)
+            
+            response = self.http_session.get(transcript_uri)
             response.raise_for_status()
             
             return response.json()
@@ -329,109 +563,166 @@ class ImprovedAudioTranscriber:
         保存转录结果到文件，并更新映射信息
         
         Args:
-            transcript_data: 转录结果数据
+            transcript_data: 转录结果数据（或流式解析时的临时文件）
             json_output_file: JSON输出文件路径
             txt_output_file: TXT输出文件路径
             mapping_info: 映射信息
+            
+        Returns:
+            bool: 是否保存成功
         """
+        if isinstance(transcript_data, SpooledTranscript):
+            spooled = transcript_data
+            try:
+                if self.save_transcript_stream(spooled, json_output_file, txt_output_file, mapping_info):
+                    return True
+                # 结构不是常见的形式时按原有方式一次性解析
+                transcript_data = spooled.load()
+            except Exception as e:
+                logger.error(f"保存转录结果失败: {str(e)}")
+                return False
+            finally:
+                spooled.discard()
+        
         try:
-            # 提取转录文本
-            results_data = transcript_data['results']
-            if isinstance(results_data, list) and len(results_data) > 0:
-                results_data = results_data[0]
-            transcript_text = results_data['transcripts'][0]['transcript']
-            
-            # 提取说话人信息（如果有）
-            speaker_segments = []
-            if 'speaker_labels' in results_data and 'segments' in results_data['speaker_labels']:
-                for segment in results_data['speaker_labels']['segments']:
-                    speaker_segments.append({
-                        'speaker': segment['speaker_label'],
-                        'start_time': segment['start_time'],
-                        'end_time': segment['end_time'],
-                        'items': segment.get('items', [])
-                    })
-            
-            # 提取声道信息（如果有）
-            channel_segments = []
-            if 'channel_labels' in results_data:
-                for channel in results_data['channel_labels']['channels']:
-                    channel_segments.append({
-                        'channel': channel['channel_label'],
-                        'items': channel['items']
-                    })
+            # 提取转录文本、说话人信息和声道信息（如果有）
+            transcript_text, speaker_segments, channel_segments = build_sections(transcript_data)
             
             # 创建带标签的转录文本
             labeled_transcript = self.create_labeled_transcript(transcript_data)
             
-            # 保存JSON结果（包含映射信息）
-            result = {
-                'mapping_info': mapping_info,  # 添加映射信息到JSON文件中
-                'transcript': transcript_text,
-                'labeled_transcript': labeled_transcript,
-                'speaker_segments': speaker_segments,
-                'channel_segments': channel_segments,
-                'full_result': transcript_data
-            }
-            
-            with open(json_output_file, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
+            if self.transcript_format == 'compact':
+                write_compact_transcript(json_output_file, mapping_info, labeled_transcript,
+                                         [result_bytes(transcript_data)], self.transcript_compression)
+            else:
+                # 保存JSON结果（包含映射信息）
+                result = {
+                    'mapping_info': mapping_info,  # 添加映射信息到JSON文件中
+                    'transcript': transcript_text,
+                    'labeled_transcript': labeled_transcript,
+                    'speaker_segments': speaker_segments,
+                    'channel_segments': channel_segments,
+                    'full_result': transcript_data
+                }
+                
+                with open(json_output_file, 'w', encoding='utf-8') as f:
+                    json.dump(result, f, ensure_ascii=False, indent=2)
             
             logger.info(f"转录结果已保存: {json_output_file}")
             
             # 保存格式化的文本版本
-            with open(txt_output_file, 'w', encoding='utf-8') as f:
-                # 添加文件头信息，说明对应关系
-                f.write("=== 文件对应关系 ===\n")
-                f.write(f"CSV行号: {mapping_info['csv_row_index']}\n")
-                if mapping_info['call_id']:
-                    f.write(f"催收外呼ID: {mapping_info['call_id']}\n")
-                if mapping_info['customer_id']:
-                    f.write(f"客户号: {mapping_info['customer_id']}\n")
-                f.write(f"处理时间: {mapping_info['processed_time']}\n")
-                f.write(f"音频URL: {mapping_info['audio_url']}\n")
-                f.write("\n")
-                
-                f.write("=== 带标签的转录文本（推荐用于分析） ===\n")
-                f.write(labeled_transcript + "\n\n")
-                
-                f.write("=== 原始完整转录文本 ===\n")
-                f.write(transcript_text + "\n\n")
-                
-                # 添加说话人分段信息（带时间戳）
-                if speaker_segments:
-                    f.write("=== 按说话人分段（详细时间） ===\n")
-                    for segment in speaker_segments:
-                        start_time = float(segment['start_time'])
-                        end_time = float(segment['end_time'])
-                        
-                        # 格式化时间
-                        start_min = int(start_time // 60)
-                        start_sec = start_time % 60
-                        end_min = int(end_time // 60)
-                        end_sec = end_time % 60
-                        
-                        time_str = f"[{start_min:02d}:{start_sec:05.2f} - {end_min:02d}:{end_sec:05.2f}]"
-                        
-                        # 获取这个时间段的文本
-                        segment_text = ""
-                        for item in segment['items']:
-                            if 'alternatives' in item and len(item['alternatives']) > 0:
-                                segment_text += item['alternatives'][0]['content'] + " "
-                        
-                        # 使用友好的说话人名称
-                        speaker_name = self.get_speaker_name(segment['speaker'])
-                        f.write(f"{speaker_name} {time_str}: {segment_text.strip()}\n")
+            self.write_transcript_text(txt_output_file, mapping_info, labeled_transcript, transcript_text,
+                                       [self.format_segment_line(segment) for segment in speaker_segments])
             
             logger.info(f"格式化文本已保存: {txt_output_file}")
             
-            # 更新映射记录
-            file_key = mapping_info['json_file']
-            self.file_mapping[file_key] = mapping_info
-            self.save_mapping()
+            # 更新映射记录（单条写入）
+            self.mapping_store.upsert(mapping_info)
+            return True
             
         except Exception as e:
             logger.error(f"保存转录结果失败: {str(e)}")
+            return False
+    
+    def save_transcript_stream(self, source, json_output_file, txt_output_file, mapping_info):
+        """
+        流式解析并保存转录结果，输出文件与 save_transcript 一致
+        
+        Args:
+            source: SpooledTranscript
+            json_output_file: JSON输出文件路径
+            txt_output_file: TXT输出文件路径
+            mapping_info: 映射信息
+            
+        Returns:
+            bool: 是否已保存；结构不是常见的形式时返回False，由调用方一次性解析
+        """
+        try:
+            summary = summarize(source, self.label_resolver.speaker, self.format_segment_line)
+            transcript_text = summary.transcript_text
+            labeled_transcript = "\n\n".join(summary.labeled_lines(self.label_resolver.speaker, self.label_resolver.channel))
+            if self.transcript_format == 'compact':
+                # 原始结果不经解析直接写入
+                write_compact_transcript(json_output_file, mapping_info, labeled_transcript,
+                                         source.chunks(), self.transcript_compression)
+            else:
+                write_transcript_json(source, summary, json_output_file, mapping_info, labeled_transcript)
+        except Exception as e:
+            logger.info(f"流式解析转录结果失败，改为一次性解析: {str(e)}")
+            return False
+        
+        logger.info(f"转录结果已保存: {json_output_file}")
+        self.write_transcript_text(txt_output_file, mapping_info, labeled_transcript, transcript_text,
+                                   summary.segment_outputs)
+        logger.info(f"格式化文本已保存: {txt_output_file}")
+        self.mapping_store.upsert(mapping_info)
+        return True
+    
+    def format_segment_line(self, segment):
+        """
+        生成说话人片段在TXT文件中的一行（带时间）
+        
+        Args:
+            segment: 说话人片段（speaker、start_time、end_time、items）
+            
+        Returns:
+            str: 以换行结尾的文本行
+        """
+        start_time = float(segment['start_time'])
+        end_time = float(segment['end_time'])
+        
+        # 格式化时间
+        start_min = int(start_time // 60)
+        start_sec = start_time % 60
+        end_min = int(end_time // 60)
+        end_sec = end_time % 60
+        
+        time_str = f"[{start_min:02d}:{start_sec:05.2f} - {end_min:02d}:{end_sec:05.2f}]"
+        
+        # 获取这个时间段的文本
+        segment_text = ""
+        for item in segment['items']:
+            if 'alternatives' in item and len(item['alternatives']) > 0:
+                segment_text += item['alternatives'][0]['content'] + " "
+        
+        # 使用友好的说话人名称
+        speaker_name = self.label_resolver.speaker(segment['speaker'])
+        return f"{speaker_name} {time_str}: {segment_text.strip()}\n"
+    
+    def write_transcript_text(self, txt_output_file, mapping_info, labeled_transcript, transcript_text, segment_lines):
+        """
+        保存格式化的文本版本
+        
+        Args:
+            txt_output_file: TXT输出文件路径
+            mapping_info: 映射信息
+            labeled_transcript: 带标签的转录文本
+            transcript_text: 原始完整转录文本
+            segment_lines: 按说话人分段的文本行
+        """
+        with open(txt_output_file, 'w', encoding='utf-8') as f:
+            # 添加文件头信息，说明对应关系
+            f.write("=== 文件对应关系 ===\n")
+            f.write(f"CSV行号: {mapping_info['csv_row_index']}\n")
+            if mapping_info['call_id']:
+                f.write(f"催收外呼ID: {mapping_info['call_id']}\n")
+            if mapping_info['customer_id']:
+                f.write(f"客户号: {mapping_info['customer_id']}\n")
+            f.write(f"处理时间: {mapping_info['processed_time']}\n")
+            f.write(f"音频URL: {mapping_info['audio_url']}\n")
+            f.write("\n")
+            
+            f.write("=== 带标签的转录文本（推荐用于分析） ===\n")
+            f.write(labeled_transcript + "\n\n")
+            
+            f.write("=== 原始完整转录文本 ===\n")
+            f.write(transcript_text + "\n\n")
+            
+            # 添加说话人分段信息（带时间戳）
+            if segment_lines:
+                f.write("=== 按说话人分段（详细时间） ===\n")
+                for line in segment_lines:
+                    f.write(line)
     
     def get_speaker_name(self, speaker_label):
         """
@@ -443,23 +734,7 @@ class ImprovedAudioTranscriber:
         Returns:
             str: 友好的说话人名称
         """
-        # 从环境变量读取自定义标签
-        speaker_0_label = os.getenv('SPEAKER_0_LABEL', '客服')
-        speaker_1_label = os.getenv('SPEAKER_1_LABEL', '客户')
-        
-        speaker_mapping = {
-            'spk_0': f'[{speaker_0_label}]',
-            'spk_1': f'[{speaker_1_label}]', 
-            'spk_2': '[说话人3]',
-            'spk_3': '[说话人4]',
-            'spk_4': '[说话人5]',
-            'spk_5': '[说话人6]',
-            'spk_6': '[说话人7]',
-            'spk_7': '[说话人8]',
-            'spk_8': '[说话人9]',
-            'spk_9': '[说话人10]'
-        }
-        return speaker_mapping.get(speaker_label, f'[{speaker_label}]')
+        return self.label_resolver.speaker(speaker_label)
     
     def create_labeled_transcript(self, transcript_data):
         """
@@ -472,128 +747,7 @@ class ImprovedAudioTranscriber:
             str: 带标签的转录文本
         """
         try:
-            labeled_lines = []
-            
-            # 处理results可能是列表的情况
-            results_data = transcript_data['results']
-            if isinstance(results_data, list) and len(results_data) > 0:
-                results_data = results_data[0]
-            
-            logger.info(f"数据结构检查: results类型={type(results_data)}")
-            
-            # 优先使用说话人标签
-            if isinstance(results_data, dict) and 'speaker_labels' in results_data:
-                logger.info("使用说话人标签进行分段")
-                speaker_labels = results_data['speaker_labels']
-                
-                if isinstance(speaker_labels, dict) and 'segments' in speaker_labels:
-                    segments = speaker_labels['segments']
-                    logger.info(f"找到 {len(segments)} 个说话人片段")
-                    
-                    for segment in segments:
-                        speaker_label = segment.get('speaker_label', 'unknown')
-                        speaker_name = self.get_speaker_name(speaker_label)
-                        
-                        # 获取这个时间段的文本
-                        segment_text = ""
-                        if 'items' in segment:
-                            for item in segment['items']:
-                                if isinstance(item, dict) and 'alternatives' in item:
-                                    if len(item['alternatives']) > 0:
-                                        content = item['alternatives'][0].get('content', '')
-                                        if item.get('type') == 'punctuation':
-                                            segment_text = segment_text.rstrip() + content + " "
-                                        else:
-                                            segment_text += content + " "
-                        
-                        if segment_text.strip():
-                            labeled_lines.append(f"{speaker_name}: {segment_text.strip()}")
-            
-            # 如果没有说话人标签，使用声道标签
-            elif isinstance(results_data, dict) and 'channel_labels' in results_data:
-                logger.info("使用声道标签进行分段")
-                channel_labels = results_data['channel_labels']
-                
-                if isinstance(channel_labels, dict) and 'channels' in channel_labels:
-                    channels = channel_labels['channels']
-                    logger.info(f"找到 {len(channels)} 个声道")
-                    
-                    # 收集所有带时间戳的词汇
-                    all_items = []
-                    for channel in channels:
-                        channel_label = channel.get('channel_label', 'unknown')
-                        channel_name = self.get_channel_name(channel_label)
-                        
-                        if 'items' in channel:
-                            for item in channel['items']:
-                                if (isinstance(item, dict) and 
-                                    item.get('type') == 'pronunciation' and 
-                                    'start_time' in item and 
-                                    'alternatives' in item and
-                                    len(item['alternatives']) > 0):
-                                    
-                                    all_items.append({
-                                        'start_time': float(item['start_time']),
-                                        'content': item['alternatives'][0].get('content', ''),
-                                        'channel': channel_name
-                                    })
-                    
-                    logger.info(f"收集到 {len(all_items)} 个词汇项目")
-                    
-                    if all_items:
-                        # 按时间排序
-                        all_items.sort(key=lambda x: x['start_time'])
-                        
-                        # 按声道分组连续的文本
-                        current_channel = None
-                        current_text = ""
-                        
-                        for item in all_items:
-                            if item['channel'] != current_channel:
-                                # 保存前一个声道的文本
-                                if current_text.strip():
-                                    labeled_lines.append(f"{current_channel}: {current_text.strip()}")
-                                
-                                # 开始新的声道
-                                current_channel = item['channel']
-                                current_text = item['content'] + " "
-                            else:
-                                current_text += item['content'] + " "
-                        
-                        # 保存最后一个声道的文本
-                        if current_text.strip():
-                            labeled_lines.append(f"{current_channel}: {current_text.strip()}")
-            
-            # 如果都没有，尝试从原始转录文本创建简单标签
-            if not labeled_lines:
-                logger.info("未找到说话人或声道标签，尝试简单分段")
-                
-                # 获取原始转录文本
-                original_text = ""
-                if isinstance(results_data, dict) and 'transcripts' in results_data:
-                    transcripts = results_data['transcripts']
-                    if len(transcripts) > 0:
-                        original_text = transcripts[0].get('transcript', '')
-                
-                if original_text:
-                    # 简单的句子分割 - 按句号、问号、感叹号分割
-                    import re
-                    sentences = re.split(r'[.!?。！？]+', original_text)
-                    
-                    # 交替分配给两个说话人
-                    for i, sentence in enumerate(sentences):
-                        sentence = sentence.strip()
-                        if sentence:
-                            speaker = self.get_speaker_name('spk_0') if i % 2 == 0 else self.get_speaker_name('spk_1')
-                            labeled_lines.append(f"{speaker}: {sentence}")
-                
-                if not labeled_lines:
-                    labeled_lines.append(f"[未识别说话人]: {original_text}")
-            
-            result = "\n\n".join(labeled_lines)
-            logger.info(f"最终生成 {len(labeled_lines)} 个标签片段")
-            return result
-            
+            return build_labeled_transcript(transcript_data, self.label_resolver.speaker, self.label_resolver.channel)
         except Exception as e:
             logger.error(f"创建带标签转录失败: {str(e)}")
             # 返回原始文本作为备选
@@ -619,15 +773,202 @@ class ImprovedAudioTranscriber:
         Returns:
             str: 友好的声道名称
         """
-        channel_mapping = {
-            'ch_0': '[声道1-客服]',
-            'ch_1': '[声道2-客户]',
-            'ch_2': '[声道3]',
-            'ch_3': '[声道4]'
-        }
-        return channel_mapping.get(channel_label, f'[{channel_label}]')
+        return self.label_resolver.channel(channel_label)
+    
+    def load_valid_rows(self, csv_file, audio_column='通话录音', limit=None, start_from=0):
+        """
+        读取CSV文件并筛选出需要处理的记录
+        
+        Args:
+            csv_file: CSV文件路径
+            audio_column: 音频URL列名
+            limit: 处理的最大行数，None表示处理所有行
+            start_from: 从第几条记录开始处理
+            
+        Returns:
+            DataFrame: 待处理的记录，如果失败返回None
+        """
+        # 读取CSV文件（只读取处理需要的列）
+        logger.info(f"读取CSV文件: {csv_file}")
+        df = load_csv(csv_file, processing_columns(audio_column))
+        
+        if audio_column not in df.columns:
+            logger.error(f"CSV文件中未找到列: {audio_column}")
+            return None
+        
+        # 过滤有效的URL
+        valid_urls = df[df[audio_column].notna() & (df[audio_column] != '')]
+        total_records = len(valid_urls)
+        
+        logger.info(f"找到 {total_records} 个有效的音频URL")
+        
+        # 支持断点续传：从指定位置开始处理
+        if start_from > 0:
+            valid_urls = valid_urls.iloc[start_from:]
+            logger.info(f"从第 {start_from + 1} 条记录开始处理")
+        
+        if limit:
+            valid_urls = valid_urls.head(limit)
+            logger.info(f"限制处理数量为 {limit} 条")
+        
+        logger.info(f"实际处理 {len(valid_urls)} 条记录")
+        return valid_urls
+    
+    def open_rows(self, csv_file, audio_column='通话录音', limit=None, start_from=0, stream_csv=False):
+        """
+        打开待处理的记录
+        
+        流式读取时逐条解析CSV，内存占用与文件大小无关，读到第一条记录就可以开始处理；
+        start_from 通过CSV检查点中保存的字节偏移直接定位
+        
+        Args:
+            csv_file: CSV文件路径
+            audio_column: 音频URL列名
+            limit: 处理的最大行数，None表示处理所有行
+            start_from: 从第几条记录开始处理
+            stream_csv: 是否流式读取
+            
+        Returns:
+            tuple: (DataFrame, (CSV行号, 行数据)迭代器)，流式读取时DataFrame为None；读取失败时返回 (None, None)
+        """
+        if stream_csv:
+            logger.info(f"流式读取CSV文件: {csv_file}")
+            return None, stream_valid_rows(csv_file, audio_column, limit, start_from)
+        valid_urls = self.load_valid_rows(csv_file, audio_column, limit, start_from)
+        if valid_urls is None:
+            return None, None
+        return valid_urls, valid_urls.iterrows()
     
-    def process_csv_file(self, csv_file, s3_bucket, s3_folder_prefix='', audio_column='通话录音', limit=None, start_from=0):
+    def enable_s3_output(self, s3_bucket, s3_folder_prefix=''):
+        """
+        让转录任务把结果写入自有存储桶，并列出已有的结果
+        
+        Args:
+            s3_bucket: S3存储桶名称
+            s3_folder_prefix: S3文件夹前缀，结果保存在 <前缀>transcripts/ 下
+        """
+        settings_tag = settings_hash({'LanguageCode': self.language_code, **self.result_cache_settings()})[:16]
+        self.transcript_store = TranscriptOutputStore(self.s3_client, s3_bucket, s3_folder_prefix, settings_tag,
+                                                      rate_limiter=self.rate_limiter)
+        count = self.transcript_store.load_index()
+        logger.info(f"转录结果输出到 s3://{s3_bucket}/{self.transcript_store.prefix}，已有 {count} 个结果")
+    
+    def harvest_completed_rows(self, valid_urls, audio_column='通话录音'):
+        """
+        批量取回已在S3中完成、但本地还没有输出文件的记录
+        
+        上次运行崩溃时已完成的任务结果仍在存储桶中，按音频内容哈希和当前设置匹配后并行下载，每个结果下载后立即保存，
+        不需要重新轮询或提交任务
+        
+        Args:
+            valid_urls: 待处理的记录（DataFrame）
+            audio_column: 音频URL列名
+            
+        Returns:
+            int: 取回的记录数
+        """
+        if not self.transcript_store or not self.transcript_store.index:
+            return 0
+        
+        pending = []
+        for original_index, row in valid_urls.iterrows():
+            json_filename, txt_filename, mapping_info = self.generate_output_filename(row, original_index)
+            json_output_file = self.transcripts_dir / json_filename
+            txt_output_file = self.transcripts_dir / txt_filename
+            if json_output_file.exists() and txt_output_file.exists():
+                continue
+            digest = self.audio_cache.url_digest(row[audio_column])
+            key = self.transcript_store.find(digest)
+            if key:
+                pending.append((key, digest, json_output_file, txt_output_file, mapping_info))
+        
+        if not pending:
+            return 0
+        
+        logger.info(f"从S3取回 {len(pending)} 条已完成的转录结果")
+        
+        def harvest_one(item):
+            # 每个结果下载后立即保存，不在内存中积累整批结果
+            key, digest, json_output_file, txt_output_file, mapping_info = item
+            try:
+                if self.stream_parse:
+                    transcript_data = self.transcript_store.fetch_to_file(key, self.spool_dir)
+                else:
+                    transcript_data = self.transcript_store.fetch(key)
+            except Exception as e:
+                logger.error(f"读取转录结果失败 {key}: {str(e)}")
+                return False
+            # 取回的结果同时写入结果缓存
+            self.cache_result(digest, transcript_data)
+            return self.save_transcript(transcript_data, json_output_file, txt_output_file, mapping_info)
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.transcript_store.workers)) as pool:
+            harvested = sum(pool.map(harvest_one, pending))
+        logger.info(f"已取回 {harvested} 条转录结果")
+        return harvested
+    
+    def apply_cache_limit(self, max_cache_bytes):
+        """
+        设置音频缓存容量上限并立即淘汰超出的部分
+        
+        Args:
+            max_cache_bytes: 容量上限（字节），None表示不限制
+        """
+        if max_cache_bytes is None:
+            return
+        self.audio_cache.max_bytes = max_cache_bytes
+        self.audio_cache.evict()
+    
+    def prefetch_urls(self, valid_urls, audio_column, s3_bucket):
+        """
+        按处理流程的跳过规则列出需要预取的音频URL
+        
+        已有输出文件、或作业日志中音频已上传到该存储桶的记录不会下载音频，不预取
+        
+        Args:
+            valid_urls: 待处理记录的DataFrame
+            audio_column: 音频URL列名
+            s3_bucket: S3存储桶名称
+            
+        Returns:
+            list: 与处理顺序一一对应的URL列表，不需要预取的位置为None
+        """
+        urls = []
+        for original_index, row in valid_urls.iterrows():
+            audio_url = row[audio_column]
+            json_filename, txt_filename, _ = self.generate_output_filename(row, original_index)
+            if (self.transcripts_dir / json_filename).exists() and (self.transcripts_dir / txt_filename).exists():
+                urls.append(None)
+                continue
+            journal_entry = self.job_journal.get(original_index, audio_url)
+            urls.append(None if self.job_journal.uploaded_uri(journal_entry, s3_bucket) else audio_url)
+        return urls
+    
+    def start_prefetch(self, urls, prefetch_workers):
+        """
+        启动后台音频预取，在处理游标之前下载缓存中缺失的文件
+        
+        Args:
+            urls: 按处理顺序排列的音频URL列表，不需要预取的位置为None
+            prefetch_workers: 预取线程数，0表示不预取
+            
+        Returns:
+            AudioPrefetcher: 预取器，不预取时返回None
+        """
+        if not prefetch_workers:
+            return None
+        prefetcher = AudioPrefetcher(
+            self,
+            workers=prefetch_workers,
+            max_bytes=int(float(os.getenv('PREFETCH_MAX_GB', '2')) * 1024 ** 3),
+            lookahead=int(os.getenv('PREFETCH_LOOKAHEAD', '200'))
+        )
+        prefetcher.start(urls)
+        return prefetcher
+    
+    def process_csv_file(self, csv_file, s3_bucket, s3_folder_prefix='', audio_column='通话录音', limit=None, start_from=0,
+                         prefetch_workers=0, max_cache_bytes=None, no_local_cache=False, s3_output=False,
+                         stream_csv=False):
         """
         处理CSV文件中的音频URL
         
@@ -638,39 +979,37 @@ class ImprovedAudioTranscriber:
             audio_column: 音频URL列名，默认为'通话录音'
             limit: 处理的最大行数，None表示处理所有行
             start_from: 从第几条记录开始处理，用于断点续传
+            prefetch_workers: 后台预取音频的线程数，0表示不预取
+            max_cache_bytes: 音频缓存容量上限（字节），超过时淘汰最久未访问的文件，None表示不限制
+            no_local_cache: 为True时不下载到本地，音频从源地址直接流式上传到S3（不使用预取）
+            s3_output: 为True时转录结果写入S3_BUCKET中S3文件夹前缀下，并先取回已完成的结果
+            stream_csv: 为True时流式读取CSV（不批量取回已完成的结果，不使用预取）
         """
+        prefetcher = None
         try:
-            # 读取CSV文件
-            logger.info(f"读取CSV文件: {csv_file}")
-            df = pd.read_csv(csv_file)
-            
-            if audio_column not in df.columns:
-                logger.error(f"CSV文件中未找到列: {audio_column}")
+            valid_urls, rows = self.open_rows(csv_file, audio_column, limit, start_from, stream_csv)
+            if rows is None:
                 return
             
-            # 过滤有效的URL
-            valid_urls = df[df[audio_column].notna() & (df[audio_column] != '')]
-            total_records = len(valid_urls)
-            
-            logger.info(f"找到 {total_records} 个有效的音频URL")
-            
-            # 支持断点续传：从指定位置开始处理
-            if start_from > 0:
-                valid_urls = valid_urls.iloc[start_from:]
-                logger.info(f"从第 {start_from + 1} 条记录开始处理")
-            
-            if limit:
-                valid_urls = valid_urls.head(limit)
-                logger.info(f"限制处理数量为 {limit} 条")
-            
-            logger.info(f"实际处理 {len(valid_urls)} 条记录")
+            self.apply_cache_limit(max_cache_bytes)
+            if s3_output:
+                self.enable_s3_output(s3_bucket, s3_folder_prefix)
+                if valid_urls is not None:
+                    self.harvest_completed_rows(valid_urls, audio_column)
+            if no_local_cache or valid_urls is None:
+                prefetch_workers = 0
+            prefetcher = self.start_prefetch(self.prefetch_urls(valid_urls, audio_column, s3_bucket),
+                                             prefetch_workers) if prefetch_workers else None
             
             # 处理每个音频文件
             success_count = 0
             error_count = 0
             skip_count = 0
             
-            for idx, (original_index, row) in enumerate(valid_urls.iterrows()):
+            for idx, (original_index, row) in enumerate(rows):
+                if prefetcher:
+                    prefetcher.advance(idx)
+                local_file_path = None
                 try:
                     audio_url = row[audio_column]
                     current_position = start_from + idx + 1
@@ -688,48 +1027,77 @@ class ImprovedAudioTranscriber:
                         skip_count += 1
                         continue
                     
-                    # 下载音频文件（使用缓存）
-                    local_file_path = self.download_audio_file(audio_url)
-                    if not local_file_path:
-                        logger.warning(f"跳过CSV行号 {original_index}：下载失败")
-                        error_count += 1
-                        continue
-                    
-                    # 从本地文件路径获取文件名
-                    filename = Path(local_file_path).name
-                    
-                    # 上传到S3（使用指定的文件夹前缀）
-                    s3_key = f"{s3_folder_prefix}audio/{filename}" if s3_folder_prefix else f"transcribe-audio/{filename}"
-                    s3_uri = self.upload_to_s3(local_file_path, s3_bucket, s3_key)
-                    if not s3_uri:
-                        logger.warning(f"跳过CSV行号 {original_index}：S3上传失败")
-                        error_count += 1
-                        continue
+                    # 按作业日志恢复上次运行的进度：已上传的音频直接使用，已提交的任务重新关联
+                    journal_entry = self.job_journal.get(original_index, audio_url)
+                    s3_uri = self.job_journal.uploaded_uri(journal_entry, s3_bucket)
+                    resumed_job = self.job_journal.resumable_job(journal_entry)
+                    if s3_uri:
+                        logger.info(f"作业日志中已记录上传，跳过下载和上传: {s3_uri}")
+                    else:
+                        if no_local_cache:
+                            # 不经过本地磁盘，从源地址直接流式上传到S3
+                            s3_uri = self.stream_audio_to_s3(audio_url, s3_bucket, s3_folder_prefix)
+                        else:
+                            # 下载音频文件（使用缓存，处理完成前固定，不会被缓存淘汰）
+                            local_file_path = self.download_audio_file(audio_url, pin=True)
+                            if not local_file_path:
+                                logger.warning(f"跳过CSV行号 {original_index}：下载失败")
+                                error_count += 1
+                                continue
+                            self.job_journal.record(original_index, audio_url, 'downloaded',
+                                                    local_file_path=local_file_path)
+                            
+                            # 上传到S3（使用指定的文件夹前缀）
+                            s3_key = self.get_s3_key(local_file_path, s3_folder_prefix)
+                            s3_uri = self.upload_to_s3(local_file_path, s3_bucket, s3_key)
+                        if not s3_uri:
+                            logger.warning(f"跳过CSV行号 {original_index}：S3上传失败")
+                            error_count += 1
+                            continue
+                        self.job_journal.record(original_index, audio_url, 'uploaded', s3_uri=s3_uri)
                     
-                    # 启动转录任务（使用原始行号）
-                    job_name = f"transcribe-job-{original_index}-{int(time.time())}"
-                    if not self.start_transcription_job(job_name, s3_uri):
-                        logger.warning(f"跳过CSV行号 {original_index}：转录任务启动失败")
-                        error_count += 1
-                        continue
-                    
-                    # 等待转录完成
-                    job_result = self.wait_for_transcription_completion(job_name)
-                    if not job_result:
-                        logger.warning(f"跳过CSV行号 {original_index}：转录任务失败")
-                        error_count += 1
-                        continue
+                    # 相同音频和任务设置已转录过时直接使用缓存的结果，不启动转录任务
+                    transcript_data = None if resumed_job else self.get_cached_result(s3_uri)
+                    if transcript_data is None:
+                        job_name = resumed_job
+                        if job_name:
+                            logger.info(f"重新关联上次运行提交的转录任务: {job_name}")
+                        else:
+                            # 启动转录任务（使用原始行号）
+                            job_name = f"transcribe-job-{original_index}-{int(time.time())}"
+                            if not self.start_transcription_job(job_name, s3_uri):
+                                logger.warning(f"跳过CSV行号 {original_index}：转录任务启动失败")
+                                error_count += 1
+                                continue
+                            self.job_journal.record(original_index, audio_url, 'submitted', job_name=job_name)
+                        
+                        # 等待转录完成（按音频时长规划轮询，重新关联的任务立即检查）
+                        expected_duration = self.estimate_audio_duration(row.get('call_seconds'), local_file_path)
+                        job_result = self.wait_for_transcription_completion(
+                            job_name, expected_duration=expected_duration,
+                            check_now=job_name == resumed_job)
+                        if not job_result:
+                            self.job_journal.record(original_index, audio_url, 'failed', job_name=job_name)
+                            logger.warning(f"跳过CSV行号 {original_index}：转录任务失败")
+                            error_count += 1
+                            continue
+                        self.job_journal.record(original_index, audio_url, 'completed', job_name=job_name)
+                        
+                        # 下载转录结果
+                        transcript_uri = job_result['Transcript']['TranscriptFileUri']
+                        transcript_data = self.download_transcript(transcript_uri)
+                        if not transcript_data:
+                            logger.warning(f"跳过CSV行号 {original_index}：转录结果下载失败")
+                            error_count += 1
+                            continue
+                        self.cache_result(s3_uri, transcript_data, job_name)
                     
-                    # 下载转录结果
-                    transcript_uri = job_result['Transcript']['TranscriptFileUri']
-                    transcript_data = self.download_transcript(transcript_uri)
-                    if not transcript_data:
-                        logger.warning(f"跳过CSV行号 {original_index}：转录结果下载失败")
+                    # 保存转录结果（使用改进的文件名），保存失败时不记录persisted，下次运行重新保存
+                    if not self.save_transcript(transcript_data, json_output_file, txt_output_file, mapping_info):
+                        logger.warning(f"跳过CSV行号 {original_index}：转录结果保存失败")
                         error_count += 1
                         continue
-                    
-                    # 保存转录结果（使用改进的文件名）
-                    self.save_transcript(transcript_data, json_output_file, txt_output_file, mapping_info)
+                    self.job_journal.record(original_index, audio_url, 'persisted')
                     
                     success_count += 1
                     logger.info(f"CSV行号 {original_index} 处理完成，输出文件: {json_filename}, {txt_filename}")
@@ -742,13 +1110,94 @@ class ImprovedAudioTranscriber:
                     logger.error(f"处理CSV行号 {original_index} 时出错: {str(e)}")
                     error_count += 1
                     continue
+                finally:
+                    if local_file_path:
+                        self.audio_cache.unpin(local_file_path)
             
             logger.info(f"所有文件处理完成")
             logger.info(f"最终统计: 成功 {success_count}, 跳过 {skip_count}, 失败 {error_count}")
+            self.save_mapping()
+            logger.info(f"文件映射信息已保存到: {self.mapping_file}")
+            
+        except Exception as e:
+            logger.error(f"处理CSV文件失败: {str(e)}")
+        finally:
+            # 中途出错时也要停止预取线程，并等待后台上传完成、关闭S3传输管理器的线程
+            if prefetcher:
+                prefetcher.stop()
+            self.s3_uploader.shutdown()
+    
+    def process_csv_file_pipelined(self, csv_file, s3_bucket, s3_folder_prefix='', audio_column='通话录音',
+                                   limit=None, start_from=0, download_workers=4, upload_workers=4,
+                                   submit_workers=2, max_in_flight=50, persist_workers=4, queue_size=50,
+                                   prefetch_workers=0, max_cache_bytes=None, no_local_cache=False,
+                                   s3_output=False, stream_csv=False):
+        """
+        以并发流水线方式处理CSV文件中的音频URL
+        
+        下载、上传、提交、轮询、保存各阶段独立运行，阶段之间通过有界队列连接，
+        输出文件名和跳过规则与process_csv_file一致
+        
+        Args:
+            csv_file: CSV文件路径
+            s3_bucket: S3存储桶名称
+            s3_folder_prefix: S3文件夹前缀
+            audio_column: 音频URL列名，默认为'通话录音'
+            limit: 处理的最大行数，None表示处理所有行
+            start_from: 从第几条记录开始处理，用于断点续传
+            download_workers: 下载线程数
+            upload_workers: 上传线程数
+            submit_workers: 提交任务线程数
+            max_in_flight: 同时在运行的转录任务上限，轮询由共享任务跟踪器批量完成
+            persist_workers: 保存结果线程数
+            queue_size: 阶段之间队列的最大长度
+            prefetch_workers: 在下载阶段之前预取音频的线程数，0表示不预取
+            max_cache_bytes: 音频缓存容量上限（字节），超过时淘汰最久未访问的文件，None表示不限制
+            no_local_cache: 为True时不下载到本地，音频从源地址直接流式上传到S3（不使用预取）
+            s3_output: 为True时转录结果写入S3_BUCKET中S3文件夹前缀下，并先取回已完成的结果
+            stream_csv: 为True时流式读取CSV（不批量取回已完成的结果，不使用预取）
+        """
+        prefetcher = None
+        try:
+            valid_urls, rows = self.open_rows(csv_file, audio_column, limit, start_from, stream_csv)
+            if rows is None:
+                return
+            
+            self.apply_cache_limit(max_cache_bytes)
+            if s3_output:
+                self.enable_s3_output(s3_bucket, s3_folder_prefix)
+                if valid_urls is not None:
+                    self.harvest_completed_rows(valid_urls, audio_column)
+            if no_local_cache or valid_urls is None:
+                prefetch_workers = 0
+            prefetcher = self.start_prefetch(self.prefetch_urls(valid_urls, audio_column, s3_bucket),
+                                             prefetch_workers) if prefetch_workers else None
+            
+            pipeline = TranscriptionPipeline(
+                self, s3_bucket, s3_folder_prefix,
+                download_workers=download_workers,
+                upload_workers=upload_workers,
+                submit_workers=submit_workers,
+                max_in_flight=max_in_flight,
+                persist_workers=persist_workers,
+                queue_size=queue_size,
+                prefetcher=prefetcher,
+                stream_to_s3=no_local_cache
+            )
+            stats = pipeline.run(rows, start_from=start_from, audio_column=audio_column)
+            
+            logger.info(f"所有文件处理完成")
+            logger.info(f"最终统计: 成功 {stats['success']}, 跳过 {stats['skip']}, 失败 {stats['error']}")
+            self.save_mapping()
             logger.info(f"文件映射信息已保存到: {self.mapping_file}")
             
         except Exception as e:
             logger.error(f"处理CSV文件失败: {str(e)}")
+        finally:
+            # 中途出错时也要停止预取线程，并等待后台上传完成、关闭S3传输管理器的线程
+            if prefetcher:
+                prefetcher.stop()
+            self.s3_uploader.shutdown()
     
     def generate_mapping_report(self):
         """
@@ -756,11 +1205,12 @@ class ImprovedAudioTranscriber:
         """
         try:
             report_file = self.transcripts_dir / 'mapping_report.txt'
+            file_mapping = self.mapping_store.all()
             
             with open(report_file, 'w', encoding='utf-8') as f:
                 f.write("=== 文件映射关系报告 ===\n")
                 f.write(f"生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"总计处理文件数: {len(self.file_mapping)}\n\n")
+                f.write(f"总计处理文件数: {len(file_mapping)}\n\n")
                 
                 f.write("格式说明:\n")
                 f.write("- CSV行号: 在call.csv文件中的行号（从0开始）\n")
@@ -772,7 +1222,7 @@ class ImprovedAudioTranscriber:
                 f.write("=" * 80 + "\n")
                 
                 # 按CSV行号排序
-                sorted_mappings = sorted(self.file_mapping.items(), 
+                sorted_mappings = sorted(file_mapping.items(), 
                                        key=lambda x: x[1]['csv_row_index'])
                 
                 for json_file, mapping in sorted_mappings:
@@ -804,6 +1254,12 @@ def main():
     AWS_REGION = os.getenv('AWS_REGION', 'us-east-1')
     LIMIT = int(os.getenv('LIMIT', '0')) if os.getenv('LIMIT') else None
     START_FROM = int(os.getenv('START_FROM', '0')) if os.getenv('START_FROM') else 0
+    PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'false').lower() == 'true'
+    PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '0'))
+    MAX_CACHE_BYTES = int(float(os.getenv('CACHE_MAX_GB')) * 1024 ** 3) if os.getenv('CACHE_MAX_GB') else None
+    NO_LOCAL_CACHE = os.getenv('NO_LOCAL_CACHE', 'false').lower() == 'true'
+    TRANSCRIPT_OUTPUT_TO_S3 = os.getenv('TRANSCRIPT_OUTPUT_TO_S3', 'false').lower() == 'true'
+    STREAM_CSV = os.getenv('STREAM_CSV', 'false').lower() == 'true'
     
     # 验证必需的配置
     if not S3_BUCKET:
@@ -816,6 +1272,9 @@ def main():
     logger.info(f"  S3文件夹前缀: {S3_FOLDER_PREFIX}")
     logger.info(f"  AWS区域: {AWS_REGION}")
     logger.info(f"  处理限制: {LIMIT if LIMIT else '无限制'}")
+    logger.info(f"  流水线模式: {'开启' if PIPELINE_MODE else '关闭'}")
+    logger.info(f"  本地缓存: {'关闭（流式上传）' if NO_LOCAL_CACHE else '开启'}")
+    logger.info(f"  流式读取CSV: {'开启' if STREAM_CSV else '关闭'}")
     
     # 检查AWS凭证
     try:
@@ -835,12 +1294,38 @@ def main():
     transcriber = ImprovedAudioTranscriber(aws_region=AWS_REGION)
     
     # 处理CSV文件
-    transcriber.process_csv_file(
-        csv_file=CSV_FILE,
-        s3_bucket=S3_BUCKET,
-        s3_folder_prefix=S3_FOLDER_PREFIX,
-        limit=LIMIT
-    )
+    if PIPELINE_MODE:
+        transcriber.process_csv_file_pipelined(
+            csv_file=CSV_FILE,
+            s3_bucket=S3_BUCKET,
+            s3_folder_prefix=S3_FOLDER_PREFIX,
+            limit=LIMIT,
+            start_from=START_FROM,
+            download_workers=int(os.getenv('DOWNLOAD_WORKERS', '4')),
+            upload_workers=int(os.getenv('UPLOAD_WORKERS', '4')),
+            submit_workers=int(os.getenv('SUBMIT_WORKERS', '2')),
+            max_in_flight=int(os.getenv('MAX_IN_FLIGHT_JOBS', '50')),
+            persist_workers=int(os.getenv('PERSIST_WORKERS', '4')),
+            queue_size=int(os.getenv('PIPELINE_QUEUE_SIZE', '50')),
+            prefetch_workers=PREFETCH_WORKERS,
+            max_cache_bytes=MAX_CACHE_BYTES,
+            no_local_cache=NO_LOCAL_CACHE,
+            s3_output=TRANSCRIPT_OUTPUT_TO_S3,
+            stream_csv=STREAM_CSV
+        )
+    else:
+        transcriber.process_csv_file(
+            csv_file=CSV_FILE,
+            s3_bucket=S3_BUCKET,
+            s3_folder_prefix=S3_FOLDER_PREFIX,
+            limit=LIMIT,
+            start_from=START_FROM,
+            prefetch_workers=PREFETCH_WORKERS,
+            max_cache_bytes=MAX_CACHE_BYTES,
+            no_local_cache=NO_LOCAL_CACHE,
+            s3_output=TRANSCRIPT_OUTPUT_TO_S3,
+            stream_csv=STREAM_CSV
+        )
     
     # 生成映射关系报告
     transcriber.generate_mapping_report()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+作业日志（预写日志）
+以追加方式把每条记录的状态变化写入 transcripts/job_journal.jsonl：
+downloaded -> uploaded -> submitted(job_name) -> completed -> persisted，失败时写入 failed；
+重新运行时回放日志，已提交或已完成的记录直接重新关联到原有的转录任务，
+已上传的记录直接使用S3上的音频，不重新提交、不重新下载；
+打开时如果没有其他运行正在使用同一个日志，把日志压缩为每条记录一行（最新状态），回放时间不随运行次数增长。
+每个打开的日志在旁路锁文件上持有共享锁，压缩需要独占锁，因此不会替换其他运行正在追加的文件
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # 非POSIX系统没有flock，不压缩日志，只依赖回放时的合并
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 状态
+DOWNLOADED = 'downloaded'
+UPLOADED = 'uploaded'
+SUBMITTED = 'submitted'
+COMPLETED = 'completed'
+PERSISTED = 'persisted'
+FAILED = 'failed'
+
+# 可以重新关联到原有转录任务的状态
+RESUMABLE_JOB_STATES = (SUBMITTED, COMPLETED)
+# 音频已在S3上的状态
+UPLOADED_STATES = (UPLOADED, SUBMITTED, COMPLETED, PERSISTED, FAILED)
+
+
+class JobJournal:
+    def __init__(self, path, sync=None):
+        """
+        打开作业日志并回放已有记录
+
+        Args:
+            path: 日志文件路径
+            sync: 每次写入后是否fsync，默认读取 JOB_JOURNAL_FSYNC（默认开启）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if sync is None:
+            sync = os.getenv('JOB_JOURNAL_FSYNC', 'true').lower() == 'true'
+        self.sync = sync
+        self.lock = threading.Lock()
+        # CSV行号 -> 合并后的最新状态
+        self.entries = {}
+        self.lock_file = None
+        exclusive = self.acquire_file_lock()
+        line_count = self.replay()
+        if exclusive:
+            if line_count > len(self.entries):
+                self.compact()
+            # 压缩完成后降为共享锁，其他运行可以同时追加
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_SH)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        if self.file.tell() > 0 and not self.ends_with_newline():
+            # 未压缩时补齐崩溃时写了一半的行，之后的记录从新行开始
+            self.file.write('\n')
+
+    def acquire_file_lock(self):
+        """
+        在旁路锁文件上加锁：没有其他运行打开日志时取得独占锁，否则取得共享锁
+
+        Returns:
+            bool: 是否取得独占锁（只有取得独占锁时才能压缩日志）
+        """
+        if fcntl is None:
+            return False
+        self.lock_file = open(self.path.with_name(self.path.name + '.lock'), 'a')
+        try:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            logger.info(f"其他运行正在使用作业日志，本次不压缩: {self.path}")
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_SH)
+            return False
+
+    def replay(self):
+        """
+        回放日志，得到每条记录的最新状态
+
+        Returns:
+            int: 日志行数（包括崩溃时写了一半的行）
+        """
+        if not self.path.exists():
+            return 0
+        line_count = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line_count += 1
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # 崩溃时最后一行可能不完整
+                    continue
+                self.entries.setdefault(event['row'], {}).update(event)
+        if self.entries:
+            logger.info(f"作业日志中有 {len(self.entries)} 条记录: {self.path}")
+        return line_count
+
+    def ends_with_newline(self):
+        """日志文件是否以换行结尾"""
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def compact(self):
+        """把日志重写为每条记录一行最新状态（先写临时文件再原子重命名），同时去掉崩溃时写了一半的行"""
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                if self.sync:
+                    os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.warning(f"压缩作业日志失败: {str(e)}")
+
+    def record(self, csv_row_index, audio_url, state, **fields):
+        """
+        追加一条状态变化
+
+        Args:
+            csv_row_index: CSV行号
+            audio_url: 音频URL，回放时用于确认是同一条记录
+            state: 新状态
+            **fields: 附加信息，例如 s3_uri、job_name
+        """
+        event = {'row': str(csv_row_index), 'url': audio_url, 'state': state, 'time': time.time(), **fields}
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            if self.sync:
+                os.fsync(self.file.fileno())
+            self.entries.setdefault(event['row'], {}).update(event)
+
+    def get(self, csv_row_index, audio_url):
+        """
+        返回记录的最新状态
+
+        Returns:
+            dict: 合并后的状态（state、s3_uri、job_name等），没有记录或URL已变化时返回None
+        """
+        with self.lock:
+            entry = self.entries.get(str(csv_row_index))
+            if entry is None or entry.get('url') != audio_url:
+                return None
+            return dict(entry)
+
+    def resumable_job(self, entry):
+        """返回可以重新关联的转录任务名，没有时返回None"""
+        if entry and entry['state'] in RESUMABLE_JOB_STATES:
+            return entry.get('job_name')
+        return None
+
+    def uploaded_uri(self, entry, bucket_name):
+        """返回已上传到该存储桶的音频S3 URI，没有时返回None"""
+        if entry and entry['state'] in UPLOADED_STATES:
+            s3_uri = entry.get('s3_uri')
+            if s3_uri and s3_uri.startswith(f"s3://{bucket_name}/"):
+                return s3_uri
+        return None
+
+    def close(self):
+        """关闭日志文件并释放锁"""
+        with self.lock:
+            self.file.close()
+            if self.lock_file is not None:
+                self.lock_file.close()
+                self.lock_file = None
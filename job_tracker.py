@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+转录任务集中跟踪模块
+统一保存所有未完成的任务名，按页批量刷新任务状态，完成后通过回调或队列交付
+每个任务根据音频时长规划首次检查时间和退避间隔
+"""
+
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 仍在运行中的任务状态
+ACTIVE_STATUSES = ('QUEUED', 'IN_PROGRESS')
+# 结束状态
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED')
+
+# 未知时长时假设的音频时长（秒），大部分通话为1-3分钟
+DEFAULT_EXPECTED_DURATION = 120
+
+
+class PollSchedule:
+    def __init__(self, expected_duration=None, overhead=10, ratio=0.25,
+                 min_interval=2, max_interval=30, backoff=1.5, jitter=0.2):
+        """
+        根据音频时长规划的轮询计划
+
+        首次检查安排在预计处理完成的时间点（固定开销 + 时长 × 比例），
+        之后按指数退避并加入随机抖动，间隔不超过max_interval
+
+        Args:
+            expected_duration: 音频时长（秒），None表示未知
+            overhead: 转录任务的固定开销（秒）
+            ratio: 处理时间与音频时长的比例
+            min_interval: 首次检查之后的最小间隔（秒）
+            max_interval: 最大间隔（秒）
+            backoff: 退避倍数
+            jitter: 抖动比例，例如0.2表示±20%
+        """
+        if not expected_duration or expected_duration <= 0:
+            expected_duration = DEFAULT_EXPECTED_DURATION
+        self.expected_processing = overhead + ratio * expected_duration
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        # 退避起点与预计处理时间成比例，长音频不会被频繁检查
+        self.interval = min(max_interval, max(min_interval, 0.1 * self.expected_processing))
+
+    def apply_jitter(self, delay):
+        """加入随机抖动，避免大量任务同时到期"""
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def first_delay(self):
+        """返回首次检查的延迟（秒）"""
+        return self.apply_jitter(self.expected_processing)
+
+    def next_delay(self):
+        """返回下一次检查的延迟（秒），并推进退避"""
+        delay = self.interval
+        self.interval = min(self.max_interval, self.interval * self.backoff)
+        return self.apply_jitter(delay)
+
+
+class TranscriptionJobTracker:
+    def __init__(self, transcribe_client, job_name_prefix='transcribe-job-', poll_interval=5, rate_limiter=None):
+        """
+        初始化任务跟踪器
+
+        Args:
+            transcribe_client: boto3 transcribe客户端
+            job_name_prefix: 任务名公共前缀，用于 JobNameContains 过滤
+            poll_interval: 两次批量刷新之间的最小间隔（秒）
+            rate_limiter: AWSRateLimiter实例，为None时直接调用API
+        """
+        self.transcribe_client = transcribe_client
+        self.rate_limiter = rate_limiter
+        self.job_name_prefix = job_name_prefix
+        self.poll_interval = poll_interval
+
+        # job_name -> 跟踪信息
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.thread = None
+
+    def track(self, job_name, callback=None, result_queue=None, max_wait_time=1800, expected_duration=None,
+              check_now=False):
+        """
+        登记一个需要跟踪的转录任务
+
+        Args:
+            job_name: 转录任务名称
+            callback: 任务结束时调用 callback(job_name, job)，job为None表示超时或出错
+            result_queue: 任务结束时放入 (job_name, job)
+            max_wait_time: 最大等待时间（秒）
+            expected_duration: 音频时长（秒），用于规划检查时间
+            check_now: 为True时立即检查一次（重新关联上次运行提交的任务时使用）
+
+        Returns:
+            dict: 跟踪信息，任务结束后 entry['done'] 被设置、entry['result'] 为结束状态
+        """
+        schedule = PollSchedule(expected_duration)
+        now = time.time()
+        with self.lock:
+            entry = self.jobs[job_name] = {
+                'callback': callback,
+                'result_queue': result_queue,
+                'deadline': now + max_wait_time,
+                'schedule': schedule,
+                'next_check': now if check_now else now + schedule.first_delay(),
+                'done': threading.Event(),
+                'result': None
+            }
+        self.ensure_running()
+        self.wake_event.set()
+        return entry
+
+    def wait(self, job_name, timeout=1800, expected_duration=None, check_now=False):
+        """
+        阻塞等待单个任务结束（兼容原有的逐个等待用法）
+
+        Args:
+            job_name: 转录任务名称
+            timeout: 最大等待时间（秒）
+            expected_duration: 音频时长（秒），用于规划检查时间
+            check_now: 为True时立即检查一次
+
+        Returns:
+            dict: 结束状态的TranscriptionJob（COMPLETED或FAILED），超时或出错返回None
+        """
+        with self.lock:
+            entry = self.jobs.get(job_name)
+        if entry is None:
+            # 直接等待登记的跟踪信息：任务可能在登记后立即结束并被移出跟踪列表
+            entry = self.track(job_name, max_wait_time=timeout, expected_duration=expected_duration,
+                               check_now=check_now)
+        entry['done'].wait(timeout)
+        return entry['result']
+
+    def pending_count(self):
+        """返回仍在跟踪中的任务数"""
+        with self.lock:
+            return len(self.jobs)
+
+    def next_due_time(self):
+        """返回最早到期的检查时间，没有任务时返回None"""
+        with self.lock:
+            if not self.jobs:
+                return None
+            return min(min(entry['next_check'], entry['deadline']) for entry in self.jobs.values())
+
+    def ensure_running(self):
+        """按需启动后台刷新线程"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='job-tracker', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """停止后台刷新线程"""
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        """后台线程：在最早有任务到期时批量刷新所有任务状态"""
+        last_refresh = 0
+        while not self.stop_event.is_set():
+            due = self.next_due_time()
+            now = time.time()
+            if due is None or due > now:
+                # 等到最早到期时间，新任务登记时会被唤醒重新计算
+                self.wake_event.wait(None if due is None else due - now)
+                self.wake_event.clear()
+                continue
+
+            # 限制批量刷新的最小间隔
+            wait_time = last_refresh + self.poll_interval - now
+            if wait_time > 0:
+                self.stop_event.wait(wait_time)
+                continue
+
+            last_refresh = time.time()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"刷新转录任务状态失败: {str(e)}")
+
+    def call_api(self, api_name, **kwargs):
+        """调用transcribe API，配置了限流器时经过限流器"""
+        func = getattr(self.transcribe_client, api_name)
+        if self.rate_limiter is not None:
+            return self.rate_limiter.call(api_name, func, **kwargs)
+        return func(**kwargs)
+
+    def list_active_job_names(self):
+        """
+        分页列出仍在运行中的任务名
+
+        Returns:
+            set: 运行中的任务名集合
+        """
+        active = set()
+        for status in ACTIVE_STATUSES:
+            kwargs = {'Status': status, 'MaxResults': 100}
+            if self.job_name_prefix:
+                kwargs['JobNameContains'] = self.job_name_prefix
+            while True:
+                response = self.call_api('list_transcription_jobs', **kwargs)
+                for summary in response.get('TranscriptionJobSummaries', []):
+                    active.add(summary['TranscriptionJobName'])
+                next_token = response.get('NextToken')
+                if not next_token:
+                    break
+                kwargs['NextToken'] = next_token
+        return active
+
+    def refresh(self):
+        """
+        刷新一轮任务状态
+
+        先按页列出运行中的任务，不在其中的被跟踪任务才单独查询一次详情，
+        因此每轮的API调用数取决于运行中任务的页数，而不是任务数。
+        仍在运行且已到期的任务按各自的退避计划安排下一次检查
+        """
+        with self.lock:
+            tracked = list(self.jobs.keys())
+        if not tracked:
+            return
+
+        active = self.list_active_job_names()
+        now = time.time()
+
+        for job_name in tracked:
+            with self.lock:
+                entry = self.jobs.get(job_name)
+            if entry is None:
+                continue
+
+            if job_name in active:
+                if now > entry['deadline']:
+                    logger.error(f"转录任务超时: {job_name}")
+                    self.finish(job_name, None)
+                elif now >= entry['next_check']:
+                    self.reschedule(entry, now)
+                continue
+
+            # 已不在运行列表中，查询一次详情获取结果地址
+            try:
+                response = self.call_api('get_transcription_job', TranscriptionJobName=job_name)
+                job = response['TranscriptionJob']
+                status = job['TranscriptionJobStatus']
+            except Exception as e:
+                logger.error(f"检查转录任务状态失败: {job_name}: {str(e)}")
+                self.finish(job_name, None)
+                continue
+
+            if status in TERMINAL_STATUSES:
+                self.finish(job_name, job)
+            elif now > entry['deadline']:
+                logger.error(f"转录任务超时: {job_name}")
+                self.finish(job_name, None)
+            else:
+                self.reschedule(entry, now)
+
+    def reschedule(self, entry, now):
+        """按退避计划安排下一次检查"""
+        with self.lock:
+            entry['next_check'] = now + entry['schedule'].next_delay()
+
+    def finish(self, job_name, job):
+        """任务结束：移出跟踪列表并通知等待方"""
+        with self.lock:
+            entry = self.jobs.pop(job_name, None)
+        if entry is None:
+            return
+        entry['result'] = job
+        entry['done'].set()
+        if entry['result_queue'] is not None:
+            entry['result_queue'].put((job_name, job))
+        if entry['callback'] is not None:
+            try:
+                entry['callback'](job_name, job)
+            except Exception as e:
+                logger.error(f"处理转录任务回调失败: {job_name}: {str(e)}")
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+带标签转录文本生成
+说话人片段中的词汇先展开为紧凑的列（内容、是否标点、片段边界），每个片段只拼接一次字符串；
+各声道的词汇按时间多路归并，边归并边输出发言段，不收集全部词汇再排序；
+输出与逐词拼接字符串的原有实现逐字节一致
+"""
+
+import heapq
+import json
+import os
+import re
+import sys
+import logging
+from array import array
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+# 默认的说话人和声道名称（说话人名称可用 SPEAKER_<N>_LABEL 覆盖）
+DEFAULT_SPEAKER_NAMES = ('客服', '客户')
+DEFAULT_CHANNEL_NAMES = ('声道1-客服', '声道2-客户', '声道3', '声道4')
+DEFAULT_SPEAKER_TEMPLATE = '说话人{n}'
+
+
+class LabelResolver:
+    def __init__(self, speaker_names=None, channel_names=None, max_speakers=10,
+                 speaker_template=DEFAULT_SPEAKER_TEMPLATE):
+        """
+        说话人/声道标签 -> 显示名称 的预先计算好的查找表
+
+        Args:
+            speaker_names: 按编号排列的说话人名称，spk_0 对应第一个，None表示使用 speaker_template
+            channel_names: 按编号排列的声道名称，ch_0 对应第一个
+            max_speakers: 查找表中的说话人数，超出名称列表的说话人使用 speaker_template
+            speaker_template: 未命名说话人的名称模板，{n} 为从1开始的编号
+        """
+        speaker_names = list(DEFAULT_SPEAKER_NAMES if speaker_names is None else speaker_names)
+        channel_names = list(DEFAULT_CHANNEL_NAMES if channel_names is None else channel_names)
+
+        # 名称在创建时生成并驻留，查找时不再拼接字符串
+        self.speakers = {}
+        for i in range(max(max_speakers, len(speaker_names))):
+            name = speaker_names[i] if i < len(speaker_names) else None
+            if name is None:
+                name = speaker_template.format(n=i + 1)
+            self.speakers[f'spk_{i}'] = sys.intern(f'[{name}]')
+        self.channels = {f'ch_{i}': sys.intern(f'[{name}]') for i, name in enumerate(channel_names)}
+
+    @classmethod
+    def from_env(cls, language_code=None, max_speakers=10, config_path=None):
+        """
+        从环境变量和可选的标签配置文件创建
+
+        配置文件（LABEL_CONFIG）为JSON，可以包含 speaker_names、channel_names、max_speakers、
+        speaker_template，以及按语言覆盖的 languages: {语言代码: {...}}；配置文件优先于环境变量
+
+        Args:
+            language_code: 转录语言，用于选择 languages 中的覆盖项
+            max_speakers: 默认的说话人数（与转录任务的 MaxSpeakerLabels 一致）
+            config_path: 配置文件路径，默认读取 LABEL_CONFIG
+
+        Returns:
+            LabelResolver: 标签解析器
+        """
+        config = {}
+        config_path = config_path or os.getenv('LABEL_CONFIG')
+        if config_path:
+            try:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                config = dict(config, **config.get('languages', {}).get(language_code, {}))
+            except Exception as e:
+                logger.warning(f"读取标签配置失败，使用环境变量中的标签: {str(e)}")
+                config = {}
+
+        max_speakers = int(config.get('max_speakers', max_speakers))
+        speaker_names = config.get('speaker_names')
+        if speaker_names is None:
+            # SPEAKER_<N>_LABEL，未设置的编号使用默认名称
+            speaker_names = [os.getenv(f'SPEAKER_{i}_LABEL', DEFAULT_SPEAKER_NAMES[i] if i < len(DEFAULT_SPEAKER_NAMES) else None)
+                             for i in range(max(max_speakers, len(DEFAULT_SPEAKER_NAMES)))]
+
+        return cls(
+            speaker_names=speaker_names,
+            channel_names=config.get('channel_names'),
+            max_speakers=max_speakers,
+            speaker_template=config.get('speaker_template', DEFAULT_SPEAKER_TEMPLATE)
+        )
+
+    def speaker(self, speaker_label):
+        """返回说话人的显示名称（如 spk_0 -> [客服]），表中没有的标签显示为 [标签]"""
+        name = self.speakers.get(speaker_label)
+        if name is None:
+            name = self.speakers.setdefault(speaker_label, sys.intern(f'[{speaker_label}]'))
+        return name
+
+    def channel(self, channel_label):
+        """返回声道的显示名称（如 ch_0 -> [声道1-客服]），表中没有的标签显示为 [标签]"""
+        name = self.channels.get(channel_label)
+        if name is None:
+            name = self.channels.setdefault(channel_label, sys.intern(f'[{channel_label}]'))
+        return name
+
+
+def get_results_data(transcript_data):
+    """返回转录结果中的results（results为列表时取第一个）"""
+    results_data = transcript_data['results']
+    if isinstance(results_data, list) and len(results_data) > 0:
+        results_data = results_data[0]
+    return results_data
+
+
+def join_tokens(contents, punctuation, start, stop):
+    """
+    拼接一个发言段的文本：词汇之间以空格分隔，标点紧跟前一个词
+
+    Args:
+        contents: 词汇内容列
+        punctuation: 是否标点列
+        start: 发言段在列中的起始位置
+        stop: 发言段在列中的结束位置（不含）
+
+    Returns:
+        str: 去掉首尾空白的文本
+    """
+    parts = []
+    for i in range(start, stop):
+        if punctuation[i]:
+            # 去掉已拼接部分末尾的空白（可能跨越多个片段）
+            while parts:
+                tail = parts[-1].rstrip()
+                if tail:
+                    parts[-1] = tail
+                    break
+                parts.pop()
+        parts.append(contents[i])
+        parts.append(' ')
+    return ''.join(parts).strip()
+
+
+def speaker_columns(segments, speaker_name):
+    """
+    把说话人片段中的词汇展开为列
+
+    Returns:
+        tuple: (内容列, 是否标点列, 每个片段在列中的结束位置, 每个片段的说话人名称)
+    """
+    contents = []
+    punctuation = bytearray()
+    bounds = array('l')
+    names = []
+    for segment in segments:
+        names.append(speaker_name(segment.get('speaker_label', 'unknown')))
+
+        if 'items' in segment:
+            for item in segment['items']:
+                if isinstance(item, dict) and 'alternatives' in item:
+                    if len(item['alternatives']) > 0:
+                        contents.append(item['alternatives'][0].get('content', ''))
+                        punctuation.append(item.get('type') == 'punctuation')
+        bounds.append(len(contents))
+    return contents, punctuation, bounds, names
+
+
+def speaker_lines(segments, speaker_name):
+    """按说话人片段生成带标签的文本行，每个片段一行"""
+    contents, punctuation, bounds, names = speaker_columns(segments, speaker_name)
+    lines = []
+    start = 0
+    for stop, name in zip(bounds, names):
+        text = join_tokens(contents, punctuation, start, stop)
+        if text:
+            lines.append(f"{name}: {text}")
+        start = stop
+    return lines
+
+
+def segment_line(segment, speaker_name):
+    """生成单个说话人片段的带标签文本行，没有文本时返回None（用于流式处理）"""
+    lines = speaker_lines([segment], speaker_name)
+    return lines[0] if lines else None
+
+
+def pronunciation_item(item):
+    """
+    取出带时间戳的发音词汇
+
+    Returns:
+        tuple: (开始时间, 内容)，标点、没有时间戳或没有识别结果的项目返回None
+    """
+    if (isinstance(item, dict) and
+        item.get('type') == 'pronunciation' and
+        'start_time' in item and
+        'alternatives' in item and
+        len(item['alternatives']) > 0):
+
+        return float(item['start_time']), item['alternatives'][0].get('content', '')
+    return None
+
+
+def channel_items(channel):
+    """
+    逐个返回一个声道中带时间戳的发音词汇
+
+    Yields:
+        tuple: (开始时间, 内容)
+    """
+    if 'items' not in channel:
+        return
+    for item in channel['items']:
+        entry = pronunciation_item(item)
+        if entry is not None:
+            yield entry
+
+
+def coded_items(items, code, label):
+    """给声道的词汇加上声道名称编号，同时检查词汇是否按开始时间排列（Transcribe的输出是有序的）"""
+    last = float('-inf')
+    for start, content in items:
+        if start < last:
+            raise ValueError(f"声道 {label} 中的词汇未按时间排序")
+        last = start
+        yield start, code, content
+
+
+def merge_channel_lines(named_streams, ordered=True):
+    """
+    按时间顺序多路归并各声道的词汇，逐行返回连续属于同一声道的文本
+
+    各声道的词汇已按时间排列，归并时只比较各声道当前的词汇（O(n log k)），
+    不需要把全部词汇收集到一起排序；开始时间相同时按声道顺序，与稳定排序的结果一致
+
+    Args:
+        named_streams: [(声道标签, 声道显示名称, (开始时间, 内容)迭代器)]
+        ordered: 为False时先分别排序每个声道（用于词汇无序的结果）
+
+    Yields:
+        str: 带标签的文本行
+    """
+    streams = []
+    names = []
+    name_codes = {}
+    for label, name, items in named_streams:
+        # 名称相同的声道视为同一说话方
+        code = name_codes.setdefault(name, len(names))
+        if code == len(names):
+            names.append(name)
+        if not ordered:
+            items = sorted(items, key=itemgetter(0))
+        streams.append(coded_items(items, code, label))
+
+    count = 0
+    run = []
+    current = None
+    for _, code, content in heapq.merge(*streams, key=itemgetter(0)):
+        count += 1
+        if code != current:
+            if run:
+                text = ' '.join(run).strip()
+                if text:
+                    yield f"{names[current]}: {text}"
+            current = code
+            run = []
+        run.append(content)
+    if run:
+        text = ' '.join(run).strip()
+        if text:
+            yield f"{names[current]}: {text}"
+    logger.info(f"归并了 {count} 个词汇项目")
+
+
+def iter_channel_lines(channels, channel_name, ordered=True):
+    """
+    按时间顺序归并转录结果中各声道的词汇，逐行返回连续属于同一声道的文本
+
+    Args:
+        channels: 转录结果中的声道列表
+        channel_name: 声道标签 -> 显示名称 的函数
+        ordered: 为False时先分别排序每个声道
+
+    Yields:
+        str: 带标签的文本行
+    """
+    named_streams = []
+    for channel in channels:
+        label = channel.get('channel_label', 'unknown')
+        named_streams.append((label, channel_name(label), channel_items(channel)))
+    return merge_channel_lines(named_streams, ordered)
+
+
+def channel_lines(channels, channel_name):
+    """按时间顺序合并各声道的词汇，连续属于同一声道的词汇合为一行"""
+    try:
+        return list(iter_channel_lines(channels, channel_name))
+    except ValueError:
+        # 声道内词汇无序（或时间无法解析，此时会再次抛出）
+        return list(iter_channel_lines(channels, channel_name, ordered=False))
+
+
+def fallback_lines(results_data, speaker_name):
+    """没有说话人和声道标签时，按句子分割原始转录文本并交替分配给两个说话人"""
+    original_text = ""
+    if isinstance(results_data, dict) and 'transcripts' in results_data:
+        transcripts = results_data['transcripts']
+        if len(transcripts) > 0:
+            original_text = transcripts[0].get('transcript', '')
+
+    lines = []
+    if original_text:
+        # 简单的句子分割 - 按句号、问号、感叹号分割
+        sentences = re.split(r'[.!?。！？]+', original_text)
+        for i, sentence in enumerate(sentences):
+            sentence = sentence.strip()
+            if sentence:
+                speaker = speaker_name('spk_0') if i % 2 == 0 else speaker_name('spk_1')
+                lines.append(f"{speaker}: {sentence}")
+
+    if not lines:
+        lines.append(f"[未识别说话人]: {original_text}")
+    return lines
+
+
+def build_labeled_transcript(transcript_data, speaker_name, channel_name):
+    """
+    创建带标签的转录文本
+
+    优先使用说话人标签，其次使用声道标签，都没有时按句子简单分段
+
+    Args:
+        transcript_data: AWS Transcribe返回的完整数据
+        speaker_name: 说话人标签 -> 显示名称 的函数
+        channel_name: 声道标签 -> 显示名称 的函数
+
+    Returns:
+        str: 带标签的转录文本（数据结构异常时抛出异常，由调用方处理）
+    """
+    labeled_lines = []
+    results_data = get_results_data(transcript_data)
+
+    logger.info(f"数据结构检查: results类型={type(results_data)}")
+
+    if isinstance(results_data, dict) and 'speaker_labels' in results_data:
+        logger.info("使用说话人标签进行分段")
+        speaker_labels = results_data['speaker_labels']
+        if isinstance(speaker_labels, dict) and 'segments' in speaker_labels:
+            segments = speaker_labels['segments']
+            logger.info(f"找到 {len(segments)} 个说话人片段")
+            labeled_lines = speaker_lines(segments, speaker_name)
+
+    elif isinstance(results_data, dict) and 'channel_labels' in results_data:
+        logger.info("使用声道标签进行分段")
+        channel_labels = results_data['channel_labels']
+        if isinstance(channel_labels, dict) and 'channels' in channel_labels:
+            channels = channel_labels['channels']
+            logger.info(f"找到 {len(channels)} 个声道")
+            labeled_lines = channel_lines(channels, channel_name)
+
+    if not labeled_lines:
+        logger.info("未找到说话人或声道标签，尝试简单分段")
+        labeled_lines = fallback_lines(results_data, speaker_name)
+
+    result = "\n\n".join(labeled_lines)
+    logger.info(f"最终生成 {len(labeled_lines)} 个标签片段")
+    return result
@@ -6,9 +6,11 @@
 
 import os
 import sys
+import json
 from pathlib import Path
 from dotenv import load_dotenv
 from transcribe_audio import AudioTranscriber
+from mapping_store import MappingStore
 import logging
 
 # 加载环境变量
@@ -24,6 +26,8 @@ def main():
         print("  python3 manage_cache.py info          # 查看缓存信息")
         print("  python3 manage_cache.py clean [days]  # 清理缓存 (默认7天)")
         print("  python3 manage_cache.py clear         # 清空所有缓存")
+        print("  python3 manage_cache.py evict --max-gb N  # 按最近访问时间淘汰，直到缓存不超过N GB")
+        print("  python3 manage_cache.py migrate       # 把旧版缓存文件迁入内容寻址存储")
         return
     
     command = sys.argv[1].lower()
@@ -36,6 +40,7 @@ def main():
         if cache_info:
             print(f"缓存目录: {cache_info['cache_dir']}")
             print(f"文件数量: {cache_info['file_count']}")
+            print(f"URL数量: {cache_info['url_count']}")
             print(f"总大小: {cache_info['total_size_mb']:.2f} MB")
         else:
             print("无法获取缓存信息")
@@ -62,6 +67,40 @@ def main():
         else:
             print("操作已取消")
     
+    elif command == 'evict':
+        # 按LRU淘汰到指定容量
+        max_gb = None
+        args = sys.argv[2:]
+        if len(args) >= 2 and args[0] == '--max-gb':
+            try:
+                max_gb = float(args[1])
+            except ValueError:
+                max_gb = None
+        if max_gb is None:
+            print("错误: 请使用 --max-gb N 指定缓存容量上限")
+            return
+        
+        result = transcriber.audio_cache.evict(max_bytes=int(max_gb * 1024 ** 3))
+        print(f"淘汰 {result['evicted']} 个文件，释放 {result['freed_bytes'] / 1024 / 1024:.2f} MB，"
+              f"当前缓存 {result['total_bytes'] / 1024 / 1024:.2f} MB")
+    
+    elif command == 'migrate':
+        # 迁移旧版缓存文件，URL从映射文件中恢复
+        name_to_url = {}
+        mappings = {}
+        mapping_db = Path('transcripts') / 'file_mapping.db'
+        mapping_file = Path('transcripts') / 'file_mapping.json'
+        if mapping_db.exists():
+            mappings = MappingStore(mapping_db).all()
+        elif mapping_file.exists():
+            with open(mapping_file, 'r', encoding='utf-8') as f:
+                mappings = json.load(f)
+        for info in mappings.values():
+            if info.get('audio_url'):
+                name_to_url[transcriber.get_cached_filename(info['audio_url'])] = info['audio_url']
+        migrated = transcriber.audio_cache.migrate_legacy(name_to_url)
+        print(f"已迁移 {migrated} 个缓存文件")
+    
     else:
         print(f"未知命令: {command}")
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+文件映射存储
+转录文件与call.csv记录的映射保存在SQLite（WAL模式）中，每条记录单独插入或更新，
+写入代价与已有记录数无关，多个线程和多个批次进程可以同时写入；
+file_mapping.json 由导出生成，供原有工具兼容读取
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mappings (
+    json_file TEXT PRIMARY KEY,
+    txt_file TEXT,
+    csv_row_index INTEGER,
+    call_id TEXT,
+    customer_id TEXT,
+    audio_url TEXT,
+    processed_time TEXT,
+    info TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_mappings_csv_row_index ON mappings (csv_row_index);
+CREATE INDEX IF NOT EXISTS idx_mappings_call_id ON mappings (call_id);
+CREATE INDEX IF NOT EXISTS idx_mappings_customer_id ON mappings (customer_id);
+"""
+
+
+class MappingStore:
+    def __init__(self, db_path, busy_timeout=30):
+        """
+        打开映射存储
+
+        Args:
+            db_path: SQLite数据库路径
+            busy_timeout: 其他进程正在写入时的等待时间（秒）
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 所有线程共享一个连接，由锁串行化；不同进程之间由SQLite的锁协调
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), timeout=busy_timeout, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def upsert(self, mapping_info):
+        """
+        插入或更新一条映射记录（以JSON文件名为键）
+
+        Args:
+            mapping_info: generate_output_filename 生成的映射信息
+        """
+        self.upsert_many([mapping_info])
+
+    def upsert_many(self, mappings):
+        """在一个事务中插入或更新多条映射记录"""
+        rows = []
+        for info in mappings:
+            csv_row_index = info.get('csv_row_index')
+            rows.append((
+                info['json_file'],
+                info.get('txt_file'),
+                int(csv_row_index) if csv_row_index is not None else None,
+                info.get('call_id'),
+                info.get('customer_id'),
+                info.get('audio_url'),
+                info.get('processed_time'),
+                json.dumps(info, ensure_ascii=False, default=str)
+            ))
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO mappings '
+                '(json_file, txt_file, csv_row_index, call_id, customer_id, audio_url, processed_time, info) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self.conn.commit()
+
+    def count(self):
+        """返回映射记录数"""
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM mappings').fetchone()[0]
+
+    def all(self):
+        """
+        读取全部映射记录
+
+        Returns:
+            dict: {JSON文件名: 映射信息}，与 file_mapping.json 的结构一致，按CSV行号排序
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT json_file, info FROM mappings ORDER BY csv_row_index, json_file'
+            ).fetchall()
+        return {json_file: json.loads(info) for json_file, info in rows}
+
+    def import_json(self, json_path):
+        """
+        导入旧版 file_mapping.json
+
+        Returns:
+            int: 导入的记录数
+        """
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        mappings = [dict(info, json_file=info.get('json_file', json_file)) for json_file, info in data.items()]
+        self.upsert_many(mappings)
+        return len(mappings)
+
+    def export_json(self, json_path):
+        """
+        导出为 file_mapping.json（先写临时文件再原子重命名）
+
+        Returns:
+            int: 导出的记录数
+        """
+        json_path = Path(json_path)
+        data = self.all()
+        temp_path = json_path.with_name(json_path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, json_path)
+        return len(data)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+AWS API 限流模块
+每个API使用独立的令牌桶预算，遇到限流错误时自动降低速率并退避重试
+"""
+
+import os
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 视为限流的错误码，遇到时重试而不是直接放弃
+THROTTLING_ERROR_CODES = (
+    'ThrottlingException',
+    'Throttling',
+    'LimitExceededException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'SlowDown',
+)
+
+# 各API默认的每秒调用预算（参考AWS默认配额）
+DEFAULT_BUDGETS = {
+    'start_transcription_job': 10,
+    'get_transcription_job': 20,
+    'list_transcription_jobs': 5,
+    'upload_file': 50,
+    'head_object': 100,
+    'get_object': 100,
+    'list_objects_v2': 20,
+}
+DEFAULT_RATE = 10
+
+
+def is_throttling_error(error):
+    """
+    判断异常是否为限流错误
+
+    Args:
+        error: 异常对象
+
+    Returns:
+        bool: 是否为限流错误
+    """
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        code = response.get('Error', {}).get('Code', '')
+        return code in THROTTLING_ERROR_CODES
+    # upload_file等高级接口会把ClientError包装为其他异常，只能通过消息判断
+    message = str(error)
+    return any(code in message for code in THROTTLING_ERROR_CODES)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, min_rate=0.1, recovery=0.05):
+        """
+        自适应令牌桶
+
+        Args:
+            rate: 配置的每秒令牌数（速率上限）
+            capacity: 桶容量（允许的突发数），默认等于rate
+            min_rate: 限流降速后的最低速率
+            recovery: 每次成功调用后恢复的速率比例（相对于配置速率）
+        """
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        """按经过的时间补充令牌"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """获取一个令牌，不足时阻塞等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def on_throttle(self):
+        """遇到限流：速率减半"""
+        with self.lock:
+            self.refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def on_success(self):
+        """调用成功：逐步恢复到配置速率"""
+        if self.rate < self.max_rate:
+            with self.lock:
+                self.refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery)
+
+
+class AWSRateLimiter:
+    def __init__(self, budgets=None, max_retries=8, base_delay=1, max_delay=60):
+        """
+        初始化限流器
+
+        Args:
+            budgets: {API名称: 每秒调用数}，未列出的API使用DEFAULT_RATE
+            max_retries: 限流时的最大重试次数
+            base_delay: 退避起始延迟（秒）
+            max_delay: 退避最大延迟（秒）
+        """
+        self.budgets = dict(DEFAULT_BUDGETS)
+        if budgets:
+            self.budgets.update(budgets)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, api_name):
+        """获取API对应的令牌桶"""
+        with self.lock:
+            if api_name not in self.buckets:
+                self.buckets[api_name] = TokenBucket(self.budgets.get(api_name, DEFAULT_RATE))
+            return self.buckets[api_name]
+
+    def call(self, api_name, func, *args, **kwargs):
+        """
+        在限流控制下调用AWS API，遇到限流错误时退避重试
+
+        Args:
+            api_name: API名称，用于选择预算
+            func: 实际调用的函数
+            *args, **kwargs: 传给func的参数
+
+        Returns:
+            func的返回值；非限流错误或重试耗尽时抛出原异常
+        """
+        bucket = self.bucket(api_name)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_throttling_error(e) or attempt >= self.max_retries:
+                    raise
+                bucket.on_throttle()
+                # 指数退避 + 全抖动
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                attempt += 1
+                logger.warning(f"{api_name} 被限流，{delay:.1f} 秒后第 {attempt} 次重试: {str(e)}")
+                time.sleep(delay)
+                continue
+            bucket.on_success()
+            return result
+
+
+def parse_budgets(value):
+    """
+    解析预算配置字符串，例如 "start_transcription_job=5,upload_file=20"
+
+    Returns:
+        dict: {API名称: 每秒调用数}
+    """
+    budgets = {}
+    for part in (value or '').split(','):
+        if '=' in part:
+            name, rate = part.split('=', 1)
+            budgets[name.strip()] = float(rate)
+    return budgets
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_rate_limiter():
+    """
+    获取进程内共享的限流器，预算可通过环境变量 AWS_RATE_LIMITS 覆盖
+
+    Returns:
+        AWSRateLimiter: 共享的限流器
+    """
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = AWSRateLimiter(
+                budgets=parse_budgets(os.getenv('AWS_RATE_LIMITS', '')),
+                max_retries=int(os.getenv('AWS_MAX_RETRIES', '8'))
+            )
+        return _shared_limiter
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+转录结果缓存
+按 (音频内容哈希, 语言, 任务设置哈希) 保存转录服务返回的原始结果（full_result），
+相同音频以相同设置再次处理时直接使用缓存的结果，不再启动转录任务
+（输出文件改名、结果文件被删除、或者换用另一个处理脚本时都会重新处理）
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 缓存文件和S3对象都以内容哈希命名
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# 从文件写入结果时每次复制的块大小
+COPY_CHUNK_SIZE = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    digest TEXT NOT NULL,
+    language_code TEXT NOT NULL,
+    settings_hash TEXT NOT NULL,
+    result TEXT NOT NULL,
+    job_name TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (digest, language_code, settings_hash)
+);
+"""
+
+
+def audio_digest(path_or_uri):
+    """
+    从缓存文件路径或S3 URI取得音频内容哈希
+
+    Returns:
+        str: 哈希，文件名不是内容哈希时返回None
+    """
+    if not path_or_uri:
+        return None
+    stem = Path(str(path_or_uri)).stem
+    return stem if SHA256_PATTERN.match(stem) else None
+
+
+def settings_hash(settings):
+    """计算任务设置的哈希（键排序后序列化，与字典顺序无关）"""
+    encoded = json.dumps(settings, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class TranscriptResultCache:
+    def __init__(self, db_path):
+        """
+        初始化结果缓存
+
+        Args:
+            db_path: SQLite数据库路径
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 所有线程共享一个连接，由锁串行化
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        # 增量BLOB接口（Connection.blobopen）需要Python 3.11+
+        self.supports_blobopen = hasattr(self.conn, 'blobopen')
+
+    def get(self, digest, language_code, settings):
+        """
+        查找缓存的转录结果
+
+        Args:
+            digest: 音频内容哈希
+            language_code: 语言代码
+            settings: 任务设置（影响结果的全部参数）
+
+        Returns:
+            dict: 转录结果JSON，未缓存时返回None
+        """
+        # 从文件保存的结果以BLOB（UTF-8字节）存储，json.loads 同样可以解析
+        if not digest:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT result FROM results WHERE digest = ? AND language_code = ? AND settings_hash = ?',
+                (digest, language_code, settings_hash(settings))
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, digest, language_code, settings, result, job_name=None):
+        """
+        保存转录结果
+
+        Args:
+            digest: 音频内容哈希
+            language_code: 语言代码
+            settings: 任务设置
+            result: 转录结果JSON（字典，或未解析的JSON文本）
+            job_name: 产生该结果的转录任务名称
+        """
+        if not digest:
+            return
+        if not isinstance(result, str):
+            result = json.dumps(result, ensure_ascii=False)
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO results (digest, language_code, settings_hash, result, job_name, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (digest, language_code, settings_hash(settings),
+                 result, job_name, time.time())
+            )
+            self.conn.commit()
+
+    def put_file(self, digest, language_code, settings, path, job_name=None):
+        """
+        从文件保存转录结果（未解析的JSON），按块复制，不把整个结果读入内存；
+        Python 3.11以下没有增量BLOB接口，读入整个文件后按 put 保存
+
+        Args:
+            digest: 音频内容哈希
+            language_code: 语言代码
+            settings: 任务设置
+            path: 转录结果JSON文件路径
+            job_name: 产生该结果的转录任务名称
+        """
+        if not digest:
+            return
+        if not self.supports_blobopen:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.put(digest, language_code, settings, f.read(), job_name)
+            return
+        size = os.path.getsize(path)
+        with self.lock, open(path, 'rb') as f:
+            # 先写入指定大小的空白BLOB，再通过增量BLOB接口逐块写入
+            cursor = self.conn.execute(
+                'INSERT OR REPLACE INTO results (digest, language_code, settings_hash, result, job_name, created_at) '
+                'VALUES (?, ?, ?, zeroblob(?), ?, ?)',
+                (digest, language_code, settings_hash(settings), size, job_name, time.time())
+            )
+            try:
+                with self.conn.blobopen('results', 'result', cursor.lastrowid) as blob:
+                    for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                        blob.write(chunk)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def stats(self):
+        """
+        返回缓存统计
+
+        Returns:
+            dict: {'result_count': 结果数, 'audio_count': 音频数}
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT COUNT(*), COUNT(DISTINCT digest) FROM results').fetchone()
+        return {'result_count': row[0], 'audio_count': row[1]}
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+S3音频上传模块
+上传前先查本地缓存清单中的上传记录，再用HeadObject比较大小和SHA-256，
+内容相同的对象已存在时跳过上传；
+所有上传共享一个按配置调优的传输管理器（分片阈值、分片大小、并发数）和同一个客户端连接池，
+并可以在后台线程中提交，返回Future；
+也支持把HTTP响应流直接分片上传到S3，边上传边计算SHA-256，不经过本地磁盘
+"""
+
+import hashlib
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import boto3
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from audio_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# 对象不存在时HeadObject返回的错误码
+NOT_FOUND_CODES = ('404', 'NoSuchKey', 'NotFound')
+
+MB = 1024 * 1024
+
+# S3分片上传除最后一片外的最小分片大小
+MIN_PART_SIZE = 5 * MB
+
+
+def read_exact(stream, size):
+    """从流中读取size字节，流结束时返回不足size的数据"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def create_s3_client(aws_region, max_pool_connections=None):
+    """
+    创建S3客户端，连接池大小按并发上传数配置
+
+    Args:
+        aws_region: AWS区域
+        max_pool_connections: 连接池大小，默认读取 S3_MAX_POOL_CONNECTIONS
+
+    Returns:
+        boto3 s3客户端
+    """
+    if max_pool_connections is None:
+        max_pool_connections = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '50'))
+    return boto3.client('s3', region_name=aws_region,
+                        config=Config(max_pool_connections=max_pool_connections))
+
+
+def create_transfer_config():
+    """
+    根据环境变量创建传输配置
+
+    Returns:
+        TransferConfig: 分片阈值 S3_MULTIPART_THRESHOLD_MB、分片大小 S3_MULTIPART_CHUNKSIZE_MB、
+        所有上传共享的最大并发请求数 S3_MAX_CONCURRENCY
+    """
+    return TransferConfig(
+        multipart_threshold=int(float(os.getenv('S3_MULTIPART_THRESHOLD_MB', '8')) * MB),
+        multipart_chunksize=int(float(os.getenv('S3_MULTIPART_CHUNKSIZE_MB', '8')) * MB),
+        max_concurrency=int(os.getenv('S3_MAX_CONCURRENCY', '20')),
+        use_threads=True
+    )
+
+
+class S3Uploader:
+    def __init__(self, s3_client, audio_cache=None, rate_limiter=None, transfer_config=None, max_workers=None):
+        """
+        初始化上传器
+
+        Args:
+            s3_client: boto3 s3客户端
+            audio_cache: AudioCache实例，用于读取文件哈希和记录上传，None表示不使用清单
+            rate_limiter: AWSRateLimiter实例，为None时直接调用API
+            transfer_config: TransferConfig，默认按环境变量创建
+            max_workers: 后台提交上传的线程数，默认读取 S3_UPLOAD_WORKERS
+        """
+        self.s3_client = s3_client
+        self.audio_cache = audio_cache
+        self.rate_limiter = rate_limiter
+        self.transfer_config = transfer_config or create_transfer_config()
+
+        if max_workers is None:
+            max_workers = int(os.getenv('S3_UPLOAD_WORKERS', '8'))
+        self.max_workers = max(1, max_workers)
+
+        # 传输管理器和后台线程池在首次使用时创建，shutdown后再次使用时重新创建
+        self._transfer_manager = None
+        self._executor = None
+        self.lock = threading.Lock()
+
+    @property
+    def transfer_manager(self):
+        """所有上传共享一个传输管理器，分片请求的总并发数由max_concurrency限制"""
+        with self.lock:
+            if self._transfer_manager is None:
+                self._transfer_manager = create_transfer_manager(self.s3_client, self.transfer_config)
+            return self._transfer_manager
+
+    @property
+    def executor(self):
+        """后台提交上传的线程池"""
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='s3-upload')
+            return self._executor
+
+    def shutdown(self):
+        """等待后台上传完成并关闭传输管理器"""
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self.lock:
+            transfer_manager, self._transfer_manager = self._transfer_manager, None
+        if transfer_manager is not None:
+            transfer_manager.shutdown()
+
+    def call(self, api_name, func, *args, **kwargs):
+        """调用S3 API，配置了限流器时经过限流器"""
+        if self.rate_limiter is not None:
+            return self.rate_limiter.call(api_name, func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def local_digest(self, local_file_path):
+        """返回本地文件的SHA-256，缓存中的文件直接取文件名中的哈希"""
+        digest = self.audio_cache.digest_of(local_file_path) if self.audio_cache else None
+        return digest or file_sha256(local_file_path)
+
+    def remote_matches(self, bucket_name, s3_key, size, digest):
+        """
+        判断S3上是否已有相同内容的对象
+
+        Args:
+            bucket_name: S3存储桶名称
+            s3_key: S3对象键
+            size: 本地文件大小
+            digest: 本地文件SHA-256
+
+        Returns:
+            bool: 对象存在且大小和哈希一致
+        """
+        try:
+            head = self.call('head_object', self.s3_client.head_object, Bucket=bucket_name, Key=s3_key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in NOT_FOUND_CODES:
+                return False
+            raise
+
+        if head.get('ContentLength') != size:
+            return False
+        remote_digest = head.get('Metadata', {}).get('sha256')
+        if remote_digest:
+            return remote_digest == digest
+        # 没有哈希元数据的旧对象：对象键本身以内容哈希命名时大小一致即可认为相同
+        return Path(s3_key).stem == digest
+
+    def upload(self, local_file_path, bucket_name, s3_key):
+        """
+        上传文件到S3，内容相同的对象已存在时跳过
+
+        Args:
+            local_file_path: 本地文件路径
+            bucket_name: S3存储桶名称
+            s3_key: S3对象键
+
+        Returns:
+            bool: 是否实际上传了文件（False表示已存在而跳过）
+        """
+        size = os.path.getsize(local_file_path)
+        digest = self.local_digest(local_file_path)
+
+        if self.audio_cache and self.audio_cache.is_uploaded(digest, bucket_name, s3_key, size):
+            logger.info(f"清单中已记录上传，跳过: {s3_key}")
+            return False
+
+        uploaded = False
+        if self.remote_matches(bucket_name, s3_key, size, digest):
+            logger.info(f"S3上已存在相同内容，跳过上传: {s3_key}")
+        else:
+            # 哈希写入对象元数据，供之后的运行比较
+            self.call('upload_file', self.transfer_file, local_file_path, bucket_name, s3_key,
+                      {'Metadata': {'sha256': digest}})
+            uploaded = True
+
+        if self.audio_cache:
+            self.audio_cache.record_upload(digest, bucket_name, s3_key, size)
+        return uploaded
+
+    def transfer_file(self, local_file_path, bucket_name, s3_key, extra_args=None):
+        """通过共享的传输管理器上传文件并等待完成"""
+        future = self.transfer_manager.upload(str(local_file_path), bucket_name, s3_key, extra_args=extra_args)
+        return future.result()
+
+    def submit(self, local_file_path, bucket_name, s3_key):
+        """
+        在后台提交上传
+
+        Returns:
+            Future: 结果同upload()，失败时抛出异常
+        """
+        return self.executor.submit(self.upload, local_file_path, bucket_name, s3_key)
+
+    def upload_stream(self, stream, bucket_name, s3_key, part_size=None, buffers=None):
+        """
+        把数据流分片上传到S3，同时计算SHA-256
+
+        读取下一片的同时上传已读取的分片，内存中最多保留 buffers + 1 个分片
+
+        Args:
+            stream: 可读的二进制流（例如 response.raw）
+            bucket_name: S3存储桶名称
+            s3_key: S3对象键
+            part_size: 分片大小，默认使用传输配置的分片大小（不小于5MB）
+            buffers: 同时上传的分片数，默认读取 S3_STREAM_BUFFERS
+
+        Returns:
+            tuple: (SHA-256, 字节数)
+        """
+        part_size = max(MIN_PART_SIZE, part_size or self.transfer_config.multipart_chunksize)
+        if buffers is None:
+            buffers = int(os.getenv('S3_STREAM_BUFFERS', '2'))
+        buffers = max(1, buffers)
+
+        response = self.call('create_multipart_upload', self.s3_client.create_multipart_upload,
+                             Bucket=bucket_name, Key=s3_key)
+        upload_id = response['UploadId']
+
+        def upload_part(part_number, body):
+            try:
+                result = self.call('upload_part', self.s3_client.upload_part,
+                                   Bucket=bucket_name, Key=s3_key, UploadId=upload_id,
+                                   PartNumber=part_number, Body=body)
+                return {'ETag': result['ETag'], 'PartNumber': part_number}
+            finally:
+                slots.release()
+
+        sha256 = hashlib.sha256()
+        size = 0
+        slots = threading.BoundedSemaphore(buffers)
+        futures = []
+        try:
+            with ThreadPoolExecutor(max_workers=buffers) as pool:
+                while True:
+                    slots.acquire()
+                    if any(future.done() and future.exception() for future in futures):
+                        # 已有分片上传失败，不再继续读取
+                        slots.release()
+                        break
+                    chunk = read_exact(stream, part_size)
+                    if not chunk and futures:
+                        slots.release()
+                        break
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    futures.append(pool.submit(upload_part, len(futures) + 1, chunk))
+                    if len(chunk) < part_size:
+                        break
+                parts = [future.result() for future in futures]
+
+            if size == 0:
+                raise IOError("下载的文件为空")
+
+            self.call('complete_multipart_upload', self.s3_client.complete_multipart_upload,
+                      Bucket=bucket_name, Key=s3_key, UploadId=upload_id,
+                      MultipartUpload={'Parts': parts})
+        except Exception:
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=bucket_name, Key=s3_key, UploadId=upload_id)
+            except Exception as e:
+                logger.warning(f"取消分片上传失败 {s3_key}: {str(e)}")
+            raise
+
+        return sha256.hexdigest(), size
+
+    def promote(self, bucket_name, temp_key, s3_key, digest, size):
+        """
+        把临时对象移动到以内容哈希命名的对象键（服务端复制），相同内容已存在时直接删除临时对象
+
+        Args:
+            bucket_name: S3存储桶名称
+            temp_key: 临时对象键
+            s3_key: 目标对象键
+            digest: 内容SHA-256
+            size: 对象大小
+
+        Returns:
+            bool: 是否复制了对象（False表示目标已存在）
+        """
+        try:
+            if self.remote_matches(bucket_name, s3_key, size, digest):
+                logger.info(f"S3上已存在相同内容，丢弃临时对象: {temp_key}")
+                return False
+            self.call('copy_object', self.s3_client.copy_object,
+                      Bucket=bucket_name, Key=s3_key,
+                      CopySource={'Bucket': bucket_name, 'Key': temp_key},
+                      Metadata={'sha256': digest}, MetadataDirective='REPLACE')
+            return True
+        finally:
+            self.call('delete_object', self.s3_client.delete_object, Bucket=bucket_name, Key=temp_key)
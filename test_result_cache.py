@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+转录结果缓存测试
+覆盖从临时文件保存结果的两种方式：增量BLOB接口和没有该接口时的回退路径
+"""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from result_cache import TranscriptResultCache
+
+DIGEST = 'a' * 64
+SETTINGS = {'MediaFormat': 'mp3', 'Settings': {'ShowSpeakerLabels': True, 'MaxSpeakerLabels': 2}}
+RESULT = {'results': {'transcripts': [{'transcript': 'hola, ¿cómo está?'}], 'items': list(range(1000))}}
+
+
+class PutFileTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        self.cache = TranscriptResultCache(root / 'result_cache.db')
+        self.spool_file = root / 'spool.json'
+        self.spool_file.write_text(json.dumps(RESULT, ensure_ascii=False), encoding='utf-8')
+
+    def tearDown(self):
+        self.cache.conn.close()
+        self.temp_dir.cleanup()
+
+    def check_put_file(self):
+        self.cache.put_file(DIGEST, 'es-US', SETTINGS, self.spool_file, 'job-1')
+        self.assertEqual(self.cache.get(DIGEST, 'es-US', SETTINGS), RESULT)
+        # 覆盖已有结果
+        self.cache.put(DIGEST, 'es-US', SETTINGS, {'results': {}})
+        self.cache.put_file(DIGEST, 'es-US', SETTINGS, self.spool_file)
+        self.assertEqual(self.cache.get(DIGEST, 'es-US', SETTINGS), RESULT)
+        self.assertEqual(self.cache.stats(), {'result_count': 1, 'audio_count': 1})
+
+    @unittest.skipUnless(hasattr(__import__('sqlite3').Connection, 'blobopen'), "需要Python 3.11+")
+    def test_put_file_blobopen(self):
+        self.assertTrue(self.cache.supports_blobopen)
+        self.check_put_file()
+
+    def test_put_file_fallback(self):
+        # 模拟Python 3.11以下没有 Connection.blobopen 的情况
+        self.cache.supports_blobopen = False
+        self.check_put_file()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,6 +13,8 @@ import json
 from pathlib import Path
 import logging
 from dotenv import load_dotenv
+from job_tracker import TranscriptionJobTracker
+from audio_utils import get_mp3_duration
 
 # 加载环境变量
 load_dotenv()
@@ -304,124 +306,120 @@ def test_single_audio():
         # 4. 等待转录完成
         logger.info("步骤4: 等待转录完成（这可能需要几分钟）")
         
-        while True:
-            response = transcribe_client.get_transcription_job(
-                TranscriptionJobName=job_name
-            )
+        tracker = TranscriptionJobTracker(transcribe_client, job_name_prefix='test-transcribe-')
+        job = tracker.wait(job_name, expected_duration=get_mp3_duration(local_file))
+        if job is None:
+            logger.error("转录任务超时或状态查询失败")
+            return
+        response = {'TranscriptionJob': job}
+        
+        status = response['TranscriptionJob']['TranscriptionJobStatus']
+        logger.info(f"转录状态: {status}")
+        
+        if status == 'COMPLETED':
+            # 5. 下载转录结果
+            logger.info("步骤5: 下载转录结果")
+            transcript_uri = response['TranscriptionJob']['Transcript']['TranscriptFileUri']
             
-            status = response['TranscriptionJob']['TranscriptionJobStatus']
-            logger.info(f"转录状态: {status}")
+            transcript_response = requests.get(transcript_uri)
+            transcript_data = transcript_response.json()
             
-            if status == 'COMPLETED':
-                # 5. 下载转录结果
-                logger.info("步骤5: 下载转录结果")
-                transcript_uri = response['TranscriptionJob']['Transcript']['TranscriptFileUri']
-                
-                transcript_response = requests.get(transcript_uri)
-                transcript_data = transcript_response.json()
-                
-                # 保存结果
-                result_dir = Path('test_results')
-                result_dir.mkdir(exist_ok=True)
-                
-                # 创建带标签的转录文本
-                labeled_transcript = create_labeled_transcript(transcript_data)
-                
-                # 提取说话人信息
-                speaker_segments = []
-                try:
-                    # 处理results可能是列表的情况
-                    results_data = transcript_data['results']
-                    if isinstance(results_data, list) and len(results_data) > 0:
-                        results_data = results_data[0]
-                    
-                    if 'speaker_labels' in results_data and 'segments' in results_data['speaker_labels']:
-                        for segment in results_data['speaker_labels']['segments']:
-                            speaker_segments.append({
-                                'speaker': segment['speaker_label'],
-                                'start_time': segment['start_time'],
-                                'end_time': segment['end_time'],
-                                'items': segment.get('items', [])
-                            })
-                        logger.info(f"提取了 {len(speaker_segments)} 个说话人片段")
-                    else:
-                        logger.info("未找到说话人片段信息")
-                except Exception as e:
-                    logger.error(f"提取说话人信息失败: {str(e)}")
-                
-                # 获取原始转录文本
-                try:
-                    results_data = transcript_data['results']
-                    if isinstance(results_data, list) and len(results_data) > 0:
-                        results_data = results_data[0]
-                    transcript_text = results_data['transcripts'][0]['transcript']
-                except Exception as e:
-                    logger.error(f"获取原始转录文本失败: {str(e)}")
-                    transcript_text = "[无法获取原始转录文本]"
-                
-                # 保存完整JSON结果（包含带标签转录）
-                complete_result = {
-                    'transcript': transcript_text,
-                    'labeled_transcript': labeled_transcript,
-                    'speaker_segments': speaker_segments,
-                    'full_result': transcript_data
-                }
-                
-                with open(result_dir / 'test_transcript.json', 'w', encoding='utf-8') as f:
-                    json.dump(complete_result, f, ensure_ascii=False, indent=2)
-                
-                # 保存格式化的文本结果
-                with open(result_dir / 'test_transcript.txt', 'w', encoding='utf-8') as f:
-                    f.write("=== 带标签的转录文本（推荐用于分析） ===\n")
-                    f.write(labeled_transcript + "\n\n")
-                    
-                    f.write("=== 原始完整转录文本 ===\n")
-                    f.write(transcript_text + "\n\n")
-                    
-                    # 添加说话人分段信息（带时间戳）
-                    if speaker_segments:
-                        f.write("=== 按说话人分段（详细时间） ===\n")
-                        for segment in speaker_segments:
-                            start_time = float(segment['start_time'])
-                            end_time = float(segment['end_time'])
-                            
-                            # 格式化时间
-                            start_min = int(start_time // 60)
-                            start_sec = start_time % 60
-                            end_min = int(end_time // 60)
-                            end_sec = end_time % 60
-                            
-                            time_str = f"[{start_min:02d}:{start_sec:05.2f} - {end_min:02d}:{end_sec:05.2f}]"
-                            
-                            # 获取这个时间段的文本
-                            segment_text = ""
-                            for item in segment['items']:
-                                if 'alternatives' in item and len(item['alternatives']) > 0:
-                                    segment_text += item['alternatives'][0]['content'] + " "
-                            
-                            # 使用友好的说话人名称
-                            speaker_name = get_speaker_name(segment['speaker'])
-                            f.write(f"{speaker_name} {time_str}: {segment_text.strip()}\n")
-                
-                logger.info("转录完成！")
-                logger.info("=== 带标签的转录预览 ===")
-                # 显示前200个字符的带标签转录
-                preview = labeled_transcript[:200] + "..." if len(labeled_transcript) > 200 else labeled_transcript
-                logger.info(f"{preview}")
-                logger.info(f"完整结果保存在: {result_dir}")
-                logger.info(f"  - test_transcript.json: 完整JSON数据")
-                logger.info(f"  - test_transcript.txt: 格式化文本（包含标签）")
+            # 保存结果
+            result_dir = Path('test_results')
+            result_dir.mkdir(exist_ok=True)
+            
+            # 创建带标签的转录文本
+            labeled_transcript = create_labeled_transcript(transcript_data)
+            
+            # 提取说话人信息
+            speaker_segments = []
+            try:
+                # 处理results可能是列表的情况
+                results_data = transcript_data['results']
+                if isinstance(results_data, list) and len(results_data) > 0:
+                    results_data = results_data[0]
                 
-                break
+                if 'speaker_labels' in results_data and 'segments' in results_data['speaker_labels']:
+                    for segment in results_data['speaker_labels']['segments']:
+                        speaker_segments.append({
+                            'speaker': segment['speaker_label'],
+                            'start_time': segment['start_time'],
+                            'end_time': segment['end_time'],
+                            'items': segment.get('items', [])
+                        })
+                    logger.info(f"提取了 {len(speaker_segments)} 个说话人片段")
+                else:
+                    logger.info("未找到说话人片段信息")
+            except Exception as e:
+                logger.error(f"提取说话人信息失败: {str(e)}")
+            
+            # 获取原始转录文本
+            try:
+                results_data = transcript_data['results']
+                if isinstance(results_data, list) and len(results_data) > 0:
+                    results_data = results_data[0]
+                transcript_text = results_data['transcripts'][0]['transcript']
+            except Exception as e:
+                logger.error(f"获取原始转录文本失败: {str(e)}")
+                transcript_text = "[无法获取原始转录文本]"
+            
+            # 保存完整JSON结果（包含带标签转录）
+            complete_result = {
+                'transcript': transcript_text,
+                'labeled_transcript': labeled_transcript,
+                'speaker_segments': speaker_segments,
+                'full_result': transcript_data
+            }
+            
+            with open(result_dir / 'test_transcript.json', 'w', encoding='utf-8') as f:
+                json.dump(complete_result, f, ensure_ascii=False, indent=2)
+            
+            # 保存格式化的文本结果
+            with open(result_dir / 'test_transcript.txt', 'w', encoding='utf-8') as f:
+                f.write("=== 带标签的转录文本（推荐用于分析） ===\n")
+                f.write(labeled_transcript + "\n\n")
                 
-            elif status == 'FAILED':
-                logger.error("转录任务失败")
-                failure_reason = response['TranscriptionJob'].get('FailureReason', '未知原因')
-                logger.error(f"失败原因: {failure_reason}")
-                break
+                f.write("=== 原始完整转录文本 ===\n")
+                f.write(transcript_text + "\n\n")
                 
-            else:
-                time.sleep(30)  # 等待30秒后再次检查
+                # 添加说话人分段信息（带时间戳）
+                if speaker_segments:
+                    f.write("=== 按说话人分段（详细时间） ===\n")
+                    for segment in speaker_segments:
+                        start_time = float(segment['start_time'])
+                        end_time = float(segment['end_time'])
+                        
+                        # 格式化时间
+                        start_min = int(start_time // 60)
+                        start_sec = start_time % 60
+                        end_min = int(end_time // 60)
+                        end_sec = end_time % 60
+                        
+                        time_str = f"[{start_min:02d}:{start_sec:05.2f} - {end_min:02d}:{end_sec:05.2f}]"
+                        
+                        # 获取这个时间段的文本
+                        segment_text = ""
+                        for item in segment['items']:
+                            if 'alternatives' in item and len(item['alternatives']) > 0:
+                                segment_text += item['alternatives'][0]['content'] + " "
+                        
+                        # 使用友好的说话人名称
+                        speaker_name = get_speaker_name(segment['speaker'])
+                        f.write(f"{speaker_name} {time_str}: {segment_text.strip()}\n")
+            
+            logger.info("转录完成！")
+            logger.info("=== 带标签的转录预览 ===")
+            # 显示前200个字符的带标签转录
+            preview = labeled_transcript[:200] + "..." if len(labeled_transcript) > 200 else labeled_transcript
+            logger.info(f"{preview}")
+            logger.info(f"完整结果保存在: {result_dir}")
+            logger.info(f"  - test_transcript.json: 完整JSON数据")
+            logger.info(f"  - test_transcript.txt: 格式化文本（包含标签）")
+            
+        elif status == 'FAILED':
+            logger.error("转录任务失败")
+            failure_reason = response['TranscriptionJob'].get('FailureReason', '未知原因')
+            logger.error(f"失败原因: {failure_reason}")
         
         # 清理（可选）
         # os.remove(local_file)
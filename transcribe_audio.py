@@ -4,16 +4,25 @@
 从CSV文件中读取MP3 URL，下载音频文件，并使用AWS Transcribe进行语音转文字
 """
 
-import pandas as pd
-import requests
 import boto3
 import os
 import time
 import json
+import threading
 from urllib.parse import urlparse
 from pathlib import Path
 import logging
 from dotenv import load_dotenv
+from job_tracker import TranscriptionJobTracker
+from audio_utils import get_mp3_duration
+from rate_limiter import get_shared_rate_limiter
+from http_client import create_http_session, download_to_file
+from audio_cache import AudioCache
+from s3_uploader import S3Uploader, create_s3_client
+from labeling_engine import LabelResolver, build_labeled_transcript
+from csv_loader import load_csv, processing_columns
+from result_cache import TranscriptResultCache, audio_digest
+from audio_prefetcher import AudioPrefetcher
 
 # 加载环境变量
 load_dotenv()
@@ -31,14 +40,52 @@ class AudioTranscriber:
             aws_region: AWS区域，默认为us-east-1
         """
         self.transcribe_client = boto3.client('transcribe', region_name=aws_region)
-        self.s3_client = boto3.client('s3', region_name=aws_region)
+        self.s3_client = create_s3_client(aws_region)  # 连接池大小按并发上传数配置
         self.aws_region = aws_region
         
+        # 共享的HTTP连接池，所有下载线程复用同一会话
+        self.http_session = create_http_session()
+        
+        # 共享的AWS API限流器，所有AWS调用都经过它
+        self.rate_limiter = get_shared_rate_limiter()
+        
+        # 共享的转录任务跟踪器，批量轮询所有未完成任务
+        self.job_tracker = TranscriptionJobTracker(
+            self.transcribe_client,
+            poll_interval=int(os.getenv('POLL_INTERVAL', '5')),
+            rate_limiter=self.rate_limiter
+        )
+        
         # 创建本地目录
         self.audio_dir = Path('downloaded_audio')
         self.transcripts_dir = Path('transcripts')
         self.audio_dir.mkdir(exist_ok=True)
         self.transcripts_dir.mkdir(exist_ok=True)
+        
+        # 内容寻址的音频缓存，清单记录URL、哈希、大小、访问时间和S3对象键
+        self.audio_cache = AudioCache(self.audio_dir)
+        
+        # S3上传器，共享传输管理器，按缓存清单和HeadObject跳过已上传的内容
+        self.s3_uploader = S3Uploader(self.s3_client, self.audio_cache, self.rate_limiter)
+        
+        # 转录任务设置，同时作为结果缓存键的一部分
+        self.language_code = 'es-US'  # 美国西班牙语
+        self.media_format = 'mp3'
+        self.transcribe_settings = {
+            'ShowSpeakerLabels': True,  # 显示说话人标签
+            'MaxSpeakerLabels': 10,     # 最多10个说话人
+            'ChannelIdentification': True  # 启用声道识别
+        }
+        
+        # 说话人/声道显示名称查找表（环境变量和 LABEL_CONFIG 只在这里读取一次）
+        self.label_resolver = LabelResolver.from_env(self.language_code, self.transcribe_settings['MaxSpeakerLabels'])
+        
+        # 转录结果缓存，相同音频和设置不重复转录
+        self.result_cache = TranscriptResultCache(self.transcripts_dir / 'result_cache.db')
+        
+        # 按缓存文件名区分的下载锁
+        self.download_locks = {}
+        self.download_locks_guard = threading.Lock()
     
     def get_cached_filename(self, url):
         """
@@ -66,54 +113,65 @@ class AudioTranscriber:
         else:
             return f"audio_{url_hash}.mp3"
     
-    def download_audio_file(self, url, filename=None):
+    def download_lock(self, filename):
+        """
+        获取指定缓存文件的下载锁
+        
+        Args:
+            filename: 缓存文件名
+            
+        Returns:
+            threading.Lock: 该文件对应的锁
+        """
+        with self.download_locks_guard:
+            if filename not in self.download_locks:
+                self.download_locks[filename] = threading.Lock()
+            return self.download_locks[filename]
+    
+    def download_audio_file(self, url, filename=None, pin=False):
         """
-        下载音频文件，如果本地已存在则使用缓存
+        下载音频文件，如果已缓存则直接使用缓存
         
         Args:
             url: 音频文件URL
-            filename: 本地保存的文件名，如果为None则自动生成
+            filename: 下载时使用的临时文件名，如果为None则根据URL生成
+            pin: 是否固定缓存文件，固定期间不会被缓存淘汰，用完后调用 audio_cache.unpin 释放
             
         Returns:
-            str: 本地文件路径，如果下载失败返回None
+            str: 本地缓存文件路径，如果下载失败返回None
         """
         try:
-            # 如果没有指定文件名，则根据URL生成缓存文件名
+            # 查询缓存清单，不需要探测文件系统
+            cached_path = self.audio_cache.lookup(url, pin=pin)
+            if cached_path:
+                logger.info(f"使用缓存文件: {cached_path}")
+                return str(cached_path)
+            
+            # 如果没有指定文件名，则根据URL生成临时文件名
             if filename is None:
                 filename = self.get_cached_filename(url)
             
             file_path = self.audio_dir / filename
             
-            # 检查文件是否已存在
-            if file_path.exists():
-                file_size = file_path.stat().st_size
-                if file_size > 0:  # 确保文件不为空
-                    logger.info(f"使用缓存文件: {file_path} (大小: {file_size} 字节)")
-                    return str(file_path)
-                else:
-                    logger.warning(f"缓存文件为空，重新下载: {file_path}")
-                    file_path.unlink()  # 删除空文件
-            
-            logger.info(f"正在下载: {url}")
-            
-            # 发送HTTP请求下载文件
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            # 保存文件
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            # 验证下载的文件大小
-            file_size = file_path.stat().st_size
-            if file_size == 0:
-                logger.error(f"下载的文件为空: {file_path}")
-                file_path.unlink()  # 删除空文件
-                return None
-            
-            logger.info(f"下载完成: {file_path} (大小: {file_size} 字节)")
-            return str(file_path)
+            # 同一文件同时只允许一个线程下载（预取线程和处理线程可能同时请求）
+            with self.download_lock(filename):
+                # 等待锁期间可能已被其他线程下载完成
+                cached_path = self.audio_cache.lookup(url, pin=pin)
+                if cached_path:
+                    logger.info(f"使用缓存文件: {cached_path}")
+                    return str(cached_path)
+                
+                # 总是重新下载，路径上残留的旧版按URL命名的文件会被覆盖（需要保留时先运行 manage_cache.py migrate）
+                logger.info(f"正在下载: {url}")
+                # 先下载到临时文件，中断后可续传，校验通过后原子重命名
+                download_to_file(self.http_session, url, file_path)
+                
+                # 按内容哈希存入缓存，相同内容的音频只保存一份
+                cached_path = self.audio_cache.add(url, file_path, pin=pin)
+                file_size = cached_path.stat().st_size
+                
+                logger.info(f"下载完成: {cached_path} (大小: {file_size} 字节)")
+                return str(cached_path)
             
         except Exception as e:
             logger.error(f"下载失败 {url}: {str(e)}")
@@ -121,7 +179,7 @@ class AudioTranscriber:
     
     def upload_to_s3(self, local_file_path, bucket_name, s3_key):
         """
-        上传文件到S3
+        上传文件到S3，S3上已有相同内容的对象时跳过
         
         Args:
             local_file_path: 本地文件路径
@@ -134,16 +192,32 @@ class AudioTranscriber:
         try:
             logger.info(f"正在上传到S3: {s3_key}")
             
-            self.s3_client.upload_file(local_file_path, bucket_name, s3_key)
+            # 相同内容的对象已存在时跳过上传
+            uploaded = self.s3_uploader.upload(local_file_path, bucket_name, s3_key)
             s3_uri = f"s3://{bucket_name}/{s3_key}"
             
-            logger.info(f"上传完成: {s3_uri}")
+            if uploaded:
+                logger.info(f"上传完成: {s3_uri}")
             return s3_uri
             
         except Exception as e:
             logger.error(f"S3上传失败: {str(e)}")
             return None
     
+    def submit_upload(self, local_file_path, bucket_name, s3_key):
+        """
+        在后台上传文件到S3，不阻塞调用方
+        
+        Args:
+            local_file_path: 本地文件路径
+            bucket_name: S3存储桶名称
+            s3_key: S3对象键
+            
+        Returns:
+            Future: 结果为S3 URI，上传失败时为None
+        """
+        return self.s3_uploader.executor.submit(self.upload_to_s3, local_file_path, bucket_name, s3_key)
+    
     def start_transcription_job(self, job_name, s3_uri):
         """
         启动AWS Transcribe转录任务
@@ -159,16 +233,14 @@ class AudioTranscriber:
             logger.info(f"启动转录任务: {job_name}")
             
             # 启动转录任务，设置为墨西哥西班牙语（使用美国西班牙语识别）
-            self.transcribe_client.start_transcription_job(
+            self.rate_limiter.call(
+                'start_transcription_job',
+                self.transcribe_client.start_transcription_job,
                 TranscriptionJobName=job_name,
                 Media={'MediaFileUri': s3_uri},
-                MediaFormat='mp3',
-                LanguageCode='es-US',  # 美国西班牙语
-                Settings={
-                    'ShowSpeakerLabels': True,  # 显示说话人标签
-                    'MaxSpeakerLabels': 10,     # 最多10个说话人
-                    'ChannelIdentification': True  # 启用声道识别
-                }
+                MediaFormat=self.media_format,
+                LanguageCode=self.language_code,
+                Settings=self.transcribe_settings
             )
             
             logger.info(f"转录任务已启动: {job_name}")
@@ -178,44 +250,90 @@ class AudioTranscriber:
             logger.error(f"启动转录任务失败: {str(e)}")
             return False
     
-    def wait_for_transcription_completion(self, job_name, max_wait_time=1800):
+    def result_cache_settings(self):
+        """返回影响转录结果的任务设置，作为结果缓存键的一部分"""
+        return {'MediaFormat': self.media_format, 'Settings': self.transcribe_settings}
+    
+    def get_cached_result(self, s3_uri):
+        """
+        查找相同音频、相同任务设置的已缓存转录结果
+        
+        Args:
+            s3_uri: S3音频文件URI（以内容哈希命名）
+            
+        Returns:
+            dict: 转录结果JSON，未缓存时返回None
+        """
+        try:
+            transcript_data = self.result_cache.get(audio_digest(s3_uri), self.language_code,
+                                                    self.result_cache_settings())
+            if transcript_data is not None:
+                logger.info(f"使用缓存的转录结果，不启动转录任务: {s3_uri}")
+            return transcript_data
+        except Exception as e:
+            logger.error(f"读取转录结果缓存失败: {str(e)}")
+            return None
+    
+    def cache_result(self, s3_uri, transcript_data, job_name=None):
+        """
+        保存转录结果到结果缓存
+        
+        Args:
+            s3_uri: S3音频文件URI（以内容哈希命名）
+            transcript_data: 转录结果JSON
+            job_name: 转录任务名称
+        """
+        try:
+            self.result_cache.put(audio_digest(s3_uri), self.language_code, self.result_cache_settings(),
+                                  transcript_data, job_name)
+        except Exception as e:
+            logger.error(f"保存转录结果缓存失败: {str(e)}")
+    
+    def estimate_audio_duration(self, call_seconds=None, local_file_path=None):
+        """
+        估算音频时长，用于规划转录任务的轮询时间
+        
+        Args:
+            call_seconds: CSV中的call_seconds字段，优先使用
+            local_file_path: 本地音频文件路径，没有call_seconds时读取MP3文件头
+            
+        Returns:
+            float: 时长（秒），无法获取时返回None
+        """
+        try:
+            if call_seconds is not None and call_seconds == call_seconds and float(call_seconds) > 0:
+                return float(call_seconds)
+        except (TypeError, ValueError):
+            pass
+        
+        if local_file_path:
+            return get_mp3_duration(local_file_path)
+        return None
+    
+    def wait_for_transcription_completion(self, job_name, max_wait_time=1800, expected_duration=None):
         """
         等待转录任务完成
         
         Args:
             job_name: 转录任务名称
             max_wait_time: 最大等待时间（秒），默认30分钟
+            expected_duration: 音频时长（秒），用于规划首次检查时间和退避间隔
             
         Returns:
             dict: 转录结果，如果失败返回None
         """
         logger.info(f"等待转录任务完成: {job_name}")
         
-        start_time = time.time()
+        # 由共享的任务跟踪器批量刷新状态，这里只等待结果
+        job = self.job_tracker.wait(job_name, timeout=max_wait_time, expected_duration=expected_duration)
+        if job is None:
+            return None
         
-        while time.time() - start_time < max_wait_time:
-            try:
-                response = self.transcribe_client.get_transcription_job(
-                    TranscriptionJobName=job_name
-                )
-                
-                status = response['TranscriptionJob']['TranscriptionJobStatus']
-                
-                if status == 'COMPLETED':
-                    logger.info(f"转录任务完成: {job_name}")
-                    return response['TranscriptionJob']
-                elif status == 'FAILED':
-                    logger.error(f"转录任务失败: {job_name}")
-                    return None
-                else:
-                    logger.info(f"转录任务状态: {status}, 继续等待...")
-                    time.sleep(30)  # 等待30秒后再次检查
-                    
-            except Exception as e:
-                logger.error(f"检查转录任务状态失败: {str(e)}")
-                return None
+        if job['TranscriptionJobStatus'] == 'COMPLETED':
+            logger.info(f"转录任务完成: {job_name}")
+            return job
         
-        logger.error(f"转录任务超时: {job_name}")
+        logger.error(f"转录任务失败: {job_name}")
         return None
     
     def download_transcript(self, transcript_uri):
@@ -231,7 +349,7 @@ class AudioTranscriber:
         try:
             logger.info(f"下载转录结果: {transcript_uri}")
             
-            response = requests.get(transcript_uri)
+            response = self.http_session.get(transcript_uri)
             response.raise_for_status()
             
             return response.json()
@@ -323,7 +441,7 @@ class AudioTranscriber:
                                 segment_text += item['alternatives'][0]['content'] + " "
                         
                         # 使用友好的说话人名称
-                        speaker_name = self.get_speaker_name(segment['speaker'])
+                        speaker_name = self.label_resolver.speaker(segment['speaker'])
                         f.write(f"{speaker_name} {time_str}: {segment_text.strip()}\n")
             
             logger.info(f"格式化文本已保存: {text_file}")
@@ -341,23 +459,7 @@ class AudioTranscriber:
         Returns:
             str: 友好的说话人名称
         """
-        # 从环境变量读取自定义标签
-        speaker_0_label = os.getenv('SPEAKER_0_LABEL', '客服')
-        speaker_1_label = os.getenv('SPEAKER_1_LABEL', '客户')
-        
-        speaker_mapping = {
-            'spk_0': f'[{speaker_0_label}]',
-            'spk_1': f'[{speaker_1_label}]', 
-            'spk_2': '[说话人3]',
-            'spk_3': '[说话人4]',
-            'spk_4': '[说话人5]',
-            'spk_5': '[说话人6]',
-            'spk_6': '[说话人7]',
-            'spk_7': '[说话人8]',
-            'spk_8': '[说话人9]',
-            'spk_9': '[说话人10]'
-        }
-        return speaker_mapping.get(speaker_label, f'[{speaker_label}]')
+        return self.label_resolver.speaker(speaker_label)
     
     def get_channel_name(self, channel_label):
         """
@@ -369,13 +471,7 @@ class AudioTranscriber:
         Returns:
             str: 友好的声道名称
         """
-        channel_mapping = {
-            'ch_0': '[声道1-客服]',
-            'ch_1': '[声道2-客户]',
-            'ch_2': '[声道3]',
-            'ch_3': '[声道4]'
-        }
-        return channel_mapping.get(channel_label, f'[{channel_label}]')
+        return self.label_resolver.channel(channel_label)
     
     def create_labeled_transcript(self, transcript_data):
         """
@@ -388,128 +484,7 @@ class AudioTranscriber:
             str: 带标签的转录文本
         """
         try:
-            labeled_lines = []
-            
-            # 处理results可能是列表的情况
-            results_data = transcript_data['results']
-            if isinstance(results_data, list) and len(results_data) > 0:
-                results_data = results_data[0]
-            
-            logger.info(f"数据结构检查: results类型={type(results_data)}")
-            
-            # 优先使用说话人标签
-            if isinstance(results_data, dict) and 'speaker_labels' in results_data:
-                logger.info("使用说话人标签进行分段")
-                speaker_labels = results_data['speaker_labels']
-                
-                if isinstance(speaker_labels, dict) and 'segments' in speaker_labels:
-                    segments = speaker_labels['segments']
-                    logger.info(f"找到 {len(segments)} 个说话人片段")
-                    
-                    for segment in segments:
-                        speaker_label = segment.get('speaker_label', 'unknown')
-                        speaker_name = self.get_speaker_name(speaker_label)
-                        
-                        # 获取这个时间段的文本
-                        segment_text = ""
-                        if 'items' in segment:
-                            for item in segment['items']:
-                                if isinstance(item, dict) and 'alternatives' in item:
-                                    if len(item['alternatives']) > 0:
-                                        content = item['alternatives'][0].get('content', '')
-                                        if item.get('type') == 'punctuation':
-                                            segment_text = segment_text.rstrip() + content + " "
-                                        else:
-                                            segment_text += content + " "
-                        
-                        if segment_text.strip():
-                            labeled_lines.append(f"{speaker_name}: {segment_text.strip()}")
-            
-            # 如果没有说话人标签，使用声道标签
-            elif isinstance(results_data, dict) and 'channel_labels' in results_data:
-                logger.info("使用声道标签进行分段")
-                channel_labels = results_data['channel_labels']
-                
-                if isinstance(channel_labels, dict) and 'channels' in channel_labels:
-                    channels = channel_labels['channels']
-                    logger.info(f"找到 {len(channels)} 个声道")
-                    
-                    # 收集所有带时间戳的词汇
-                    all_items = []
-                    for channel in channels:
-                        channel_label = channel.get('channel_label', 'unknown')
-                        channel_name = self.get_channel_name(channel_label)
-                        
-                        if 'items' in channel:
-                            for item in channel['items']:
-                                if (isinstance(item, dict) and 
-                                    item.get('type') == 'pronunciation' and 
-                                    'start_time' in item and 
-                                    'alternatives' in item and
-                                    len(item['alternatives']) > 0):
-                                    
-                                    all_items.append({
-                                        'start_time': float(item['start_time']),
-                                        'content': item['alternatives'][0].get('content', ''),
-                                        'channel': channel_name
-                                    })
-                    
-                    logger.info(f"收集到 {len(all_items)} 个词汇项目")
-                    
-                    if all_items:
-                        # 按时间排序
-                        all_items.sort(key=lambda x: x['start_time'])
-                        
-                        # 按声道分组连续的文本
-                        current_channel = None
-                        current_text = ""
-                        
-                        for item in all_items:
-                            if item['channel'] != current_channel:
-                                # 保存前一个声道的文本
-                                if current_text.strip():
-                                    labeled_lines.append(f"{current_channel}: {current_text.strip()}")
-                                
-                                # 开始新的声道
-                                current_channel = item['channel']
-                                current_text = item['content'] + " "
-                            else:
-                                current_text += item['content'] + " "
-                        
-                        # 保存最后一个声道的文本
-                        if current_text.strip():
-                            labeled_lines.append(f"{current_channel}: {current_text.strip()}")
-            
-            # 如果都没有，尝试从原始转录文本创建简单标签
-            if not labeled_lines:
-                logger.info("未找到说话人或声道标签，尝试简单分段")
-                
-                # 获取原始转录文本
-                original_text = ""
-                if isinstance(results_data, dict) and 'transcripts' in results_data:
-                    transcripts = results_data['transcripts']
-                    if len(transcripts) > 0:
-                        original_text = transcripts[0].get('transcript', '')
-                
-                if original_text:
-                    # 简单的句子分割 - 按句号、问号、感叹号分割
-                    import re
-                    sentences = re.split(r'[.!?。！？]+', original_text)
-                    
-                    # 交替分配给两个说话人
-                    for i, sentence in enumerate(sentences):
-                        sentence = sentence.strip()
-                        if sentence:
-                            speaker = self.get_speaker_name('spk_0') if i % 2 == 0 else self.get_speaker_name('spk_1')
-                            labeled_lines.append(f"{speaker}: {sentence}")
-                
-                if not labeled_lines:
-                    labeled_lines.append(f"[未识别说话人]: {original_text}")
-            
-            result = "\n\n".join(labeled_lines)
-            logger.info(f"最终生成 {len(labeled_lines)} 个标签片段")
-            return result
-            
+            return build_labeled_transcript(transcript_data, self.label_resolver.speaker, self.label_resolver.channel)
         except Exception as e:
             logger.error(f"创建带标签转录失败: {str(e)}")
             # 返回原始文本作为备选
@@ -539,8 +514,20 @@ class AudioTranscriber:
             cleaned_count = 0
             total_size = 0
             
+            # 按清单中的写入时间清理缓存文件
+            for entry in self.audio_cache.entries():
+                if current_time - entry['mtime'] > max_age_seconds:
+                    freed = self.audio_cache.remove(entry['digest'])
+                    if not freed:
+                        # 正在被转录流程使用
+                        continue
+                    total_size += freed
+                    cleaned_count += 1
+                    logger.info(f"删除过期缓存文件: {entry['digest']}{entry['ext']}")
+            
+            # 未迁移的旧缓存文件和中断下载留下的临时文件
             for file_path in self.audio_dir.glob('*'):
-                if file_path.is_file():
+                if file_path.is_file() and not file_path.name.startswith(self.audio_cache.manifest_path.name):
                     file_age = current_time - file_path.stat().st_mtime
                     file_size = file_path.stat().st_size
                     
@@ -566,23 +553,50 @@ class AudioTranscriber:
             dict: 缓存统计信息
         """
         try:
-            file_count = 0
-            total_size = 0
+            # 缓存文件的统计直接来自清单
+            stats = self.audio_cache.stats()
+            file_count = stats['file_count']
+            total_size = stats['total_bytes']
             
+            # 未迁移的旧缓存文件和临时文件
             for file_path in self.audio_dir.glob('*'):
-                if file_path.is_file():
+                if file_path.is_file() and not file_path.name.startswith(self.audio_cache.manifest_path.name):
                     file_count += 1
                     total_size += file_path.stat().st_size
             
             return {
                 'file_count': file_count,
+                'url_count': stats['url_count'],
                 'total_size_mb': total_size / 1024 / 1024,
                 'cache_dir': str(self.audio_dir)
             }
         except Exception as e:
             logger.error(f"获取缓存信息失败: {str(e)}")
             return None
-    def process_csv_file(self, csv_file, s3_bucket, s3_folder_prefix='', audio_column='通话录音', limit=None):
+    def start_prefetch(self, urls, prefetch_workers):
+        """
+        启动后台音频预取，在处理游标之前下载缓存中缺失的文件
+        
+        Args:
+            urls: 按处理顺序排列的音频URL列表
+            prefetch_workers: 预取线程数，0表示不预取
+            
+        Returns:
+            AudioPrefetcher: 预取器，不预取时返回None
+        """
+        if not prefetch_workers:
+            return None
+        prefetcher = AudioPrefetcher(
+            self,
+            workers=prefetch_workers,
+            max_bytes=int(float(os.getenv('PREFETCH_MAX_GB', '2')) * 1024 ** 3),
+            lookahead=int(os.getenv('PREFETCH_LOOKAHEAD', '200'))
+        )
+        prefetcher.start(urls)
+        return prefetcher
+    
+    def process_csv_file(self, csv_file, s3_bucket, s3_folder_prefix='', audio_column='通话录音', limit=None,
+                         prefetch_workers=0, max_cache_bytes=None):
         """
         处理CSV文件中的音频URL
         
@@ -592,11 +606,14 @@ class AudioTranscriber:
             s3_folder_prefix: S3文件夹前缀，例如 'my-project/audio-transcripts/'
             audio_column: 音频URL列名，默认为'通话录音'
             limit: 处理的最大行数，None表示处理所有行
+            prefetch_workers: 后台预取音频的线程数，0表示不预取
+            max_cache_bytes: 音频缓存容量上限（字节），超过时淘汰最久未访问的文件，None表示不限制
         """
+        prefetcher = None
         try:
-            # 读取CSV文件
+            # 读取CSV文件（只读取处理需要的列）
             logger.info(f"读取CSV文件: {csv_file}")
-            df = pd.read_csv(csv_file)
+            df = load_csv(csv_file, processing_columns(audio_column))
             
             if audio_column not in df.columns:
                 logger.error(f"CSV文件中未找到列: {audio_column}")
@@ -610,14 +627,24 @@ class AudioTranscriber:
             
             logger.info(f"找到 {len(valid_urls)} 个有效的音频URL")
             
+            # 设置缓存容量上限并淘汰超出的部分
+            if max_cache_bytes is not None:
+                self.audio_cache.max_bytes = max_cache_bytes
+                self.audio_cache.evict()
+            
+            prefetcher = self.start_prefetch(valid_urls[audio_column].tolist(), prefetch_workers)
+            
             # 处理每个音频文件
             for idx, (original_index, row) in enumerate(valid_urls.iterrows()):
+                if prefetcher:
+                    prefetcher.advance(idx)
+                local_file_path = None
                 try:
                     audio_url = row[audio_column]
                     logger.info(f"处理第 {idx + 1} 个文件 (CSV行号: {original_index}): {audio_url}")
                     
-                    # 下载音频文件（使用缓存）
-                    local_file_path = self.download_audio_file(audio_url)
+                    # 下载音频文件（使用缓存，处理完成前固定，不会被缓存淘汰）
+                    local_file_path = self.download_audio_file(audio_url, pin=True)
                     if not local_file_path:
                         logger.warning(f"跳过CSV行号 {original_index}：下载失败")
                         continue
@@ -632,24 +659,29 @@ class AudioTranscriber:
                         logger.warning(f"跳过CSV行号 {original_index}：S3上传失败")
                         continue
                     
-                    # 启动转录任务（使用原始行号）
-                    job_name = f"transcribe-job-{original_index}-{int(time.time())}"
-                    if not self.start_transcription_job(job_name, s3_uri):
-                        logger.warning(f"跳过CSV行号 {original_index}：转录任务启动失败")
-                        continue
+                    # 相同音频和任务设置已转录过时直接使用缓存的结果，不启动转录任务
+                    transcript_data = self.get_cached_result(s3_uri)
+                    if transcript_data is None:
+                        # 启动转录任务（使用原始行号）
+                        job_name = f"transcribe-job-{original_index}-{int(time.time())}"
+                        if not self.start_transcription_job(job_name, s3_uri):
+                            logger.warning(f"跳过CSV行号 {original_index}：转录任务启动失败")
+                            continue
                     
-                    # 等待转录完成
-                    job_result = self.wait_for_transcription_completion(job_name)
-                    if not job_result:
-                        logger.warning(f"跳过CSV行号 {original_index}：转录任务失败")
-                        continue
+                        # 等待转录完成（按音频时长规划轮询）
+                        expected_duration = self.estimate_audio_duration(row.get('call_seconds'), local_file_path)
+                        job_result = self.wait_for_transcription_completion(job_name, expected_duration=expected_duration)
+                        if not job_result:
+                            logger.warning(f"跳过CSV行号 {original_index}：转录任务失败")
+                            continue
                     
-                    # 下载转录结果
-                    transcript_uri = job_result['Transcript']['TranscriptFileUri']
-                    transcript_data = self.download_transcript(transcript_uri)
-                    if not transcript_data:
-                        logger.warning(f"跳过CSV行号 {original_index}：转录结果下载失败")
-                        continue
+                        # 下载转录结果
+                        transcript_uri = job_result['Transcript']['TranscriptFileUri']
+                        transcript_data = self.download_transcript(transcript_uri)
+                        if not transcript_data:
+                            logger.warning(f"跳过CSV行号 {original_index}：转录结果下载失败")
+                            continue
+                        self.cache_result(s3_uri, transcript_data, job_name)
                     
                     # 保存转录结果（使用原始CSV行号作为文件名）
                     output_file = self.transcripts_dir / f"transcript_{original_index}.json"
@@ -663,11 +695,19 @@ class AudioTranscriber:
                 except Exception as e:
                     logger.error(f"处理CSV行号 {original_index} 时出错: {str(e)}")
                     continue
+                finally:
+                    if local_file_path:
+                        self.audio_cache.unpin(local_file_path)
             
             logger.info("所有文件处理完成")
             
         except Exception as e:
             logger.error(f"处理CSV文件失败: {str(e)}")
+        finally:
+            # 中途出错时也要停止预取线程，并等待后台上传完成、关闭S3传输管理器的线程
+            if prefetcher:
+                prefetcher.stop()
+            self.s3_uploader.shutdown()
 
 
 def main():
@@ -680,6 +720,8 @@ def main():
     S3_FOLDER_PREFIX = os.getenv('S3_FOLDER_PREFIX', '')
     AWS_REGION = os.getenv('AWS_REGION', 'us-east-1')
     LIMIT = int(os.getenv('LIMIT', '5')) if os.getenv('LIMIT') else None
+    PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '0'))
+    MAX_CACHE_BYTES = int(float(os.getenv('CACHE_MAX_GB')) * 1024 ** 3) if os.getenv('CACHE_MAX_GB') else None
     
     # 验证必需的配置
     if not S3_BUCKET:
@@ -723,7 +765,9 @@ def main():
         csv_file=CSV_FILE,
         s3_bucket=S3_BUCKET,
         s3_folder_prefix=S3_FOLDER_PREFIX,
-        limit=LIMIT
+        limit=LIMIT,
+        prefetch_workers=PREFETCH_WORKERS,
+        max_cache_bytes=MAX_CACHE_BYTES
     )
 
 
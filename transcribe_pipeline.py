@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+并发流水线处理模块
+将下载、上传、提交、轮询、保存拆分为独立阶段，阶段之间通过有界队列连接
+轮询阶段由共享的任务跟踪器统一完成，任务结束后直接交给保存阶段
+每个阶段完成后写入作业日志，重新运行时已上传的记录直接进入提交阶段，已提交的任务重新关联
+"""
+
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 队列结束标记
+_STOP = object()
+
+
+class TranscriptionPipeline:
+    def __init__(self, transcriber, s3_bucket, s3_folder_prefix='',
+                 download_workers=4, upload_workers=4, submit_workers=2,
+                 max_in_flight=50, persist_workers=4, queue_size=50, prefetcher=None, stream_to_s3=False):
+        """
+        初始化流水线
+
+        Args:
+            transcriber: ImprovedAudioTranscriber实例
+            s3_bucket: S3存储桶名称
+            s3_folder_prefix: S3文件夹前缀
+            download_workers: 下载阶段线程数
+            upload_workers: 上传阶段线程数
+            submit_workers: 提交转录任务阶段线程数
+            max_in_flight: 同时在运行的转录任务上限
+            persist_workers: 下载并保存转录结果阶段线程数
+            queue_size: 阶段之间队列的最大长度
+            prefetcher: 可选的AudioPrefetcher，下载阶段推进它的处理游标
+            stream_to_s3: 为True时下载阶段把音频直接流式上传到S3，不写本地缓存，上传阶段直接跳过
+        """
+        self.transcriber = transcriber
+        self.prefetcher = prefetcher
+        if prefetcher:
+            # 下载阶段多线程乱序取用，预取的固定按位置逐个释放
+            prefetcher.release_on_advance = False
+        self.stream_to_s3 = stream_to_s3
+        self.s3_bucket = s3_bucket
+        self.s3_folder_prefix = s3_folder_prefix
+        self.queue_size = queue_size
+
+        # 阶段定义: (名称, 处理函数, 线程数)
+        # submit阶段把任务登记到跟踪器，不向下游队列输出；跟踪器回调负责放入persist队列
+        self.stages = [
+            ('download', self.download_stage, download_workers),
+            ('upload', self.upload_stage, upload_workers),
+            ('submit', self.submit_stage, submit_workers),
+            ('persist', self.persist_stage, persist_workers),
+        ]
+
+        # 运行中任务计数，用于限制并发任务数和等待排空
+        self.in_flight_slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self.in_flight_cond = threading.Condition()
+        self.in_flight = 0
+        self.persist_queue = None
+
+        self.stats_lock = threading.Lock()
+        self.success_count = 0
+        self.error_count = 0
+        self.skip_count = 0
+
+    def release_audio(self, task):
+        """释放记录固定的缓存音频，之后允许被缓存淘汰"""
+        local_file_path = task.pop('local_file_path', None)
+        if local_file_path:
+            self.transcriber.audio_cache.unpin(local_file_path)
+
+    def journal(self, task, state, **fields):
+        """把记录的状态变化写入作业日志"""
+        self.transcriber.job_journal.record(task['csv_row_index'], task['audio_url'], state, **fields)
+
+    def record_error(self, task, reason):
+        """记录失败的记录"""
+        self.release_audio(task)
+        logger.warning(f"跳过CSV行号 {task['csv_row_index']}：{reason}")
+        with self.stats_lock:
+            self.error_count += 1
+
+    def record_success(self, task):
+        """记录成功的记录，并定期输出进度"""
+        logger.info(f"CSV行号 {task['csv_row_index']} 处理完成，输出文件: "
+                    f"{task['json_output_file'].name}, {task['txt_output_file'].name}")
+        with self.stats_lock:
+            self.success_count += 1
+            if self.success_count % 10 == 0:
+                logger.info(f"进度报告: 成功 {self.success_count}, 跳过 {self.skip_count}, 失败 {self.error_count}")
+
+    def download_stage(self, task):
+        """下载音频文件（使用缓存，转录任务结束前固定，不会被缓存淘汰）"""
+        if self.stream_to_s3:
+            s3_uri = self.transcriber.stream_audio_to_s3(task['audio_url'], self.s3_bucket, self.s3_folder_prefix)
+            if not s3_uri:
+                self.record_error(task, "S3上传失败")
+                return None
+            task['s3_uri'] = s3_uri
+            self.journal(task, 'uploaded', s3_uri=s3_uri)
+            return task
+
+        local_file_path = self.transcriber.download_audio_file(task['audio_url'], pin=True)
+        if self.prefetcher:
+            self.prefetcher.taken(task['position'])
+            self.prefetcher.advance(task['position'] + 1)
+        if not local_file_path:
+            self.record_error(task, "下载失败")
+            return None
+        task['local_file_path'] = local_file_path
+        self.journal(task, 'downloaded', local_file_path=local_file_path)
+        return task
+
+    def upload_stage(self, task):
+        """上传到S3"""
+        if 's3_uri' in task:
+            # 已在下载阶段流式上传
+            return task
+        s3_key = self.transcriber.get_s3_key(task['local_file_path'], self.s3_folder_prefix)
+        s3_uri = self.transcriber.upload_to_s3(task['local_file_path'], self.s3_bucket, s3_key)
+        if not s3_uri:
+            self.record_error(task, "S3上传失败")
+            return None
+        task['s3_uri'] = s3_uri
+        self.journal(task, 'uploaded', s3_uri=s3_uri)
+        return task
+
+    def submit_stage(self, task):
+        """
+        启动转录任务（使用原始行号），并登记到任务跟踪器；
+        已有缓存结果时直接交给保存阶段，作业日志中已提交的任务直接重新关联
+        """
+        resumed = 'job_name' in task
+        if not resumed:
+            transcript_data = self.transcriber.get_cached_result(task['s3_uri'])
+            if transcript_data is not None:
+                task['transcript_data'] = transcript_data
+                self.release_audio(task)
+                self.persist_queue.put(task)
+                return None
+
+        self.in_flight_slots.acquire()
+        counted = False
+        try:
+            if resumed:
+                job_name = task['job_name']
+                logger.info(f"重新关联上次运行提交的转录任务: {job_name}")
+            else:
+                job_name = f"transcribe-job-{task['csv_row_index']}-{int(time.time())}"
+                if not self.transcriber.start_transcription_job(job_name, task['s3_uri']):
+                    self.in_flight_slots.release()
+                    self.record_error(task, "转录任务启动失败")
+                    return None
+                task['job_name'] = job_name
+                self.journal(task, 'submitted', job_name=job_name)
+
+            with self.in_flight_cond:
+                self.in_flight += 1
+            counted = True
+            expected_duration = self.transcriber.estimate_audio_duration(
+                task.get('call_seconds'), task.get('local_file_path'))
+            self.transcriber.job_tracker.track(
+                job_name,
+                callback=lambda name, job, task=task: self.on_job_finished(task, job),
+                expected_duration=expected_duration,
+                check_now=resumed
+            )
+        except Exception as e:
+            # 任务没有登记到跟踪器，回调不会执行，在这里归还名额
+            self.in_flight_slots.release()
+            if counted:
+                with self.in_flight_cond:
+                    self.in_flight -= 1
+                    self.in_flight_cond.notify_all()
+            self.record_error(task, f"转录任务登记失败: {str(e)}")
+        return None
+
+    def on_job_finished(self, task, job):
+        """跟踪器回调：任务结束后交给保存阶段"""
+        try:
+            if job and job['TranscriptionJobStatus'] == 'COMPLETED':
+                logger.info(f"转录任务完成: {task['job_name']}")
+                task['job_result'] = job
+                self.journal(task, 'completed', job_name=task['job_name'])
+                self.persist_queue.put(task)
+            else:
+                self.journal(task, 'failed', job_name=task['job_name'])
+                self.record_error(task, "转录任务失败")
+        finally:
+            self.release_audio(task)
+            self.in_flight_slots.release()
+            with self.in_flight_cond:
+                self.in_flight -= 1
+                self.in_flight_cond.notify_all()
+
+    def persist_stage(self, task):
+        """下载转录结果并保存"""
+        transcript_data = task.get('transcript_data')
+        if transcript_data is None:
+            transcript_uri = task['job_result']['Transcript']['TranscriptFileUri']
+            transcript_data = self.transcriber.download_transcript(transcript_uri)
+            if not transcript_data:
+                self.record_error(task, "转录结果下载失败")
+                return None
+            self.transcriber.cache_result(task['s3_uri'], transcript_data, task['job_name'])
+        if not self.transcriber.save_transcript(transcript_data, task['json_output_file'],
+                                                task['txt_output_file'], task['mapping_info']):
+            # 保存失败时不记录persisted，下次运行重新保存
+            self.record_error(task, "转录结果保存失败")
+            return None
+        self.journal(task, 'persisted')
+        self.record_success(task)
+        return None
+
+    def stage_worker(self, name, handler, in_queue, out_queue):
+        """阶段工作线程：从输入队列取任务，处理后放入输出队列"""
+        while True:
+            task = in_queue.get()
+            if task is _STOP:
+                break
+            try:
+                result = handler(task)
+                if result is not None and out_queue is not None:
+                    out_queue.put(result)
+            except Exception as e:
+                logger.error(f"[{name}] 处理CSV行号 {task['csv_row_index']} 时出错: {str(e)}")
+                self.release_audio(task)
+                with self.stats_lock:
+                    self.error_count += 1
+
+    def run(self, rows, start_from=0, audio_column='通话录音'):
+        """
+        运行流水线
+
+        Args:
+            rows: 可迭代的 (原始行号, 行数据) 序列
+            start_from: 起始位置，仅用于日志
+            audio_column: 音频URL列名
+
+        Returns:
+            dict: 处理统计 (success/skip/error)
+        """
+        # persist队列不限长度：跟踪器线程在回调中放入任务，不能因为保存阶段积压而阻塞所有任务的轮询
+        # （运行中的任务数已由 max_in_flight 限制）
+        queues = [queue.Queue(maxsize=0 if name == 'persist' else self.queue_size) for name, _, _ in self.stages]
+        self.persist_queue = queues[-1]
+        submit_queue = queues[[name for name, _, _ in self.stages].index('submit')]
+        stage_threads = []
+
+        for i, (name, handler, worker_count) in enumerate(self.stages):
+            out_queue = queues[i + 1] if name not in ('submit', 'persist') else None
+            threads = []
+            for n in range(max(1, worker_count)):
+                thread = threading.Thread(
+                    target=self.stage_worker,
+                    args=(name, handler, queues[i], out_queue),
+                    name=f"{name}-{n}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+            stage_threads.append(threads)
+
+        logger.info("流水线已启动: " + ", ".join(
+            f"{name}={len(threads)}" for (name, _, _), threads in zip(self.stages, stage_threads)))
+
+        # 生产者：生成任务并按原有规则跳过已处理的记录
+        for idx, (original_index, row) in enumerate(rows):
+            try:
+                audio_url = row[audio_column]
+                current_position = start_from + idx + 1
+                logger.info(f"提交第 {current_position} 个文件到流水线 (CSV行号: {original_index}): {audio_url}")
+
+                json_filename, txt_filename, mapping_info = self.transcriber.generate_output_filename(row, original_index)
+                json_output_file = self.transcriber.transcripts_dir / json_filename
+                txt_output_file = self.transcriber.transcripts_dir / txt_filename
+
+                if json_output_file.exists() and txt_output_file.exists():
+                    logger.info(f"文件已存在，跳过处理: {json_filename}")
+                    with self.stats_lock:
+                        self.skip_count += 1
+                    continue
+
+                task = {
+                    'position': idx,
+                    'csv_row_index': original_index,
+                    'audio_url': audio_url,
+                    'json_output_file': json_output_file,
+                    'txt_output_file': txt_output_file,
+                    'mapping_info': mapping_info,
+                    'call_seconds': row.get('call_seconds'),
+                }
+
+                # 作业日志中已上传的记录跳过下载和上传，已提交的任务在提交阶段重新关联
+                journal = self.transcriber.job_journal
+                journal_entry = journal.get(original_index, audio_url)
+                s3_uri = journal.uploaded_uri(journal_entry, self.s3_bucket)
+                if s3_uri:
+                    task['s3_uri'] = s3_uri
+                    job_name = journal.resumable_job(journal_entry)
+                    if job_name:
+                        task['job_name'] = job_name
+                    submit_queue.put(task)
+                else:
+                    queues[0].put(task)
+            except Exception as e:
+                logger.error(f"处理CSV行号 {original_index} 时出错: {str(e)}")
+                with self.stats_lock:
+                    self.error_count += 1
+
+        # 逐个阶段关闭：上游阶段全部退出后再通知下游阶段
+        for i, threads in enumerate(stage_threads):
+            if self.stages[i][0] == 'persist':
+                # 等待跟踪器交付所有运行中的任务
+                with self.in_flight_cond:
+                    while self.in_flight > 0:
+                        self.in_flight_cond.wait()
+            for _ in threads:
+                queues[i].put(_STOP)
+            for thread in threads:
+                thread.join()
+
+        return {
+            'success': self.success_count,
+            'skip': self.skip_count,
+            'error': self.error_count
+        }
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+紧凑格式的转录结果JSON（format_version 2）
+原有格式把说话人片段、声道片段和完整结果各写一遍并缩进排版，同一份词汇数据重复三次；
+紧凑格式只保存一份原始转录结果（可选gzip或zstd压缩后base64编码），不缩进，
+转录文本、说话人片段和声道片段都是原始结果中对应部分的改名，读取时再按原有规则生成。
+load_transcript 同时支持两种格式，返回原有格式的字典
+"""
+
+import base64
+import json
+import zlib
+import logging
+
+from transcript_stream import speaker_segment
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+
+# 原始转录结果的保存方式：json为原样保存，gzip/zstd为压缩后base64编码
+RESULT_ENCODINGS = ('json', 'gzip', 'zstd')
+
+COMPACT_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def resolve_encoding(encoding):
+    """
+    检查原始结果的保存方式，zstd不可用时改用gzip
+
+    Args:
+        encoding: json、gzip或zstd
+
+    Returns:
+        str: 实际使用的保存方式
+    """
+    encoding = (encoding or 'json').lower()
+    if encoding not in RESULT_ENCODINGS:
+        logger.warning(f"未知的转录结果压缩方式 {encoding}，不压缩")
+        return 'json'
+    if encoding == 'zstd' and zstandard is None:
+        logger.warning("未安装zstandard，转录结果改用gzip压缩")
+        return 'gzip'
+    return encoding
+
+
+def build_sections(transcript_data):
+    """
+    从原始转录结果生成原有格式中的派生部分
+
+    Args:
+        transcript_data: 原始转录结果
+
+    Returns:
+        tuple: (转录文本, 说话人片段列表, 声道片段列表)
+    """
+    results_data = transcript_data['results']
+    if isinstance(results_data, list) and len(results_data) > 0:
+        results_data = results_data[0]
+    transcript_text = results_data['transcripts'][0]['transcript']
+
+    speaker_segments = []
+    if 'speaker_labels' in results_data and 'segments' in results_data['speaker_labels']:
+        for segment in results_data['speaker_labels']['segments']:
+            speaker_segments.append(speaker_segment(segment))
+
+    channel_segments = []
+    if 'channel_labels' in results_data:
+        for channel in results_data['channel_labels']['channels']:
+            channel_segments.append({
+                'channel': channel['channel_label'],
+                'items': channel['items']
+            })
+
+    return transcript_text, speaker_segments, channel_segments
+
+
+def compress_chunks(chunks, encoding):
+    """逐块压缩原始结果"""
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 输出gzip格式
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def base64_chunks(chunks):
+    """逐块base64编码（每次只编码3字节整数倍的部分，结果与一次性编码一致）"""
+    pending = b''
+    for chunk in chunks:
+        pending += chunk
+        cut = len(pending) - len(pending) % 3
+        if cut:
+            yield base64.b64encode(pending[:cut])
+            pending = pending[cut:]
+    if pending:
+        yield base64.b64encode(pending)
+
+
+def write_compact_transcript(path, mapping_info, labeled_transcript, result_chunks, encoding='json'):
+    """
+    写出紧凑格式的转录结果JSON
+
+    Args:
+        path: 输出文件路径
+        mapping_info: 映射信息
+        labeled_transcript: 带标签的转录文本
+        result_chunks: 原始转录结果JSON的字节块（UTF-8）
+        encoding: 原始结果的保存方式（json、gzip或zstd）
+    """
+    encoding = resolve_encoding(encoding)
+    header = {
+        'format_version': FORMAT_VERSION,
+        'mapping_info': mapping_info,
+        'labeled_transcript': labeled_transcript,
+        'result_encoding': encoding,
+    }
+    with open(path, 'wb') as f:
+        f.write(COMPACT_ENCODER.encode(header)[:-1].encode('utf-8'))
+        f.write(b',"result":')
+        if encoding == 'json':
+            for chunk in result_chunks:
+                f.write(chunk)
+        else:
+            f.write(b'"')
+            for chunk in base64_chunks(compress_chunks(result_chunks, encoding)):
+                f.write(chunk)
+            f.write(b'"')
+        f.write(b'}')
+
+
+def result_bytes(transcript_data):
+    """把已解析的原始结果序列化为紧凑的JSON字节"""
+    return COMPACT_ENCODER.encode(transcript_data).encode('utf-8')
+
+
+def decode_result(data):
+    """
+    读取紧凑格式中的原始转录结果
+
+    Args:
+        data: 紧凑格式的JSON内容
+
+    Returns:
+        dict: 原始转录结果
+    """
+    encoding = data.get('result_encoding', 'json')
+    result = data['result']
+    if encoding == 'json':
+        return result
+    raw = base64.b64decode(result)
+    if encoding == 'gzip':
+        return json.loads(zlib.decompress(raw, 47))  # wbits=47 自动识别gzip头
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise ValueError("转录结果使用zstd压缩，需要安装zstandard")
+        return json.loads(zstandard.ZstdDecompressor().decompressobj().decompress(raw))
+    raise ValueError(f"未知的转录结果压缩方式: {encoding}")
+
+
+def expand_transcript(data):
+    """
+    把紧凑格式的内容展开为原有格式的字典
+
+    Args:
+        data: JSON文件内容
+
+    Returns:
+        dict: mapping_info、transcript、labeled_transcript、speaker_segments、channel_segments、full_result
+    """
+    version = data.get('format_version', 1)
+    if version == 1:
+        return data
+    if version != FORMAT_VERSION:
+        raise ValueError(f"不支持的转录文件格式版本: {version}")
+
+    full_result = decode_result(data)
+    transcript_text, speaker_segments, channel_segments = build_sections(full_result)
+    return {
+        'mapping_info': data['mapping_info'],
+        'transcript': transcript_text,
+        'labeled_transcript': data['labeled_transcript'],
+        'speaker_segments': speaker_segments,
+        'channel_segments': channel_segments,
+        'full_result': full_result
+    }
+
+
+def load_transcript(json_file):
+    """
+    读取转录结果JSON文件（原有格式或紧凑格式）
+
+    Args:
+        json_file: JSON文件路径
+
+    Returns:
+        dict: 原有格式的转录结果
+    """
+    with open(json_file, 'r', encoding='utf-8') as f:
+        return expand_transcript(json.load(f))
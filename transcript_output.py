@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+转录结果输出到自有S3存储桶
+转录任务把结果写入 S3_FOLDER_PREFIX 下以音频内容哈希和任务设置哈希命名的对象，
+结果通过共享的S3客户端读取；重新运行时可以批量列出已有结果并行下载，不需要重新轮询或提交任务
+"""
+
+import json
+import os
+import logging
+from pathlib import Path
+from urllib.parse import urlparse, unquote
+
+from transcript_stream import SpooledTranscript, SPOOL_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def parse_s3_url(url):
+    """
+    解析S3对象地址
+
+    支持 s3://bucket/key、https://s3.<region>.amazonaws.com/bucket/key（转录结果使用的路径风格）
+    和 https://bucket.s3.<region>.amazonaws.com/key
+
+    Returns:
+        tuple: (bucket, key)，不是S3地址时返回None
+    """
+    parsed = urlparse(url)
+    path = unquote(parsed.path.lstrip('/'))
+    if parsed.scheme == 's3':
+        return (parsed.netloc, path) if parsed.netloc and path else None
+    host = parsed.netloc.split(':')[0]
+    if not host.endswith('.amazonaws.com'):
+        return None
+    if host.startswith('s3.') or host.startswith('s3-'):
+        # 路径风格
+        if '/' not in path:
+            return None
+        bucket, key = path.split('/', 1)
+        return bucket, key
+    if '.s3.' in host or '.s3-' in host:
+        # 虚拟主机风格
+        return host.split('.s3', 1)[0], path
+    return None
+
+
+class TranscriptOutputStore:
+    def __init__(self, s3_client, bucket, s3_folder_prefix='', settings_tag='', rate_limiter=None, workers=None):
+        """
+        初始化转录结果存储
+
+        Args:
+            s3_client: boto3 s3客户端
+            bucket: 输出存储桶
+            s3_folder_prefix: S3文件夹前缀，结果保存在 <前缀>transcripts/ 下
+            settings_tag: 语言和任务设置的哈希，加入结果对象键，修改设置后不会取回旧设置的结果
+            rate_limiter: AWSRateLimiter实例，为None时直接调用API
+            workers: 批量下载结果的线程数，默认读取 TRANSCRIPT_FETCH_WORKERS
+        """
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.settings_tag = settings_tag
+        self.prefix = f"{s3_folder_prefix}transcripts/" if s3_folder_prefix else "transcribe-output/"
+        self.rate_limiter = rate_limiter
+        self.workers = workers or int(os.getenv('TRANSCRIPT_FETCH_WORKERS', '8'))
+        # 对象名（音频哈希_设置哈希） -> 结果对象键
+        self.index = {}
+
+    def call(self, api_name, func, **kwargs):
+        """调用S3 API，配置了限流器时经过限流器"""
+        if self.rate_limiter is not None:
+            return self.rate_limiter.call(api_name, func, **kwargs)
+        return func(**kwargs)
+
+    def result_name(self, digest):
+        """返回音频哈希在当前设置下的结果对象名（不含前缀和扩展名）"""
+        return f"{digest}_{self.settings_tag}" if self.settings_tag else digest
+
+    def output_key(self, audio_s3_uri):
+        """
+        根据音频对象地址生成结果对象键（音频对象以内容哈希命名，结果以内容哈希和设置哈希命名）
+
+        Args:
+            audio_s3_uri: 音频的S3 URI
+
+        Returns:
+            str: 结果对象键
+        """
+        return f"{self.prefix}{self.result_name(Path(audio_s3_uri).stem)}.json"
+
+    def owns(self, transcript_uri):
+        """
+        判断转录结果URI是否在本存储中
+
+        Returns:
+            str: 结果对象键，不在本存储中时返回None
+        """
+        parsed = parse_s3_url(transcript_uri)
+        if parsed and parsed[0] == self.bucket:
+            return parsed[1]
+        return None
+
+    def fetch(self, key):
+        """
+        读取一个结果对象
+
+        Returns:
+            dict: 转录结果JSON
+        """
+        response = self.call('get_object', self.s3_client.get_object, Bucket=self.bucket, Key=key)
+        with response['Body'] as body:
+            return json.load(body)
+
+    def fetch_to_file(self, key, spool_dir):
+        """
+        把一个结果对象原样写入临时文件（不解析，用于流式解析）
+
+        Returns:
+            SpooledTranscript: 临时文件
+        """
+        response = self.call('get_object', self.s3_client.get_object, Bucket=self.bucket, Key=key)
+        with response['Body'] as body:
+            return SpooledTranscript.from_chunks(body.iter_chunks(SPOOL_CHUNK_SIZE), spool_dir)
+
+    def load_index(self):
+        """
+        分页列出已有的结果对象
+
+        Returns:
+            int: 结果数
+        """
+        index = {}
+        kwargs = {'Bucket': self.bucket, 'Prefix': self.prefix}
+        while True:
+            response = self.call('list_objects_v2', self.s3_client.list_objects_v2, **kwargs)
+            for item in response.get('Contents', []):
+                if item['Key'].endswith('.json'):
+                    index[Path(item['Key']).stem] = item['Key']
+            if not response.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+        self.index = index
+        return len(index)
+
+    def find(self, digest):
+        """返回音频哈希在当前设置下已有的结果对象键，没有时返回None"""
+        return self.index.get(self.result_name(digest)) if digest else None
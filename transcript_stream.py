@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+转录结果JSON的流式解析
+转录结果先原样写入临时文件（不解析），再用增量解析器（ijson）按事件读取
+results.transcripts、speaker_labels.segments 和 channel_labels，每次只构建一个片段或一个词汇；
+带标签的文本、TXT和JSON输出都由事件流生成，输出与一次性解析后 json.dump 的结果逐字节一致，
+内存占用与转录结果的大小无关（只保留输出文本和每个词汇的开始时间）。
+没有安装ijson时不使用流式解析，仍按原有方式一次性解析
+"""
+
+import json
+import os
+import tempfile
+import logging
+from json.encoder import encode_basestring
+from pathlib import Path
+
+from labeling_engine import fallback_lines, merge_channel_lines, pronunciation_item, segment_line
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+# 与 json.dump(indent=2) 一致的缩进
+INDENT = '  '
+
+# 事件前缀
+RESULTS = 'results'
+TRANSCRIPTS = 'results.transcripts'
+TRANSCRIPT_ITEM = 'results.transcripts.item'
+SPEAKER_LABELS = 'results.speaker_labels'
+SEGMENTS = 'results.speaker_labels.segments'
+SEGMENT_ITEM = 'results.speaker_labels.segments.item'
+CHANNEL_LABELS = 'results.channel_labels'
+CHANNELS = 'results.channel_labels.channels'
+CHANNEL = 'results.channel_labels.channels.item'
+CHANNEL_LABEL = 'results.channel_labels.channels.item.channel_label'
+CHANNEL_ITEM = 'results.channel_labels.channels.item.items.item'
+
+# 需要记录类型和键的容器
+TRACKED = (RESULTS, TRANSCRIPTS, SPEAKER_LABELS, SEGMENTS, CHANNEL_LABELS, CHANNELS, CHANNEL)
+
+CONTAINER_END_EVENTS = ('map_key', 'end_map', 'end_array')
+
+# 复用同一个编码器，避免每次序列化都创建
+ENCODER = json.JSONEncoder(ensure_ascii=False, indent=2)
+CONSTANTS = {None: 'null', True: 'true', False: 'false'}
+
+
+def stream_parse_available():
+    """是否安装了ijson"""
+    return ijson is not None
+
+
+class SpooledTranscript:
+    def __init__(self, path):
+        """
+        写入临时文件、尚未解析的转录结果JSON
+
+        Args:
+            path: 临时文件路径
+        """
+        self.path = Path(path)
+
+    @classmethod
+    def from_chunks(cls, chunks, spool_dir):
+        """
+        把响应体逐块写入临时文件
+
+        Args:
+            chunks: 字节块迭代器（HTTP响应或S3对象）
+            spool_dir: 临时文件目录
+
+        Returns:
+            SpooledTranscript: 临时文件
+        """
+        spool_dir = Path(spool_dir)
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.json', dir=str(spool_dir))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+        except Exception:
+            os.unlink(path)
+            raise
+        return cls(path)
+
+    def events(self):
+        """逐个返回解析事件 (前缀, 事件, 值)"""
+        with open(self.path, 'rb') as f:
+            yield from ijson.parse(f, use_float=True)
+
+    def chunks(self):
+        """逐块返回原始JSON字节（不解析）"""
+        with open(self.path, 'rb') as f:
+            yield from iter(lambda: f.read(SPOOL_CHUNK_SIZE), b'')
+
+    def load(self):
+        """一次性解析为字典（流式处理不适用时使用）"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def discard(self):
+        """删除临时文件"""
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def iter_values(events, wanted):
+    """
+    从事件流中构建指定前缀处的值，其他事件原样返回
+
+    Args:
+        events: 解析事件迭代器
+        wanted: 需要构建成对象的前缀集合
+
+    Yields:
+        tuple: (前缀, 事件, 值)，构建好的对象以事件 'value' 返回
+    """
+    builder = None
+    depth = 0
+    building = None
+    for prefix, event, value in events:
+        if builder is not None:
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+                if depth == 0:
+                    yield building, 'value', builder.value
+                    builder = None
+            continue
+        if prefix in wanted and event not in CONTAINER_END_EVENTS:
+            if event in ('start_map', 'start_array'):
+                builder = ObjectBuilder()
+                builder.event(event, value)
+                depth = 1
+                building = prefix
+            else:
+                yield prefix, 'value', value
+            continue
+        yield prefix, event, value
+
+
+def dumps(value, level):
+    """序列化为JSON，缩进与嵌套在第level层时的 json.dump(indent=2) 一致"""
+    return ENCODER.encode(value).replace('\n', '\n' + INDENT * level)
+
+
+def encode_scalar(value):
+    """序列化标量（字符串、数字、布尔值、null），结果与 json.dumps 一致"""
+    if isinstance(value, str):
+        return encode_basestring(value)
+    if value is None or value is True or value is False:
+        return CONSTANTS[value]
+    if isinstance(value, float) and value == value and value not in (float('inf'), float('-inf')):
+        return float.__repr__(value)
+    return ENCODER.encode(value)
+
+
+def write_events(events, f, level=0):
+    """
+    把事件流写回为JSON，格式与 json.dump(ensure_ascii=False, indent=2) 一致
+
+    Args:
+        events: 解析事件迭代器
+        f: 文本文件
+        level: 起始缩进层级
+    """
+    # 每个打开的容器: [开括号, 是否还没有元素]
+    stack = []
+    for _, event, value in events:
+        if event == 'map_key':
+            top = stack[-1]
+            f.write((top[0] if top[1] else ',') + '\n' + INDENT * (level + len(stack)) +
+                    encode_basestring(value) + ': ')
+            top[1] = False
+            continue
+        if event in ('end_map', 'end_array'):
+            opener, empty = stack.pop()
+            closer = '}' if opener == '{' else ']'
+            if empty:
+                f.write(opener + closer)
+            else:
+                f.write('\n' + INDENT * (level + len(stack)) + closer)
+            continue
+        if stack and stack[-1][0] == '[':
+            top = stack[-1]
+            f.write((top[0] if top[1] else ',') + '\n' + INDENT * (level + len(stack)))
+            top[1] = False
+        if event == 'start_map':
+            stack.append(['{', True])
+        elif event == 'start_array':
+            stack.append(['[', True])
+        else:
+            f.write(encode_scalar(value))
+
+
+class TranscriptSummary:
+    def __init__(self):
+        """一次扫描得到的输出所需信息（不包含完整的转录结果）"""
+        # 容器前缀 -> 第一个事件（start_map、start_array或标量类型）
+        self.types = {}
+        # 容器前缀 -> 出现过的键
+        self.keys = {}
+        self.transcripts = None
+        # 每个说话人片段的带标签文本行（没有文本时为None）和 format_segment 的结果
+        self.segment_lines = []
+        self.segment_outputs = []
+        # 每个声道: {'label': 声道标签, 'has_items': 是否有items, 'items': [(开始时间, 内容)]}
+        self.channels = []
+
+    def has(self, prefix, key):
+        """容器中是否有某个键"""
+        return key in self.keys.get(prefix, ())
+
+    def is_map(self, prefix):
+        return self.types.get(prefix) == 'start_map'
+
+    @property
+    def transcript_text(self):
+        """原始完整转录文本"""
+        return self.transcripts[0]['transcript']
+
+    @property
+    def has_speaker_segments(self):
+        """是否有说话人片段（对应 save_transcript 中的 speaker_segments）"""
+        return self.has(RESULTS, 'speaker_labels') and self.has(SPEAKER_LABELS, 'segments')
+
+    def labeled_lines(self, speaker_name, channel_name):
+        """与 labeling_engine.build_labeled_transcript 相同的规则生成带标签的文本行"""
+        labeled_lines = []
+        if self.has(RESULTS, 'speaker_labels'):
+            if self.is_map(SPEAKER_LABELS) and self.has(SPEAKER_LABELS, 'segments'):
+                labeled_lines = [line for line in self.segment_lines if line is not None]
+        elif self.has(RESULTS, 'channel_labels'):
+            if self.has(CHANNEL_LABELS, 'channels'):
+                try:
+                    labeled_lines = list(merge_channel_lines(self.named_streams(channel_name)))
+                except ValueError:
+                    labeled_lines = list(merge_channel_lines(self.named_streams(channel_name), ordered=False))
+
+        if not labeled_lines:
+            results_data = {'transcripts': self.transcripts} if self.transcripts is not None else {}
+            labeled_lines = fallback_lines(results_data, speaker_name)
+        return labeled_lines
+
+    def named_streams(self, channel_name):
+        streams = []
+        for channel in self.channels:
+            label = channel.get('label', 'unknown')
+            streams.append((label, channel_name(label), channel['items']))
+        return streams
+
+
+def summarize(source, speaker_name, format_segment):
+    """
+    扫描一遍转录结果，收集带标签文本和TXT输出需要的信息
+
+    Args:
+        source: SpooledTranscript
+        speaker_name: 说话人标签 -> 显示名称 的函数
+        format_segment: 说话人片段（save_transcript 中的格式）-> TXT行 的函数
+
+    Returns:
+        TranscriptSummary: 扫描结果；结构不是预期的形式时抛出 ValueError
+    """
+    summary = TranscriptSummary()
+    wanted = {TRANSCRIPT_ITEM, SEGMENT_ITEM, CHANNEL_LABEL, CHANNEL_ITEM}
+    for prefix, event, value in iter_values(source.events(), wanted):
+        if event == 'value':
+            if prefix == TRANSCRIPT_ITEM:
+                summary.transcripts.append(value)
+            elif prefix == SEGMENT_ITEM:
+                summary.segment_lines.append(segment_line(value, speaker_name))
+                summary.segment_outputs.append(format_segment(speaker_segment(value)))
+            elif prefix == CHANNEL_LABEL:
+                summary.channels[-1]['label'] = value
+            elif prefix == CHANNEL_ITEM:
+                entry = pronunciation_item(value)
+                if entry is not None:
+                    summary.channels[-1]['items'].append(entry)
+            continue
+        if prefix not in TRACKED:
+            continue
+        if event == 'map_key':
+            summary.keys.setdefault(prefix, set()).add(value)
+            if prefix == CHANNEL and value == 'items':
+                summary.channels[-1]['has_items'] = True
+        elif event not in CONTAINER_END_EVENTS:
+            if prefix in summary.types and prefix != CHANNEL:
+                raise ValueError(f"重复的键: {prefix}")
+            summary.types[prefix] = event
+            if prefix == TRANSCRIPTS and event == 'start_array':
+                summary.transcripts = []
+            elif prefix == CHANNEL:
+                if event != 'start_map':
+                    raise ValueError("声道不是对象")
+                summary.channels.append({'has_items': False, 'items': []})
+
+    # 只处理常见的结构，其他情况由调用方改为一次性解析
+    if not summary.is_map(RESULTS):
+        raise ValueError("results不是对象")
+    if summary.has(RESULTS, 'transcripts') and summary.transcripts is None:
+        raise ValueError("transcripts不是列表")
+    if summary.has(RESULTS, 'speaker_labels') and summary.types.get(SPEAKER_LABELS) not in ('start_map', 'start_array'):
+        raise ValueError("speaker_labels不是对象或列表")
+    if summary.has(SPEAKER_LABELS, 'segments') and summary.types.get(SEGMENTS) != 'start_array':
+        raise ValueError("segments不是列表")
+    if summary.has(RESULTS, 'channel_labels') and not (
+            summary.is_map(CHANNEL_LABELS) and summary.types.get(CHANNELS) == 'start_array'):
+        raise ValueError("channel_labels结构不是预期的形式")
+    if summary.has(RESULTS, 'channel_labels') and not all(
+            'label' in channel and channel['has_items'] for channel in summary.channels):
+        raise ValueError("声道缺少channel_label或items")
+    return summary
+
+
+def speaker_segment(segment):
+    """说话人片段在输出中的格式"""
+    return {
+        'speaker': segment['speaker_label'],
+        'start_time': segment['start_time'],
+        'end_time': segment['end_time'],
+        'items': segment.get('items', [])
+    }
+
+
+def write_speaker_segments(source, f, level):
+    """逐个写出说话人片段列表"""
+    first = True
+    for prefix, event, value in iter_values(source.events(), {SEGMENT_ITEM}):
+        if event == 'value' and prefix == SEGMENT_ITEM:
+            f.write(('[' if first else ',') + '\n' + INDENT * (level + 1) + dumps(speaker_segment(value), level + 1))
+            first = False
+    f.write('[]' if first else '\n' + INDENT * level + ']')
+
+
+def write_channel_segments(source, summary, f, level):
+    """逐个写出声道列表，每个声道的词汇边读边写"""
+    channel_index = -1
+    first_channel = True
+    first_item = True
+    item_level = level + 3
+    for prefix, event, value in iter_values(source.events(), {CHANNEL_ITEM}):
+        if prefix == CHANNEL and event == 'start_map':
+            channel_index += 1
+            label = summary.channels[channel_index]['label']
+            f.write(('[' if first_channel else ',') + '\n' + INDENT * (level + 1) + '{\n' +
+                    INDENT * (level + 2) + '"channel": ' + dumps(label, level + 2) + ',\n' +
+                    INDENT * (level + 2) + '"items": ')
+            first_channel = False
+            first_item = True
+        elif prefix == CHANNEL and event == 'end_map':
+            f.write(('[]' if first_item else '\n' + INDENT * (level + 2) + ']') + '\n' + INDENT * (level + 1) + '}')
+        elif prefix == CHANNEL_ITEM and event == 'value':
+            f.write(('[' if first_item else ',') + '\n' + INDENT * item_level + dumps(value, item_level))
+            first_item = False
+    f.write('[]' if first_channel else '\n' + INDENT * level + ']')
+
+
+def write_transcript_json(source, summary, path, mapping_info, labeled_transcript):
+    """
+    写出JSON输出文件，与 json.dump(result, f, ensure_ascii=False, indent=2) 的结果一致
+
+    Args:
+        source: SpooledTranscript
+        summary: summarize 的结果
+        path: 输出文件路径
+        mapping_info: 映射信息
+        labeled_transcript: 带标签的转录文本
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n')
+        f.write(INDENT + '"mapping_info": ' + dumps(mapping_info, 1) + ',\n')
+        f.write(INDENT + '"transcript": ' + dumps(summary.transcript_text, 1) + ',\n')
+        f.write(INDENT + '"labeled_transcript": ' + dumps(labeled_transcript, 1) + ',\n')
+        f.write(INDENT + '"speaker_segments": ')
+        if summary.has_speaker_segments:
+            write_speaker_segments(source, f, 1)
+        else:
+            f.write('[]')
+        f.write(',\n' + INDENT + '"channel_segments": ')
+        if summary.has(RESULTS, 'channel_labels'):
+            write_channel_segments(source, summary, f, 1)
+        else:
+            f.write('[]')
+        f.write(',\n' + INDENT + '"full_result": ')
+        write_events(source.events(), f, 1)
+        f.write('\n}')